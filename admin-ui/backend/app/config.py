@@ -52,21 +52,25 @@ class ConfManager:
             "document_processing": {
                 "service_name": "Extraction Service",
                 "service_url": "document/service/health",
+                "auth_invalidate_url": "document/service/auth/invalidate",
                 "base_path": "/admin/document/"
             },
             "model_invocation": {
                 "service_name": "Model Invocation Service",
                 "service_url": "model/service/health",
+                "auth_invalidate_url": "model/service/auth/invalidate",
                 "base_path": "/admin/model/"
             },
             "vectorization": {
                 "service_name": "Vectorization Service",
                 "service_url": "vector/service/health",
+                "auth_invalidate_url": "vector/service/auth/invalidate",
                 "base_path": "/admin/vector/"
             },
             "prompt_management": {
                 "service_name": "Prompt Management Service",
                 "service_url": "prompt/service/health",
+                "auth_invalidate_url": "prompt/service/auth/invalidate",
                 "base_path": "/admin/prompt/"
             }
         }
@@ -1,10 +1,13 @@
 import json
-from fastapi import FastAPI, Request, Response, HTTPException, Depends
+import asyncio
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.responses import JSONResponse
 from datetime import datetime
 import boto3
+import httpx
 import requests
 from config import conf
 from dependencies import verify_token, get_cognito_token
@@ -91,6 +94,29 @@ def add_default_app_client_if_not_exists(platform_app_client):
 
 
 
+async def invalidate_app_client_cache(app_id):
+    # Services cache client_id -> app_id lookups in process, so drop the entry
+    # for this app after its status changes instead of waiting for the TTL.
+    # Runs as a background task, after the response is sent, and calls the services concurrently.
+    try:
+        token = await run_in_threadpool(cognito_token_manager.get_token)
+    except Exception as e:
+        logger.error(f"Failed to get token for auth cache invalidation: {e}")
+        return
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def invalidate(client, details):
+        try:
+            response = await client.post(f'{conf.PLATFORM_BASE_URL}{details["auth_invalidate_url"]}', json={"app_id": app_id}, headers=headers)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Failed to invalidate auth cache for {details['service_name']}: {e}")
+
+    async with httpx.AsyncClient(timeout=10) as client:
+        await asyncio.gather(*(invalidate(client, details) for details in conf.PLARFORM_SERVICES.values()
+                               if details.get("auth_invalidate_url")))
+
+
 def fetch_openapi_spec():
     logger.info("Fetching OpenAPI spec")
     try:
@@ -259,7 +285,7 @@ async def create_app_client(request: Request, payload: dict = Depends(verify_tok
 
 
 @app.post("/admin/platform/deactivate_app_client")
-async def deactivate_app_client(request: Request, payload: dict = Depends(verify_token)):
+async def deactivate_app_client(request: Request, background_tasks: BackgroundTasks, payload: dict = Depends(verify_token)):
     data = await request.json()
     app_id = data.get("app_id")
     session = boto3.Session(region_name=conf.AWS_REGION)
@@ -278,13 +304,15 @@ async def deactivate_app_client(request: Request, payload: dict = Depends(verify
             ConditionExpression="attribute_exists(app_id)"
         )
 
+        background_tasks.add_task(invalidate_app_client_cache, app_id)
+
         return {"message": "Client deactivated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
 
 @app.post("/admin/platform/activate_app_client")
-async def activate_app_client(request: Request, payload: dict = Depends(verify_token)):
+async def activate_app_client(request: Request, background_tasks: BackgroundTasks, payload: dict = Depends(verify_token)):
     data = await request.json()
     app_id = data.get("app_id")
     session = boto3.Session(region_name=conf.AWS_REGION)
@@ -303,6 +331,8 @@ async def activate_app_client(request: Request, payload: dict = Depends(verify_t
             ConditionExpression="attribute_exists(app_id)"
         )
 
+        background_tasks.add_task(invalidate_app_client_cache, app_id)
+
         return {"message": "Client activated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
@@ -98,12 +98,19 @@ async def get_invocations(request: MetricsRequest):
                     'total_count': 0,
                     'total_input_tokens': 0,
                     'total_output_tokens': 0,
+                    'saved_input_tokens': 0,
+                    'saved_output_tokens': 0,
                     'status_counts': {}
                 }
 
             grouped_items[model_id]['total_count'] += 1
-            grouped_items[model_id]['total_input_tokens'] += input_tokens
-            grouped_items[model_id]['total_output_tokens'] += output_tokens
+            # Cache hits carry the tokens of the cached response, which were not consumed again
+            if status == 'CACHE_HIT':
+                grouped_items[model_id]['saved_input_tokens'] += input_tokens
+                grouped_items[model_id]['saved_output_tokens'] += output_tokens
+            else:
+                grouped_items[model_id]['total_input_tokens'] += input_tokens
+                grouped_items[model_id]['total_output_tokens'] += output_tokens
             grouped_items[model_id]['model_name'] = invocation.model_name
 
             if status not in grouped_items[model_id]['status_counts']:
@@ -12,6 +12,8 @@ import { Aws } from "aws-cdk-lib/core";
 import * as dynamodb from "aws-cdk-lib/aws-dynamodb";
 import * as crypto from "crypto";
 import * as sqs from "aws-cdk-lib/aws-sqs";
+import * as sns from "aws-cdk-lib/aws-sns";
+import * as sns_subscriptions from "aws-cdk-lib/aws-sns-subscriptions";
 import * as logs from 'aws-cdk-lib/aws-logs';
 import * as kms from 'aws-cdk-lib/aws-kms';
 import { CfnOutput, Duration, RemovalPolicy } from 'aws-cdk-lib';
@@ -67,6 +69,7 @@ export class GenAIFoundationsStack extends cdk.Stack {
             new iam.ServicePrincipal('s3.amazonaws.com'),
             new iam.ServicePrincipal('apigateway.amazonaws.com'),
             new iam.ServicePrincipal('sqs.amazonaws.com'),
+            new iam.ServicePrincipal('sns.amazonaws.com'),
             new iam.ServicePrincipal('ecs-tasks.amazonaws.com')
           ],
           resources: ["*"],
@@ -491,6 +494,7 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
           effect: iam.Effect.ALLOW,
           actions: [
             "dynamodb:PutItem",
+            "dynamodb:BatchWriteItem",
             "dynamodb:DeleteItem",
             "dynamodb:GetItem",
             "dynamodb:Scan",
@@ -538,6 +542,7 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
             "aoss:CreateAccessPolicy",
             "aoss:CreateSecurityPolicy",
             "aoss:ListCollections",
+            "aoss:BatchGetCollection",
             "aoss:TagResource",
             "aoss:CreateCollection"
         ],
@@ -581,7 +586,8 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
             "sqs:DeleteMessage",
             "sqs:ChangeMessageVisibility",
             "sqs:ReceiveMessage",
-            "sqs:SendMessage"
+            "sqs:SendMessage",
+            "sqs:GetQueueAttributes"
         ],
           resources: ["arn:aws:sqs:*:"+Aws.ACCOUNT_ID+":foundations*"],
         }),
@@ -589,7 +595,8 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
           effect: iam.Effect.ALLOW,
           actions: [
             "textract:StartDocumentAnalysis",
-            "textract:GetDocumentAnalysis"
+            "textract:GetDocumentAnalysis",
+            "textract:AnalyzeDocument"
         ],
           resources: ["*"],
         }),
@@ -608,7 +615,13 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
       "AppClientsTable",
       {
         tableName: "foundations_appclients_"+uniqueCode,
-        partitionKey: { name: "app_id", type: dynamodb.AttributeType.STRING }
+        partitionKey: { name: "app_id", type: dynamodb.AttributeType.STRING },
+        globalSecondaryIndexes: [
+          {
+            indexName: "client_id_index",
+            partitionKey: { name: "client_id", type: dynamodb.AttributeType.STRING },
+          }
+        ],
       }
     );
 
@@ -703,7 +716,8 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
         CLIENTS_TABLE: app_clients_table.tableName,
         COGNITO_USER_POOL_ID: cognitouserpool.userPoolId,
         REDIS_URL: serverless_redis.attrEndpointAddress,
-        REDIS_PORT: "6379"
+        REDIS_PORT: "6379",
+        INVOCATION_LOG_SPILL_DIR: "/tmp/invocation_logs"
       },
       logging: ecs.LogDrivers.awsLogs({ streamPrefix: "model_invocation",logGroup:logGroup1 }),
     });
@@ -906,6 +920,26 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
 
     });
 
+    // Textract publishes job completions to this topic, which feeds a queue the extraction service consumes
+    const textract_completion_topic = new sns.Topic(this, "FoundationsTextractCompletions"+uniqueCode, {
+      topicName: "foundations_textract_completions_"+uniqueCode,
+    });
+
+    const textract_completion_queue = new sqs.Queue(this, "FoundationsTextractCompletionQueue"+uniqueCode, {
+      queueName: "foundations_textract_completions_"+uniqueCode,
+      visibilityTimeout: cdk.Duration.seconds(600),
+      encryption: sqs.QueueEncryption.KMS,
+      encryptionMasterKey: kmsKey
+    });
+
+    textract_completion_topic.addSubscription(new sns_subscriptions.SqsSubscription(textract_completion_queue, { rawMessageDelivery: true }));
+
+    const textract_sns_role = new iam.Role(this, "FoundationsTextractSnsRole"+uniqueCode, {
+      assumedBy: new iam.ServicePrincipal("textract.amazonaws.com"),
+    });
+    textract_completion_topic.grantPublish(textract_sns_role);
+    textract_sns_role.grantPassRole(taskExecutionRole);
+
     const chunking_fifo_queue = new sqs.Queue(this, "FoundationsChunkingFifo"+uniqueCode, {
       queueName: "foundations_chunking_fifo_"+uniqueCode+".fifo",
       fifo: true,
@@ -1085,7 +1119,12 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
         QUEUE_URL: extraction_fifo_queue.queueUrl,
         SOURCE_S3_BUCKET: extraction_source_bucket.bucketName,
         MAX_CONCURRENT_TASKS: '10',
-        VISIBILITY_TIMEOUT: '600'
+        VISIBILITY_TIMEOUT: '600',
+        TEXTRACT_SNS_TOPIC_ARN: textract_completion_topic.topicArn,
+        TEXTRACT_SNS_ROLE_ARN: textract_sns_role.roleArn,
+        TEXTRACT_COMPLETION_QUEUE_URL: textract_completion_queue.queueUrl,
+        // Linearization processes per task; raise along with the task's cpu and memory
+        EXTRACTION_LINEARIZE_WORKERS: '1'
       },
       logging: ecs.LogDrivers.awsLogs({ streamPrefix: "extraction", logGroup: logGroup4 }),
     });
@@ -1215,7 +1254,10 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
         CHUNK_JOBS_TABLE : chunking_jobs_table.tableName,
         CHUNK_JOB_FILES_TABLE : chunking_job_files_table.tableName,
         CLIENTS_TABLE: app_clients_table.tableName,
-        AOSS_VPCE_ID: aossEP.attrId
+        AOSS_VPCE_ID: aossEP.attrId,
+        REDIS_URL: serverless_redis.attrEndpointAddress,
+        REDIS_PORT: "6379",
+        LOCAL_VECTOR_STORE_BUCKET: extraction_results_bucket.bucketName
       },
       logging: ecs.LogDrivers.awsLogs({ streamPrefix: "vectorization", logGroup: logGroup5 }),
     });
@@ -1287,7 +1329,8 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
         VECTORIZATION_QUEUE_URL : vectorizarion_fifo_queue.queueUrl,
         VECTORIZE_JOBS_TABLE : vector_jobs_table.tableName,
         VECTORIZE_JOB_FILES_TABLE : vector_jobs_files_table.tableName,
-        RESULTS_S3_BUCKET : extraction_results_bucket.bucketName
+        RESULTS_S3_BUCKET : extraction_results_bucket.bucketName,
+        LOCAL_VECTOR_STORE_BUCKET : extraction_results_bucket.bucketName
       },
       logging: ecs.LogDrivers.awsLogs({ streamPrefix: "vector_jobs_process", logGroup: logGroup6 }),
     });
@@ -1583,6 +1626,11 @@ new apigwrestapi.CfnAccount(this, 'ApiGatewayAccount', {
         },
       });
 
+      // Only the admin backend's client may invalidate the services' auth caches
+      for (const service_container of [container, document_processing_container, vectorization_container, prompt_template_container]) {
+        service_container.addEnvironment("PLATFORM_APP_CLIENT_ID", cognitoAdminBackendClient.userPoolClientId);
+      }
+
     
     // New API Gateway Route for accessing the Admin Backend. This has no authorizer, because user authentication is done via the Admin UI
     const adminEndpoint = restApi.root.addResource("admin", {});
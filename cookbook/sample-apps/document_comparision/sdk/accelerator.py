@@ -74,6 +74,29 @@ class BaseService:
             logging.error(f"An error occurred: {err}")
             raise
 
+    def _stream(self, method, endpoint, **kwargs):
+        """Yields (event, data) pairs from a server-sent events endpoint."""
+        self._update_token()
+        url = f"{self.base_url}{endpoint}"
+        headers = dict(self.headers, Accept='text/event-stream')
+        try:
+            with requests.request(method, url, headers=headers, stream=True, **kwargs, timeout=60) as response:
+                response.raise_for_status()
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        event = None
+                    elif line.startswith('event:'):
+                        event = line[len('event:'):].strip()
+                    elif line.startswith('data:'):
+                        yield event, json.loads(line[len('data:'):].strip())
+        except requests.exceptions.HTTPError as http_err:
+            logging.error(f"HTTP error occurred: {http_err}")
+            raise
+        except Exception as err:
+            logging.error(f"An error occurred: {err}")
+            raise
+
 class HealthService(BaseService):
     def check_health(self, service):
         return self._request("GET", f"/{service}/service/health")
@@ -90,6 +113,18 @@ class ModelService(BaseService):
         data.update(kwargs)
         return self._request("POST", "/model/invoke", json=data)
 
+    def invoke_model_stream(self, model_name, prompt, **kwargs):
+        """Yields chunks of generated text as they arrive. The final chunk carries the token usage."""
+        data = {
+            "model_name": model_name,
+            "prompt": prompt,
+        }
+        data.update(kwargs)
+        for event, payload in self._stream("POST", "/model/invoke_stream", json=data):
+            if event == "error":
+                raise Exception(payload.get("detail", "Error invoking model"))
+            yield payload
+
     def invoke_model_with_raw_input(self, model_id, raw_input):
         data = {
             "model_id": model_id,
@@ -104,6 +139,15 @@ class ModelService(BaseService):
         }
         return self._request("POST", "/model/embed", json=data)
 
+    def invoke_embed_batch(self, model_name, input_texts, input_type=None):
+        data = {
+            "model_name": model_name,
+            "input_texts": input_texts
+        }
+        if input_type:
+            data["input_type"] = input_type
+        return self._request("POST", "/model/embed_batch", json=data)
+
 class DocumentService(BaseService):
     ALLOWED_FILE_TYPES = {'pdf', 'jpg', 'jpeg', 'png', 'tiff', 'txt', 'md', 'html'}
 
@@ -220,28 +264,33 @@ class VectorService(BaseService):
         }
         return self._request("POST", "/vector/store/index/status", json=data)
 
-    def create_vector_index(self, store_id, index_name):
+    def create_vector_index(self, store_id, index_name, **kwargs):
+        """Optional kwargs: embedding_model, dimension, space_type, engine, m, ef_construction, ef_search, quantization."""
         data = {
             "store_id": store_id,
             "index_name": index_name
         }
+        data.update(kwargs)
         return self._request("POST", "/vector/store/index/create", json=data)
 
-    def vectorize(self, chunking_job_id, index_id):
+    def vectorize(self, chunking_job_id, index_id, mode="full"):
         data = {
             "chunking_job_id": chunking_job_id,
-            "index_id": index_id
+            "index_id": index_id,
+            "mode": mode
         }
         return self._request("POST", "/vector/store/vectorize", json=data)
 
     def get_vectorize_job_status(self, vectorize_job_id):
         return self._request("GET", f"/vector/job/status/{vectorize_job_id}")
 
-    def semantic_search(self, query, index_id):
+    def semantic_search(self, query, index_id, **kwargs):
+        """Optional kwargs: k, num_candidates, ef_search, filters, min_score, fields, search_mode, fusion, vector_weight, rank_constant."""
         data = {
             "query": query,
             "index_id": index_id
         }
+        data.update(kwargs)
         return self._request("POST", "/vector/search", json=data)
 
 class PromptService(BaseService):
@@ -27,14 +27,16 @@ def get_response(message, model):
         stop_sequences = ["User:"]
     else:
         stop_sequences = ["\\n"]
-    response = _model.invoke_model(model_name=model_selected,
+    response = _model.invoke_model_stream(model_name=model_selected,
                             prompt= model_prompt.format(text=message),
                             max_tokens=max_tokens,
                             temperature=temperature,
                             top_p=0.9,
                             top_k=50,
                             stop_sequences=stop_sequences)
-    return response['output_text']
+    for chunk in response:
+        if 'output_text' in chunk:
+            yield chunk['output_text']
 
 
 if "messages" not in st.session_state:
@@ -47,7 +49,6 @@ for message in st.session_state.messages:
 if prompt := st.chat_input("What is up?"):
     st.chat_message("user").markdown(prompt)
     st.session_state.messages.append({"role": "user", "content": prompt})
-    response = get_response(prompt , model_selected)
     with st.chat_message("assistant"):
-        st.markdown(response)
+        response = st.write_stream(get_response(prompt , model_selected))
     st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
@@ -525,6 +525,48 @@ var spec = {
                 }
             }
         },
+        "/document/extraction/page": {
+            "post": {
+                "tags": [
+                    "Extraction"
+                ],
+                "summary": "Get Extracted Page",
+                "description": "## Endpoint to Get One Page of Extracted Text\nThis endpoint returns the text of a single page of an extracted file, read with a ranged GET instead of downloading the whole result.\n\n***\n\n## Request Body\n\n| Field               | Type   | Description                      |\n|---------------------|--------|----------------------------------|\n| extraction_job_id   | str    | The ID of the extraction job.    |\n| file_name           | str    | The name of the file.            |\n| page_number         | int    | The page to read, starting at 1. |\n\n***\n\n## Response Body\n\n| Field               | Type   | Description                      |\n|---------------------|--------|----------------------------------|\n| extraction_job_id   | str    | The ID of the extraction job.    |\n| file_name           | str    | The name of the file.            |\n| page_number         | int    | The page returned.               |\n| page_count          | int    | The number of pages in the file. |\n| page_text           | str    | The extracted text of the page.  |\n\n***\n\n#### Errors\n\n- **404**: If the job, the file or the page is not found.\n- **400**: If the file has not been extracted yet.\n- **401**: If the extraction job does not belong to the app.\n- **500**: If any other error occurs while reading the page.",
+                "operationId": "get_extracted_page_document_extraction_page_post",
+                "requestBody": {
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "$ref": "#/components/schemas/ExtractionPageRequest"
+                            }
+                        }
+                    },
+                    "required": true
+                },
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "$ref": "#/components/schemas/ExtractionPageResponse"
+                                }
+                            }
+                        }
+                    },
+                    "422": {
+                        "description": "Validation Error",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "$ref": "#/components/schemas/HTTPValidationError"
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        },
         "/document/chunking/job_status/{job_id}": {
             "get": {
                 "tags": [
@@ -1763,6 +1805,63 @@ var spec = {
                 ],
                 "title": "ExtractionJobFileResponse"
             },
+            "ExtractionPageRequest": {
+                "properties": {
+                    "extraction_job_id": {
+                        "type": "string",
+                        "title": "Extraction Job Id"
+                    },
+                    "file_name": {
+                        "type": "string",
+                        "title": "File Name"
+                    },
+                    "page_number": {
+                        "type": "integer",
+                        "minimum": 1.0,
+                        "title": "Page Number"
+                    }
+                },
+                "type": "object",
+                "required": [
+                    "extraction_job_id",
+                    "file_name",
+                    "page_number"
+                ],
+                "title": "ExtractionPageRequest"
+            },
+            "ExtractionPageResponse": {
+                "properties": {
+                    "extraction_job_id": {
+                        "type": "string",
+                        "title": "Extraction Job Id"
+                    },
+                    "file_name": {
+                        "type": "string",
+                        "title": "File Name"
+                    },
+                    "page_number": {
+                        "type": "integer",
+                        "title": "Page Number"
+                    },
+                    "page_count": {
+                        "type": "integer",
+                        "title": "Page Count"
+                    },
+                    "page_text": {
+                        "type": "string",
+                        "title": "Page Text"
+                    }
+                },
+                "type": "object",
+                "required": [
+                    "extraction_job_id",
+                    "file_name",
+                    "page_number",
+                    "page_count",
+                    "page_text"
+                ],
+                "title": "ExtractionPageResponse"
+            },
             "ExtractionJobStatus": {
                 "type": "string",
                 "enum": [
@@ -1,7 +1,6 @@
 import json
 import logging
 import os
-import asyncio
 from fastapi import FastAPI, BackgroundTasks, HTTPException, Depends
 from pydantic import BaseModel
 import boto3
@@ -14,6 +13,9 @@ from utils.page_wise_chunking import PagewiseChunker
 from utils.json_chunking import JSONChunker
 from typing import List
 from models import ChunkingJobs, ChunkingJobFiles
+from utils.sqs_consumer import SQSConsumer
+from utils.extracted_pages import ExtractedPages, decode, read_file_entry
+from functools import partial
 
 # Configure structured logging
 logging.basicConfig(level=logging.INFO)
@@ -41,9 +43,7 @@ dynamodb = None
 
 retry_config = Config(retries={"max_attempts": MAX_RETRIES, "mode": "standard"})
 
-# Background task checking interval (in seconds)
-CHECK_INTERVAL = 60
-poll_task = None
+consumer = None
 
 app = FastAPI()
 
@@ -63,46 +63,31 @@ def save_chunks_to_s3(bucket: str, file_path: str, chunks: List[dict]):
     except Exception as e:
         raise e
 
-def read_file_from_s3(file_path: str) -> str:
+def read_file_from_s3(file_path: str) -> dict:
+    """Reads extraction results. Pages are read lazily from the page-delimited text object when
+    the file has page offsets, otherwise from the results object, in either format."""
     try:
         s3 = boto3.client('s3')
+        file_entry = read_file_entry(s3, RESULTS_S3_BUCKET, file_path)
+        if file_entry:
+            return {"pages": ExtractedPages(s3, RESULTS_S3_BUCKET, file_entry)}
         response = s3.get_object(Bucket=RESULTS_S3_BUCKET, Key=file_path)
-        data = json.loads(response['Body'].read())
+        body = decode(response['Body'].read(), response.get('ContentEncoding'))
+        if ".jsonl" in file_path.split("/")[-1]:
+            return {"pages": [json.loads(line) for line in body.splitlines() if line]}
+        data = json.loads(body)
         return data
     except Exception as e:
         raise e
 
-async def poll_sqs( sqs_client, dynamodb, s3_client, semaphore):
-    logger.info("Polling SQS queue")
-    
-    while True:
-        print("Polling SQS queue")
-        try:
-            response = sqs_client.receive_message(
-                QueueUrl=QUEUE_URL,
-                MaxNumberOfMessages=3,
-                WaitTimeSeconds=5,
-                VisibilityTimeout=VISIBILITY_TIMEOUT  # initial visibility timeout
-            )
-            messages = response.get('Messages', [])
-            logger.info(f"Received {len(messages)} messages")
-            for message in messages:
-                await semaphore.acquire()
-                asyncio.create_task(
-                    handle_chunking(
-                        semaphore,
-                        message,
-                        dynamodb,
-                        s3_client,
-                        sqs_client
-                    )
-                )
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Error occurred: {e}")
-            await asyncio.sleep(5)
-
-async def handle_chunking(semaphore, message, dynamodb, s3_client, sqs_client):
+def chunking_completed(message) -> bool:
+    """True when an earlier delivery of the message already chunked its file."""
+    chunking_job_file = ChunkingJobFiles.safe_get(json.loads(message['Body']).get('chunk_job_file_id'))
+    return chunking_job_file is not None and chunking_job_file.status == "COMPLETED"
+
+def handle_chunking(message, dynamodb, s3_client) -> bool:
+    """Chunks the file of one queue message. Returns True when the message should be deleted."""
+    chunks_saved = False
     try:
         
         message_body = json.loads(message['Body'])
@@ -114,36 +99,41 @@ async def handle_chunking(semaphore, message, dynamodb, s3_client, sqs_client):
         chunking_strategy = message_body.get('chunking_strategy')
         chunking_params = message_body.get('chunking_params')
         app_id = message_body.get('app_id')
-        receipt_handle = message['ReceiptHandle']
 
         # Infer File Type
         file_extension = file_name.split(".")[-1]
 
-        await extend_visibility_timeout(sqs_client, receipt_handle)
         # Perform Chunking
         chunk_size = chunking_params.get('chunk_size', 1000)
         chunk_overlap = chunking_params.get('chunk_overlap', 0)
         content = read_file_from_s3(file_path)
+        # Carried on every chunk into the vector index
+        source = {
+            "file_name": file_name,
+            "file_path": file_path,
+            "extraction_job_id": extraction_job_id,
+            "chunking_job_id": chunk_job_id
+        }
         if file_extension == "json":
             json_chunker = JSONChunker()
-            chunks = json_chunker.chunk_json(content)
+            chunks = json_chunker.chunk_json(content, source)
             logger.info(f"Processed file: {file_name}, chunks: {json.dumps(chunks, indent=2)}")
         elif file_extension == "jsonl":
             json_chunker = JSONChunker()
-            chunks = json_chunker.chunk_jsonl(content)
+            chunks = json_chunker.chunk_jsonl(content, source)
             logger.info(f"Processed file: {file_name}, chunks: {json.dumps(chunks, indent=2)}")
         else:
             if chunking_strategy == "fixed_size":
                 fixed_size_chunker = FixedSizeChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-                chunks = fixed_size_chunker.chunk(content)
+                chunks = fixed_size_chunker.chunk(content, source)
                 logger.info(f"Processed file: {file_name}, chunks: {json.dumps(chunks, indent=2)}")
             elif chunking_strategy == "recursive":
                 recursive_chunker = RecursiveChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-                chunks = recursive_chunker.chunk(content)
+                chunks = recursive_chunker.chunk(content, source)
                 logger.info(f"Processed file: {file_name}, chunks: {json.dumps(chunks, indent=2)}")
             elif chunking_strategy == "page":
                 pagewise_chunker = PagewiseChunker()
-                chunks = pagewise_chunker.chunk(content)
+                chunks = pagewise_chunker.chunk(content, source)
                 logger.info(f"Processed file: {file_name}, chunks: {json.dumps(chunks, indent=2)}")
             else:
                 raise ValueError(f"Invalid chunking strategy: {chunking_strategy}")
@@ -152,13 +142,7 @@ async def handle_chunking(semaphore, message, dynamodb, s3_client, sqs_client):
         
         created_chunk_key = f"{app_id}/{extraction_job_id}/{file_name}/chunk_{chunk_job_id}.json"
         save_chunks_to_s3(RESULTS_S3_BUCKET, created_chunk_key, chunks)
-
-        #  delete the message from the queue
-        sqs_client.delete_message(
-            QueueUrl=QUEUE_URL,
-            ReceiptHandle=message['ReceiptHandle']
-        )
-        logger.info(f"Deleted message from SQS: {message}")
+        chunks_saved = True
 
         chunking_job_file = ChunkingJobFiles.safe_get(chunk_job_file_id)
         if chunking_job_file:
@@ -178,41 +162,20 @@ async def handle_chunking(semaphore, message, dynamodb, s3_client, sqs_client):
             logger.error(f"Chunking job file record not found: {chunk_job_file_id}")
 
         logger.info(f"Updated chunking job record: {chunk_job_id}")
+        return True
     except Exception as e:
         logger.error(f"Error processing message: {e}")
-    finally:
-        semaphore.release()
-
-async def extend_visibility_timeout(sqs_client, receipt_handle):
-    try:
-        sqs_client.change_message_visibility(
-            QueueUrl=QUEUE_URL,
-            ReceiptHandle=receipt_handle,
-            VisibilityTimeout=VISIBILITY_TIMEOUT  # extend the visibility timeout
-        )
-    except Exception as e:
-        logger.error(f"Failed to extend visibility timeout: {e}")
-
-async def ensure_task_running(background_tasks: BackgroundTasks, sqs_client, dynamodb, s3_client):
-    global poll_task
-    logger.info("Starting background task")
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
-    while True:
-        if poll_task is None or poll_task.done():
-            logger.info("Polling task not running or done, starting new task")
-            poll_task = asyncio.create_task(poll_sqs(sqs_client, dynamodb, s3_client, semaphore))
-            background_tasks.add_task(lambda: poll_task)
-            logger.info("Started new polling task")
-        await asyncio.sleep(CHECK_INTERVAL)
+        # Once the chunks are saved the message is done with, even if the job records could not be updated
+        return chunks_saved
 
 @app.get("/chunking/service/health")
 async def health_check():
     return {"status": "UP"}
 
 @app.on_event("startup")
-async def startup_event(background_tasks: BackgroundTasks = BackgroundTasks()):
+async def startup_event():
 
-    global REGION_NAME
+    global REGION_NAME, consumer
 
     if not ECS_METADATA_URL:
         raise HTTPException(status_code=500, detail="ECS_CONTAINER_METADATA_URI_V4 environment variable not set.")
@@ -236,4 +199,22 @@ async def startup_event(background_tasks: BackgroundTasks = BackgroundTasks()):
         raise HTTPException(status_code=500, detail=f"Error retrieving ECS metadata: {str(e)}")
 
 
-    asyncio.create_task(ensure_task_running(background_tasks, sqs_client, dynamodb_client, s3_client))
+    consumer = SQSConsumer(
+        sqs_client,
+        QUEUE_URL,
+        partial(handle_chunking, dynamodb=dynamodb_client, s3_client=s3_client),
+        max_concurrency=MAX_CONCURRENT_TASKS,
+        visibility_timeout=VISIBILITY_TIMEOUT,
+        is_completed=chunking_completed,
+        name="chunking"
+    )
+    consumer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if consumer:
+        await consumer.stop()
+
+@app.get("/chunking/service/metrics", include_in_schema=False)
+async def get_service_metrics():
+    return {"consumer": consumer.stats() if consumer else None}
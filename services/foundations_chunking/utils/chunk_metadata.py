@@ -0,0 +1,21 @@
+import hashlib
+from typing import Dict, Optional
+
+
+def build_chunk(text: str, chunk_index: int, page_number: Optional[int] = None, char_start: Optional[int] = None,
+                source: Optional[Dict] = None) -> Dict:
+    """Builds a chunk record with the metadata that is carried into the vector index.
+
+    char_start/char_end are offsets into the page text the chunk was taken from.
+    source holds file-level fields such as file_name and extraction_job_id.
+    """
+    chunk = {
+        "chunk": text,
+        "chunk_index": chunk_index,
+        "page_number": page_number,
+        "char_start": char_start,
+        "char_end": char_start + len(text) if char_start is not None else None,
+        "content_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+    }
+    chunk.update(source or {})
+    return chunk
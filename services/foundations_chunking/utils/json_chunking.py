@@ -1,27 +1,31 @@
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain_text_splitters import RecursiveJsonSplitter
+from utils.chunk_metadata import build_chunk
 
 class JSONChunker:
     def __init__(self):
         self.splitter = RecursiveJsonSplitter(max_chunk_size=300)
 
-    def chunk_json(self, content: str) -> List[Dict[str,str]]:
+    def chunk_json(self, content: str, source: Optional[Dict] = None) -> List[Dict]:
         try:
             pages = content.get('pages',[])
             json_content = json.loads(pages[0].get('page_text',''))
             chunks = []
             json_chunks = self.splitter.split_text(json_data=json_content)
             for chunk in json_chunks:
-                chunks.append({"chunk":chunk})
+                # Split JSON is re-serialized, so it has no offsets into the source text
+                chunks.append(build_chunk(chunk, len(chunks), 1, None, source))
             return chunks
         except Exception as e:
             print(e)
 
-    def chunk_jsonl(self, content: str) -> List[Dict[str,str]]:
+    def chunk_jsonl(self, content: str, source: Optional[Dict] = None) -> List[Dict]:
         pages = content.get('pages',[])
         json_content = str(pages[0].get('page_text',''))
         chunks = []
+        char_start = 0
         for line in json_content.split("\n"):
-            chunks.append({"chunk":line})
+            chunks.append(build_chunk(line, len(chunks), 1, char_start, source))
+            char_start += len(line) + 1
         return chunks
\ No newline at end of file
@@ -1,13 +1,15 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain_text_splitters.character import CharacterTextSplitter
+from utils.chunk_metadata import build_chunk
 
 class PagewiseChunker:
 
-    def chunk(self, content: str) -> List[Dict[str,str]]:
+    def chunk(self, content: str, source: Optional[Dict] = None) -> List[Dict]:
         pages = content.get('pages',[])
         chunks = []
-        for page in pages:
+        for page_index, page in enumerate(pages):
             page_text = page.get('page_text', '')
-            chunks.append({"chunk":page_text})
+            page_number = page.get('page_number', page_index + 1)
+            chunks.append(build_chunk(page_text, len(chunks), page_number, 0, source))
         return chunks
 
@@ -1,21 +1,22 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils.chunk_metadata import build_chunk
 
 class RecursiveChunker:
     def __init__(self, chunk_size: int = 4000, chunk_overlap: int = 200):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         # self.seperator = seperator
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
 
-    def chunk(self, content: str) -> List[Dict[str,str]]:
+    def chunk(self, content: str, source: Optional[Dict] = None) -> List[Dict]:
         pages = content.get('pages',[])
         chunks = []
-        for page in pages:
+        for page_index, page in enumerate(pages):
             page_text = page.get('page_text', '')
-            page_chunks = self.text_splitter.split_text(page_text)
-            for chunk in page_chunks:
-                chunks.append({"chunk":chunk})
+            page_number = page.get('page_number', page_index + 1)
+            for doc in self.text_splitter.create_documents([page_text]):
+                chunks.append(build_chunk(doc.page_content, len(chunks), page_number, doc.metadata.get('start_index'), source))
 
         return chunks
 
@@ -0,0 +1,348 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+from functools import partial
+from typing import Callable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+SQS_MAX_BATCH_SIZE = 10
+SQS_WAIT_TIME_SECONDS = int(os.getenv('SQS_WAIT_TIME_SECONDS', '20'))  # long polling, the SQS maximum
+SQS_MIN_CONCURRENCY = int(os.getenv('SQS_MIN_CONCURRENCY', '1'))
+SQS_DELETE_FLUSH_INTERVAL = float(os.getenv('SQS_DELETE_FLUSH_INTERVAL', '1'))  # in seconds
+SQS_QUEUE_DEPTH_INTERVAL = int(os.getenv('SQS_QUEUE_DEPTH_INTERVAL', '30'))  # in seconds
+# Defaults to a third of the visibility timeout, so two heartbeats can fail before a message is redelivered
+SQS_HEARTBEAT_INTERVAL = int(os.getenv('SQS_HEARTBEAT_INTERVAL', '0'))  # in seconds
+SQS_ERROR_BACKOFF = 5  # in seconds
+LATENCY_SAMPLES = 1000
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 1)
+
+
+class SQSConsumer:
+    """Receives messages from an SQS queue and runs a handler for each on a thread pool.
+
+    The handler takes one message and returns True when it should be deleted from the
+    queue; messages it returns False for, or raises on, become visible again after the
+    visibility timeout. A handler that hands its work off can return a Future of that
+    result instead: its slot is freed right away, but the message stays in flight, with
+    its visibility extended, until the future is done, so the work is retried from the
+    message if the task stops before then. Receives long poll for up to 10 messages and run off the event
+    loop, and deletes are sent in batches of up to 10.
+
+    Concurrency adapts between min_concurrency and max_concurrency: it grows while
+    receives come back full or the sampled queue depth exceeds the work in flight, and
+    shrinks by one on each empty receive. Only as many messages are received as there
+    are free slots, so a task never holds messages it cannot start on, which would let
+    their visibility timeout run out and keep them from other tasks.
+
+    With a visibility timeout, a heartbeat extends the visibility of every message in
+    flight every heartbeat_interval, so long jobs are not redelivered while they run.
+    A message received again while it is still in flight here is not handled twice; its
+    newest receipt handle is used from then on. is_completed, if given, is asked before a
+    message is handled, and messages whose work was already completed by an earlier
+    delivery are deleted without handling.
+    """
+
+    def __init__(self, sqs_client, queue_url: str, handler: Callable[[dict], Union[bool, concurrent.futures.Future]],
+                 max_concurrency: int,
+                 min_concurrency=SQS_MIN_CONCURRENCY, visibility_timeout: Optional[int] = None,
+                 wait_time_seconds=SQS_WAIT_TIME_SECONDS, delete_flush_interval=SQS_DELETE_FLUSH_INTERVAL,
+                 queue_depth_interval=SQS_QUEUE_DEPTH_INTERVAL, heartbeat_interval=SQS_HEARTBEAT_INTERVAL,
+                 is_completed: Optional[Callable[[dict], bool]] = None, name="sqs-consumer"):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.handler = handler
+        self.is_completed = is_completed
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.visibility_timeout = visibility_timeout
+        self.wait_time_seconds = wait_time_seconds
+        self.delete_flush_interval = delete_flush_interval
+        self.queue_depth_interval = queue_depth_interval
+        self.heartbeat_interval = heartbeat_interval or (visibility_timeout / 3 if visibility_timeout else None)
+        self.name = name
+        self.concurrency = self.min_concurrency
+        self._workers = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=name)
+        # Receives, deletes, heartbeats and queue depth samples, kept apart so a long poll never takes a worker
+        self._io = concurrent.futures.ThreadPoolExecutor(max_workers=3, thread_name_prefix=f"{name}-io")
+        self._in_flight = 0
+        # Messages being handled by message id, holding the newest receipt handle
+        self._messages = {}
+        self._slot_freed = None
+        self._pending_deletes = []
+        self._lock = threading.Lock()
+        self._tasks = []
+        self._running = False
+        self._queue_depth = None
+        self._processing_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._queue_wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = {"received": 0, "empty_receives": 0, "handled": 0, "handler_errors": 0, "deleted": 0,
+                       "delete_failures": 0, "receive_errors": 0, "redelivered": 0, "duplicates_in_flight": 0,
+                       "duplicates_completed": 0, "heartbeats": 0, "heartbeat_failures": 0, "deferred": 0}
+
+    def start(self):
+        """Starts the receive, delete and queue depth loops on the running event loop."""
+        if self._running:
+            return
+        self._running = True
+        self._slot_freed = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._receive_loop()),
+            asyncio.create_task(self._delete_loop()),
+            asyncio.create_task(self._queue_depth_loop()),
+        ]
+        if self.heartbeat_interval:
+            self._tasks.append(asyncio.create_task(self._heartbeat_loop()))
+        logger.info(f"Consuming {self.queue_url} with up to {self.max_concurrency} concurrent messages")
+
+    async def stop(self):
+        """Stops receiving, waits for the handlers in flight and flushes pending deletes."""
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._workers.shutdown, True)
+        await loop.run_in_executor(self._io, self._flush_deletes)
+        self._io.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+            held = len(self._messages)
+            pending_deletes = len(self._pending_deletes)
+            counters = dict(self._stats)
+        return {
+            "concurrency": self.concurrency,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": in_flight,
+            # Messages held in flight, including those whose handler handed its work off
+            "held": held,
+            "queue_depth": self._queue_depth,
+            "pending_deletes": pending_deletes,
+            "processing_ms_p50": _percentile(self._processing_ms, 0.5),
+            "processing_ms_p95": _percentile(self._processing_ms, 0.95),
+            "queue_wait_ms_p50": _percentile(self._queue_wait_ms, 0.5),
+            "queue_wait_ms_p95": _percentile(self._queue_wait_ms, 0.95),
+            **counters
+        }
+
+    def _count(self, name: str, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    async def _receive_loop(self):
+        loop = asyncio.get_running_loop()
+        while self._running:
+            try:
+                free = await self._wait_for_slots()
+                requested = min(SQS_MAX_BATCH_SIZE, free)
+                messages = await loop.run_in_executor(self._io, self._receive, requested)
+                self._adjust(len(messages), requested)
+                for message in messages:
+                    with self._lock:
+                        handling = self._messages.get(message['MessageId'])
+                        if handling is not None:
+                            # Redelivered while still being handled here, e.g. after a missed heartbeat
+                            handling['ReceiptHandle'] = message['ReceiptHandle']
+                            self._stats["duplicates_in_flight"] += 1
+                            continue
+                        self._messages[message['MessageId']] = message
+                        self._in_flight += 1
+                    future = loop.run_in_executor(self._workers, self._handle, message)
+                    future.add_done_callback(self._release_slot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._count("receive_errors")
+                logger.error(f"Error receiving from {self.queue_url}: {e}")
+                await asyncio.sleep(SQS_ERROR_BACKOFF)
+
+    async def _wait_for_slots(self) -> int:
+        while True:
+            with self._lock:
+                free = self.concurrency - self._in_flight
+            if free > 0:
+                return free
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+
+    def _release_slot(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+        # Done callbacks of run_in_executor futures run on the event loop thread
+        self._slot_freed.set()
+
+    def _receive(self, max_messages: int) -> List[dict]:
+        params = {
+            "QueueUrl": self.queue_url,
+            "MaxNumberOfMessages": max_messages,
+            "WaitTimeSeconds": self.wait_time_seconds,
+            "AttributeNames": ["SentTimestamp", "ApproximateReceiveCount"],
+        }
+        if self.visibility_timeout is not None:
+            params["VisibilityTimeout"] = self.visibility_timeout
+        messages = self.sqs_client.receive_message(**params).get('Messages', [])
+        self._count("received", len(messages))
+        if not messages:
+            self._count("empty_receives")
+        now_ms = time.time() * 1000
+        for message in messages:
+            attributes = message.get("Attributes", {})
+            if int(attributes.get("ApproximateReceiveCount", 1)) > 1:
+                self._count("redelivered")
+                logger.warning(f"Message {message['MessageId']} delivered {attributes['ApproximateReceiveCount']} times")
+            elif attributes.get("SentTimestamp"):
+                self._queue_wait_ms.append(now_ms - int(attributes["SentTimestamp"]))
+        return messages
+
+    def _adjust(self, received: int, requested: int):
+        with self._lock:
+            in_flight = self._in_flight
+        concurrency = self.concurrency
+        if received == requested:
+            # The queue had at least as many messages as were asked for
+            concurrency = max(concurrency + 1, concurrency * 2)
+        elif received == 0:
+            concurrency -= 1
+            # The sampled depth is stale once a long poll finds the queue empty
+            self._queue_depth = 0
+        if self._queue_depth:
+            concurrency = max(concurrency, in_flight + received + self._queue_depth)
+        concurrency = max(self.min_concurrency, min(self.max_concurrency, concurrency))
+        if concurrency != self.concurrency:
+            logger.info(f"Concurrency for {self.queue_url}: {self.concurrency} -> {concurrency}")
+            self.concurrency = concurrency
+
+    def _handle(self, message: dict):
+        started = time.perf_counter()
+        try:
+            if self._completed(message):
+                self._count("duplicates_completed")
+                logger.info(f"Skipping message {message['MessageId']}: its work was completed by an earlier delivery")
+                delete = True
+            else:
+                delete = self.handler(message)
+                self._count("handled")
+                self._processing_ms.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            delete = False
+            self._count("handler_errors")
+            logger.error(f"Error handling message {message.get('MessageId')}: {e}")
+        if isinstance(delete, concurrent.futures.Future):
+            self._count("deferred")
+            delete.add_done_callback(partial(self._settle_deferred, message))
+        else:
+            self._settle(message, delete)
+
+    def _settle_deferred(self, message: dict, future: concurrent.futures.Future):
+        try:
+            delete = future.result()
+        except Exception as e:
+            delete = False
+            self._count("handler_errors")
+            logger.error(f"Error handling message {message.get('MessageId')}: {e}")
+        self._settle(message, delete)
+
+    def _settle(self, message: dict, delete: bool):
+        """Ends the handling of a message, deleting it from the queue if delete is true."""
+        with self._lock:
+            self._messages.pop(message['MessageId'], None)
+        if delete:
+            with self._lock:
+                self._pending_deletes.append(message)
+                full = len(self._pending_deletes) >= SQS_MAX_BATCH_SIZE
+            if full:
+                self._flush_deletes()
+
+    def _completed(self, message: dict) -> bool:
+        if self.is_completed is None:
+            return False
+        try:
+            return self.is_completed(message)
+        except Exception as e:
+            logger.warning(f"Could not check whether message {message['MessageId']} was completed: {e}")
+            return False
+
+    async def _heartbeat_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await loop.run_in_executor(self._io, self._heartbeat)
+            except Exception as e:
+                logger.error(f"Error extending visibility on {self.queue_url}: {e}")
+
+    def _heartbeat(self):
+        """Extends the visibility timeout of every message in flight."""
+        with self._lock:
+            messages = list(self._messages.values())
+        for start in range(0, len(messages), SQS_MAX_BATCH_SIZE):
+            batch = messages[start:start + SQS_MAX_BATCH_SIZE]
+            entries = [
+                {"Id": str(i), "ReceiptHandle": message["ReceiptHandle"], "VisibilityTimeout": self.visibility_timeout}
+                for i, message in enumerate(batch)
+            ]
+            try:
+                response = self.sqs_client.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=entries)
+            except Exception as e:
+                self._count("heartbeat_failures", len(batch))
+                logger.error(f"Failed to extend visibility of {len(batch)} messages on {self.queue_url}: {e}")
+                continue
+            failed = response.get("Failed", [])
+            self._count("heartbeats", len(response.get("Successful", [])))
+            self._count("heartbeat_failures", len(failed))
+            for failure in failed:
+                # Typically the message was already redelivered, and the next receive here picks up its new handle
+                logger.warning(f"Failed to extend visibility of message {batch[int(failure['Id'])]['MessageId']}: {failure.get('Message')}")
+
+    async def _delete_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.delete_flush_interval)
+            try:
+                await loop.run_in_executor(self._io, self._flush_deletes)
+            except Exception as e:
+                logger.error(f"Error deleting messages from {self.queue_url}: {e}")
+
+    def _flush_deletes(self):
+        while True:
+            with self._lock:
+                batch = self._pending_deletes[:SQS_MAX_BATCH_SIZE]
+                del self._pending_deletes[:SQS_MAX_BATCH_SIZE]
+            if not batch:
+                return
+            entries = [{"Id": str(i), "ReceiptHandle": message["ReceiptHandle"]} for i, message in enumerate(batch)]
+            try:
+                response = self.sqs_client.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            except Exception as e:
+                # Undeleted messages are received again once their visibility timeout runs out
+                self._count("delete_failures", len(batch))
+                logger.error(f"Failed to delete {len(batch)} messages from {self.queue_url}: {e}")
+                continue
+            failed = response.get("Failed", [])
+            self._count("deleted", len(response.get("Successful", [])))
+            self._count("delete_failures", len(failed))
+            for failure in failed:
+                logger.error(f"Failed to delete message {batch[int(failure['Id'])].get('MessageId')}: {failure.get('Message')}")
+
+    async def _queue_depth_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                response = await loop.run_in_executor(self._io, lambda: self.sqs_client.get_queue_attributes(
+                    QueueUrl=self.queue_url, AttributeNames=["ApproximateNumberOfMessages"]))
+                self._queue_depth = int(response["Attributes"]["ApproximateNumberOfMessages"])
+                logger.info(f"{self.name} consumer: {self.stats()}")
+            except Exception as e:
+                logger.warning(f"Failed to read the depth of {self.queue_url}: {e}")
+            await asyncio.sleep(self.queue_depth_interval)
@@ -15,6 +15,8 @@ import datetime
 import requests
 from enum import Enum
 from models import *
+from auth import AppClientResolver, check_platform_client
+from utils.extracted_pages import ExtractedPages, decode, read_file_entry
 from dyntastic import A
 from fastapi.exceptions import RequestValidationError
 from fastapi.encoders import jsonable_encoder
@@ -48,6 +50,7 @@ COGNITO_JWKS_URL = ''
 session = None
 s3_client = None
 dynamodb = None
+app_client_resolver = None
 
 app = FastAPI()
 
@@ -108,15 +111,7 @@ def decode_token_without_verification(token: str):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def get_app_id_from_dynamodb(client_id: str):
-    response = dynamodb.scan(TableName=CLIENTS_TABLE)
-    items = response['Items']
-    if not items:
-        raise HTTPException(status_code=401, detail="No items found in DynamoDB")
-    for item in items:
-        if 'client_id' in item and client_id == item['client_id']['S']:
-            return item['app_id']['S']
-    
-    raise HTTPException(status_code=401, detail="Client ID not found in DynamoDB")
+    return app_client_resolver.get_app_id(client_id)
 
 async def get_app_id_from_token(request: Request):
 
@@ -131,6 +126,13 @@ async def get_app_id_from_token(request: Request):
         return app_id
     except KeyError:
         raise HTTPException(status_code=401, detail="Client ID not found in token")
+
+async def verify_platform_client(request: Request):
+    authorization: str = request.headers.get("Authorization")
+    if authorization is None:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+    decoded_token = decode_token_without_verification(authorization.replace("Bearer ", ""))
+    check_platform_client(decoded_token.get('client_id'))
     
 # Get the total file count and list of file names for the provided extraction job
 def get_completed_files(job_id: str):
@@ -145,12 +147,15 @@ def get_completed_files(job_id: str):
             return 0, []
 
         completed_files = [item for item in job_files if item.status == 'COMPLETED']
-        file_names = [item.file_name for item in completed_files]
-        return len(file_names), file_names
+        return len(completed_files), completed_files
 
     except ClientError as e:
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
+def extracted_text_key(app_id: str, extraction_job_file: ExtractionJobFiles) -> str:
+    # Files extracted before result_key was recorded have their text at the original path
+    return extraction_job_file.result_key or f"{app_id}/{extraction_job_file.job_id}/{extraction_job_file.file_name}/extracted_text.json"
+
 # Check if chunking job already exists
 def check_chunking_job_exists(job_id: str) -> bool:
     try:
@@ -166,11 +171,12 @@ def check_chunking_job_exists(job_id: str) -> bool:
             return False
 
 # add files to sqs for chunking
-def add_files_to_sqs_for_chunking(chunk_job_id: str,extraction_job_id: str,chunking_strategy: str,chunking_params: Optional[ChunkingParams],app_id: str, file_names: List[str]):
+def add_files_to_sqs_for_chunking(chunk_job_id: str,extraction_job_id: str,chunking_strategy: str,chunking_params: Optional[ChunkingParams],app_id: str, files: List[ExtractionJobFiles]):
     try:
         queue_url = CHUNKING_QUEUE_URL
 
-        for file_name in file_names:
+        for extraction_job_file in files:
+            file_name = extraction_job_file.file_name
             chunk_job_file_id =  str(uuid.uuid4()).replace("-", "")
             message_body = {
                 "chunking_job_id": chunk_job_id,
@@ -179,7 +185,7 @@ def add_files_to_sqs_for_chunking(chunk_job_id: str,extraction_job_id: str,chunk
                 "chunking_params": chunking_params.dict() if chunking_params else {},
                 "app_id": app_id,
                 "file_name": file_name,
-                "file_path": f"{app_id}/{extraction_job_id}/{file_name}/{'extracted_text.json'}",
+                "file_path": extracted_text_key(app_id, extraction_job_file),
                 "chunk_job_file_id": chunk_job_file_id
             }
             
@@ -208,7 +214,7 @@ def add_files_to_sqs_for_chunking(chunk_job_id: str,extraction_job_id: str,chunk
         if not chunk_job:
             raise HTTPException(status_code=404, detail="Chunk job not found")
         chunk_job.status = "QUEUED"
-        chunk_job.queued_files = len(file_names)
+        chunk_job.queued_files = len(files)
         chunk_job.save()
 
 
@@ -363,7 +369,7 @@ async def create_chunking_job(request: CreateChunkingJobRequest, background_task
 
         
         # get completed files
-        file_count, file_names = get_completed_files(request.extraction_job_id)
+        file_count, completed_files = get_completed_files(request.extraction_job_id)
 
         chunk_job = ChunkingJobs(
             extraction_job_id=request.extraction_job_id,
@@ -380,7 +386,7 @@ async def create_chunking_job(request: CreateChunkingJobRequest, background_task
 
         chunk_job.save()
 
-        background_task.add_task(add_files_to_sqs_for_chunking, chunk_job_id, request.extraction_job_id, request.chunking_strategy, request.chunking_params, app_id, file_names)
+        background_task.add_task(add_files_to_sqs_for_chunking, chunk_job_id, request.extraction_job_id, request.chunking_strategy, request.chunking_params, app_id, completed_files)
 
         return CreateChunkingJobResponse(chunking_job_id=chunk_job_id, extraction_job_id=request.extraction_job_id, status="WAITING_QUEUE_ALLOCATION", total_file_count=file_count)
 
@@ -453,10 +459,11 @@ async def register_file(
         if not file_name:
             raise HTTPException(status_code=400, detail="Invalid file name")
         ## Check file type
-        allowed_file_types = ['pdf', 'txt', 'md', 'html', 'json', 'jsonl', 'png', 'jpg', 'jpeg', 'tiff']
+        allowed_file_types = ['pdf', 'png', 'jpg', 'jpeg', 'tiff', 'docx', 'pptx', 'xlsx', 'csv', 'tsv',
+                              'txt', 'md', 'html', 'htm', 'json', 'jsonl']
         file_type = file_name.split('.')[-1].lower()
         if file_type not in allowed_file_types:
-            raise HTTPException(status_code=400, detail="Invalid file type. Supported file types are pdf, txt, md, html, json")
+            raise HTTPException(status_code=400, detail="Invalid file type. Supported file types are " + ", ".join(allowed_file_types))
                    
         # Check if file_name has any characters from avoid_chars
         avoid_chars = ["&", "$", "@", "=", ";", "/", ":", "+", " ", ",", "?", "\\", "{", "}", "^", "]", "\"", ">", "[", "~", "<", "#", "|", "%"]
@@ -764,7 +771,7 @@ async def get_file_status(req: ExtractionJobFileRequest, app_id: str = Depends(g
             raise HTTPException(status_code=404, detail="File not found")
         status = response.status
         if status == "COMPLETED":
-            file_path = f"{app_id}/{extraction_job_id}/{file_name}/extracted_text.json"
+            file_path = extracted_text_key(app_id, response)
             try:
                 file_url = generate_presigned_url_get(RESULTS_BUCKET_NAME, file_path)
             except ClientError as e:
@@ -777,6 +784,89 @@ async def get_file_status(req: ExtractionJobFileRequest, app_id: str = Depends(g
     except Exception as e:
         raise HTTPException(status_code=500, detail="Error getting file status")
 
+# Get one page of a file's extracted text
+@app.post("/document/extraction/page", tags=["Extraction"], response_model=ExtractionPageResponse)
+async def get_extracted_page(req: ExtractionPageRequest, app_id: str = Depends(get_app_id_from_token)):
+    """
+    ## Endpoint to Get One Page of Extracted Text
+    This endpoint returns the text of a single page of an extracted file, read with a ranged GET instead of downloading the whole result.
+
+    ***
+
+    ## Request Body
+
+    | Field               | Type   | Description                      |
+    |---------------------|--------|----------------------------------|
+    | extraction_job_id   | str    | The ID of the extraction job.    |
+    | file_name           | str    | The name of the file.            |
+    | page_number         | int    | The page to read, starting at 1. |
+
+    ***
+
+    ## Response Body
+
+    | Field               | Type   | Description                      |
+    |---------------------|--------|----------------------------------|
+    | extraction_job_id   | str    | The ID of the extraction job.    |
+    | file_name           | str    | The name of the file.            |
+    | page_number         | int    | The page returned.               |
+    | page_count          | int    | The number of pages in the file. |
+    | page_text           | str    | The extracted text of the page.  |
+
+    ***
+
+    #### Errors
+
+    - **404**: If the job, the file or the page is not found.
+    - **400**: If the file has not been extracted yet.
+    - **401**: If the extraction job does not belong to the app.
+    - **500**: If any other error occurs while reading the page.
+
+    """
+    try:
+        extraction_job = ExtractionJobs.safe_get(req.extraction_job_id)
+        if not extraction_job:
+            raise HTTPException(status_code=404, detail="Extraction job not found")
+
+        # Check if extraction_job is associated with the app_id
+        if extraction_job.app_id != app_id:
+            raise HTTPException(status_code=401, detail="Extraction job does not belong to the app")
+
+        extraction_job_file = ExtractionJobFiles.safe_get(req.extraction_job_id, req.file_name)
+        if not extraction_job_file:
+            raise HTTPException(status_code=404, detail="File not found")
+        if extraction_job_file.status != "COMPLETED":
+            raise HTTPException(status_code=400, detail="File is not extracted yet")
+
+        text_key = extracted_text_key(app_id, extraction_job_file)
+        file_entry = read_file_entry(s3_client, RESULTS_BUCKET_NAME, text_key)
+        if file_entry:
+            pages = ExtractedPages(s3_client, RESULTS_BUCKET_NAME, file_entry)
+        else:
+            # Results saved before page offsets were recorded are read whole
+            response = s3_client.get_object(Bucket=RESULTS_BUCKET_NAME, Key=text_key)
+            body = decode(response['Body'].read(), response.get('ContentEncoding'))
+            if ".jsonl" in text_key.split("/")[-1]:
+                pages = [json.loads(line) for line in body.splitlines() if line]
+            else:
+                pages = json.loads(body)["pages"]
+
+        if req.page_number > len(pages):
+            raise HTTPException(status_code=404, detail="Page not found")
+        page = pages[req.page_number - 1]
+        return ExtractionPageResponse(
+            extraction_job_id=req.extraction_job_id,
+            file_name=req.file_name,
+            page_number=req.page_number,
+            page_count=len(pages),
+            page_text=page["page_text"]
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error reading page {req.page_number} of {req.file_name}: {e}")
+        raise HTTPException(status_code=500, detail="Error getting page")
+
 
 
 # Get the status of a chunk job
@@ -1160,6 +1250,11 @@ async def list_chunking_jobs(app_id: str = Depends(get_app_id_from_token)):
     except Exception as e:
         raise HTTPException(status_code=500, detail="Error getting jobs")
 
+@app.post("/document/service/auth/invalidate", include_in_schema=False)
+async def invalidate_auth_cache(request: InvalidateAuthCacheRequest, _: None = Depends(verify_platform_client)):
+    app_client_resolver.invalidate(client_id=request.client_id, app_id=request.app_id)
+    return {"status": "INVALIDATED"}
+
 @app.get("/document/service/meta", include_in_schema=False)
 async def get_metadata():
     return app.openapi()
@@ -1175,7 +1270,7 @@ async def health_check():
 
 @app.on_event("startup")
 async def startup_event():
-    global session, s3_client, dynamodb, COGNITO_JWKS_URL
+    global session, s3_client, dynamodb, COGNITO_JWKS_URL, app_client_resolver
     
     if not ECS_METADATA_URL:
         raise HTTPException(status_code=500, detail="ECS_CONTAINER_METADATA_URI_V4 environment variable not set.")
@@ -1189,6 +1284,7 @@ async def startup_event():
         session = boto3.Session(region_name=region_name)
         s3_client = session.client('s3', config=retry_config)
         dynamodb = session.client('dynamodb', config=retry_config)
+        app_client_resolver = AppClientResolver(dynamodb, CLIENTS_TABLE)
 
         COGNITO_JWKS_URL = f'https://cognito-idp.{region_name}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json'
 
@@ -0,0 +1,103 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+CLIENT_ID_INDEX = os.getenv('CLIENT_ID_INDEX', 'client_id_index')
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', '60'))  # in seconds
+AUTH_CACHE_NEGATIVE_TTL = int(os.getenv('AUTH_CACHE_NEGATIVE_TTL', '10'))  # in seconds
+AUTH_CACHE_MAX_SIZE = int(os.getenv('AUTH_CACHE_MAX_SIZE', '10000'))
+# The admin backend's app client, the only one allowed to call the service endpoints such as auth cache invalidation
+PLATFORM_APP_CLIENT_ID = os.getenv('PLATFORM_APP_CLIENT_ID')
+
+
+def check_platform_client(client_id: Optional[str]):
+    """Raises a 403 unless client_id is the platform app client."""
+    if not PLATFORM_APP_CLIENT_ID or client_id != PLATFORM_APP_CLIENT_ID:
+        raise HTTPException(status_code=403, detail="Only the platform app client can call this endpoint")
+
+
+class AppClientResolver:
+    """Resolves Cognito app client IDs to platform app IDs.
+
+    Lookups go through the client_id GSI on the app clients table and are kept in
+    an in-process LRU cache with a TTL. Unknown client IDs are cached for a shorter
+    negative TTL so that bad tokens cannot force a DynamoDB read on every call.
+    """
+
+    def __init__(self, dynamodb_client, table_name, index_name=CLIENT_ID_INDEX, ttl=AUTH_CACHE_TTL,
+                 negative_ttl=AUTH_CACHE_NEGATIVE_TTL, max_size=AUTH_CACHE_MAX_SIZE):
+        self.dynamodb = dynamodb_client
+        self.table_name = table_name
+        self.index_name = index_name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_app_id(self, client_id: str) -> str:
+        """Returns the app ID for the client, raising a 401 if it is unknown or inactive."""
+        entry = self._get_cached(client_id)
+        if entry is None:
+            entry = self._lookup(client_id)
+            self._put(client_id, entry)
+
+        app_id, status = entry
+        if app_id is None:
+            raise HTTPException(status_code=401, detail="Client ID not found in DynamoDB")
+        if status == "inactive":
+            raise HTTPException(status_code=401, detail="App client is inactive")
+        return app_id
+
+    def invalidate(self, client_id: Optional[str] = None, app_id: Optional[str] = None):
+        """Drops cached entries for a client ID, an app ID, or both."""
+        if client_id is None and app_id is None:
+            raise ValueError("client_id or app_id is required")
+        with self._lock:
+            if client_id is not None:
+                self._cache.pop(client_id, None)
+            if app_id is not None:
+                for key in [key for key, (entry, _) in self._cache.items() if entry[0] == app_id]:
+                    del self._cache[key]
+
+    def _get_cached(self, client_id: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        with self._lock:
+            cached = self._cache.get(client_id)
+            if cached is None:
+                return None
+            entry, expires_at = cached
+            if expires_at <= time.monotonic():
+                del self._cache[client_id]
+                return None
+            self._cache.move_to_end(client_id)
+            return entry
+
+    def _put(self, client_id: str, entry: Tuple[Optional[str], Optional[str]]):
+        ttl = self.ttl if entry[0] is not None else self.negative_ttl
+        with self._lock:
+            self._cache[client_id] = (entry, time.monotonic() + ttl)
+            self._cache.move_to_end(client_id)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _lookup(self, client_id: str) -> Tuple[Optional[str], Optional[str]]:
+        response = self.dynamodb.query(
+            TableName=self.table_name,
+            IndexName=self.index_name,
+            KeyConditionExpression="client_id = :client_id",
+            ExpressionAttributeValues={":client_id": {"S": client_id}},
+            Limit=1
+        )
+        items = response.get('Items', [])
+        if not items:
+            logger.info(f"Client ID not found: {client_id}")
+            return None, None
+        item = items[0]
+        return item['app_id']['S'], item.get('status', {}).get('S', 'active')
@@ -48,6 +48,8 @@ class ExtractionJobFiles(Dyntastic):
     file_path: str
     file_id: str
     status: str = "PENDING"
+    # Key of the extracted text, which depends on the result format and encoding; unset for results saved before both
+    result_key: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.now)
 
 
@@ -121,6 +123,18 @@ class ExtractionJobFileRequest(BaseModel):
     extraction_job_id: str
     file_name: str
 
+class ExtractionPageRequest(BaseModel):
+    extraction_job_id: str
+    file_name: str
+    page_number: int = Field(ge=1)
+
+class ExtractionPageResponse(BaseModel):
+    extraction_job_id: str
+    file_name: str
+    page_number: int
+    page_count: int
+    page_text: str
+
 # {"job_id": job_id, "total_files": file_count, "status": "STARTED"}
 class StartExtractionJobResponse(BaseModel):
     extraction_job_id: str
@@ -163,5 +177,15 @@ class ExtractionJobStatusResponse(BaseModel):
     failed_file_count: int
     status: str
 
+class InvalidateAuthCacheRequest(BaseModel):
+    client_id: Optional[str] = None
+    app_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if not self.client_id and not self.app_id:
+            raise ValueError("client_id or app_id is required")
+        return self
+
 
 avoid_chars = ["&", "$", "@", "=", ";", "/", ":", "+", " ", ",", "?", "\\", "{", "}", "^", "]", "\"", ">", "[", "~", "<", "#", "|", "%"]
\ No newline at end of file
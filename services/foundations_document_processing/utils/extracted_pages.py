@@ -0,0 +1,81 @@
+import io
+import gzip
+import json
+import posixpath
+from collections.abc import Sequence
+from typing import Optional
+
+import zstandard
+from botocore.exceptions import ClientError
+
+
+def decode(data: bytes, content_encoding: Optional[str]) -> str:
+    """Decodes an extraction result object or part of one written with the given Content-Encoding."""
+    if content_encoding == "gzip":
+        data = gzip.decompress(data)
+    elif content_encoding == "zstd":
+        # Streamed zstd frames do not record their size, which the one-shot decompress needs
+        data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True).read()
+    return data.decode("utf-8")
+
+
+def read_file_entry(s3_client, bucket: str, extracted_text_key: str) -> Optional[dict]:
+    """Reads the metadata entry of the file whose extracted text is at extracted_text_key.
+
+    Returns None when the file has no page offsets, which is the case for results
+    saved before the page-delimited text object was written.
+    """
+    metadata_key = posixpath.join(posixpath.dirname(extracted_text_key), "metadata.json")
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=metadata_key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    file_entry = json.loads(response['Body'].read())["files"][0]
+    return file_entry if file_entry.get("page_offsets") is not None else None
+
+
+class ExtractedPages(Sequence):
+    """The pages of an extracted file, as {"page_number", "page_text"} dicts read on demand.
+
+    Iterating streams the page-delimited text object with one GET and decodes a page at
+    a time; indexing reads only the requested page with a ranged GET.
+    """
+
+    def __init__(self, s3_client, bucket: str, file_entry: dict):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = file_entry["page_text_key"]
+        self.encoding = file_entry.get("content_encoding")
+        self.offsets = file_entry["page_offsets"]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        offset, length = self.offsets[index]
+        page_text = ""
+        if length:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-{offset + length - 1}")
+            page_text = decode(response['Body'].read(), self.encoding)
+        return {"page_number": index + 1, "page_text": page_text}
+
+    def __iter__(self):
+        if not self.offsets:
+            return
+        body = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)['Body']
+        try:
+            position = 0
+            for page_number, (offset, length) in enumerate(self.offsets, start=1):
+                if offset > position:
+                    body.read(offset - position)
+                data = body.read(length)
+                position = offset + length
+                yield {"page_number": page_number, "page_text": decode(data, self.encoding) if length else ""}
+        finally:
+            body.close()
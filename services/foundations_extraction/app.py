@@ -1,17 +1,19 @@
 import json
 import logging
 import os
-import asyncio
 from fastapi import FastAPI, BackgroundTasks, HTTPException
 from pydantic import BaseModel
 import boto3
 from botocore.config import Config
 from utils.extractor import Extraction, ExtractedDocument
+from utils.sqs_consumer import SQSConsumer
+from utils.textract_jobs import TEXTRACT_TERMINAL_STATUSES, create_completion_channel
+from utils.native_extractors import INVALID_FILE_ERRORS, native_file_types
+from utils.pdf_text_layer import EXTRACTION_PDF_TEXT_LAYER
 import requests
 from models import *
 from dyntastic import A, transaction
-from concurrent.futures import ThreadPoolExecutor
-import threading
+from functools import partial
 
 
 # Configure structured logging
@@ -32,8 +34,9 @@ ECS_METADATA_URL = os.getenv("ECS_CONTAINER_METADATA_URI_V4", "")
 
 # Global variables
 retry_config = Config(retries={"max_attempts": MAX_RETRIES, "mode": "standard"})
-CHECK_INTERVAL = 60
-poll_task = None
+consumer = None
+completion_channel = None
+extraction = None
 
 app = FastAPI()
 
@@ -86,11 +89,13 @@ def update_job_entry(job_id: str, textract_job_id: str, status: str, dynamodb, a
     except Exception as e:
         logger.error(f"Error occurred while saving job entry: {e}")
 
-def update_job_file_entry(job_id: str, file_name: str, status: str, dynamodb):
+def update_job_file_entry(job_id: str, file_name: str, status: str, dynamodb, result_key=None):
     try:
         extraction_job_file = ExtractionJobFiles.get(job_id, file_name)
         if extraction_job_file:
             extraction_job_file.status = status
+            if result_key:
+                extraction_job_file.result_key = result_key
             extraction_job_file.save()
         else:
             raise Exception(f"Job file {file_name} not found in the database")
@@ -98,121 +103,136 @@ def update_job_file_entry(job_id: str, file_name: str, status: str, dynamodb):
     except Exception as e:
         logger.error(f"Error occurred while saving file entry: {e}")
 
-async def poll_sqs(extraction: Extraction, sqs_client, dynamodb, s3_client, semaphore):
-    logger.info("Polling SQS queue")
-    while True:
-        executor = ThreadPoolExecutor(max_workers=5)
+def extraction_completed(message) -> bool:
+    """True when an earlier delivery of the message already extracted its file."""
+    message_body = json.loads(message['Body'])
+    job_file = ExtractionJobFiles.safe_get(message_body.get('job_id'), message_body.get('file_path').split('/')[-1])
+    return job_file is not None and job_file.status == 'COMPLETED'
+
+def handle_extraction(message, extraction, dynamodb, s3_client):
+    """Extracts the file of one queue message. Returns True when the message should be deleted, or a future of that."""
+    message_body = json.loads(message['Body'])
+    file_path = message_body.get('file_path')
+    job_id = message_body.get('job_id')
+    app_id = message_body.get('app_id')
+    s3_path = f's3://{SOURCE_S3_BUCKET}/{file_path}'
+    file_name = file_path.split('/')[-1]
+    logger.info(f"Handle extraction for file {file_path}")
+
+    ## Get file type
+    file_type = file_path.split('.')[-1].lower()
+    textract_file_types = ['pdf', 'png', 'jpg', 'jpeg', 'tiff']
+    # Office documents, spreadsheets, HTML and text are extracted in process, without Textract
+    other_file_types = native_file_types()
+    if file_type == 'pdf' and EXTRACTION_PDF_TEXT_LAYER == 'auto':
+        # Born-digital PDFs are extracted from their text layer; only pages without one go to Textract
         try:
-            response = sqs_client.receive_message(
-                QueueUrl=QUEUE_URL,
-                MaxNumberOfMessages=5,
-                WaitTimeSeconds=0,
-                VisibilityTimeout=VISIBILITY_TIMEOUT
-            )
-            messages = response.get('Messages', [])
-            logger.info(f"Received {len(messages)} messages")
-            tasks = []
-            for message in messages:
-                await semaphore.acquire()
-                message_body = json.loads(message['Body'])
-                logger.info(f"Acquired semaphore for message {message_body}")
-                loop = asyncio.get_event_loop()
-                task = loop.run_in_executor(executor, handle_extraction, semaphore, message, extraction, dynamodb, s3_client, sqs_client)
-                logger.info(f"Task created for message {message_body}")
-                tasks.append(task)
-            
-            await asyncio.gather(*tasks)
-            await asyncio.sleep(5)
+            extracted_document, report = extraction.extract_pdf(SOURCE_S3_BUCKET, file_path)
+            logger.info(f"Text layer of {file_path}: {report['text_layer_pages']} of {report['page_count']} pages usable, "
+                        f"{report['textract_pages']} need Textract")
         except Exception as e:
-            logger.error(f"Error occurred: {e}")
-            await asyncio.sleep(5)
-
-def handle_extraction(semaphore, message, extraction, dynamodb, s3_client, sqs_client):
-    try:
-        message_body = json.loads(message['Body'])
-        file_path = message_body.get('file_path')
-        job_id = message_body.get('job_id')
-        app_id = message_body.get('app_id')
-        s3_path = f's3://{SOURCE_S3_BUCKET}/{file_path}'
-        file_name = file_path.split('/')[-1]
-        receipt_handle = message['ReceiptHandle']
-        logger.info(f"Handle extraction for file {file_path}")
-
-        ## Get file type
-        file_type = file_path.split('.')[-1].lower()
-        textract_file_types = ['pdf', 'png', 'jpg', 'jpeg', 'tiff']
-        other_file_types = ['txt', 'md', 'html', 'json', 'jsonl']
-        if file_type in textract_file_types:
-            textract_job_id = extraction.extract(s3_path)
-            try:
-                logger.info(f"Performing extraction for job {textract_job_id}")
-                extend_visibility_timeout(sqs_client, receipt_handle)
-                logger.info(f"Extended visibility timeout for message {message_body}")
-                extracted_document = extraction.get_document(textract_job_id, file_name)
-                logger.info(f"Extracted document for job {textract_job_id}")
-                extracted_document.s3_save(app_id, job_id, file_path, RESULTS_S3_BUCKET, s3_client)
-                logger.info(f"Saved results for job {job_id}")
-                file_name = file_path.split('/')[-1]
-
-                update_job_file_entry(job_id, file_name, 'COMPLETED', dynamodb)
-                update_job_entry(job_id, textract_job_id, 'COMPLETED', dynamodb, app_id, extraction)
-
-                # update_job_entry(job_id, textract_job_id, 'COMPLETED', dynamodb)
-                
-                logger.info(f"Extraction completed for job {job_id}")
-                sqs_client.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
-            except Exception as e:
-                file_name = file_path.split('/')[-1]
-                
-                update_job_file_entry(job_id, file_name, 'FAILED', dynamodb)
-                update_job_entry(job_id, textract_job_id, 'FAILED', dynamodb, app_id, extraction)
-                # update_jobs_map(job_id, app_id, 'FAILED', dynamodb, file_name, None, extraction)
-                logger.error(f"Error occurred during extraction for job {job_id}: {e}")
-        elif file_type in other_file_types:
-            logger.info(f"Performing extraction")
-            extend_visibility_timeout(sqs_client, receipt_handle)
-            extracted_document = extraction.extract_nonpdf(SOURCE_S3_BUCKET, file_path)
-            extracted_document.s3_save(app_id, job_id, file_path, RESULTS_S3_BUCKET, s3_client)
-            file_name = file_path.split('/')[-1]
-
-            update_job_file_entry(job_id, file_name, 'COMPLETED', dynamodb)
-            # update_jobs_map(job_id,app_id, 'COMPLETED', dynamodb, file_name, extracted_document, extraction)
+            logger.warning(f"Could not extract {file_path} from its text layer, sending it to Textract: {e}")
+            extracted_document = None
+        if extracted_document is not None:
+            saved = extracted_document.s3_save(app_id, job_id, file_path, RESULTS_S3_BUCKET, s3_client)
+            update_job_file_entry(job_id, file_name, 'COMPLETED', dynamodb, saved["extracted_text_key"])
             update_job_entry(job_id, file_name, 'COMPLETED', dynamodb, app_id, extraction)
-            
-            sqs_client.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
+            return True
+    if file_type in textract_file_types:
+        # Only submits the Textract job; handle_textract_completion saves the results when it finishes
+        textract_job_id = extraction.extract(s3_path, job_tag=job_id, notification_channel=completion_channel.notification_channel())
+        logger.info(f"Started Textract job {textract_job_id} for file {file_path}")
+
+        extraction_job_file = ExtractionJobFiles.safe_get(job_id, file_name)
+        if extraction_job_file:
+            extraction_job_file.status = 'IN_PROGRESS'
+            extraction_job_file.textract_job_id = textract_job_id
+            extraction_job_file.save()
         else:
-            logger.error(f"Unsupported file type: {file_type}")
-            sqs_client.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
+            logger.error(f"Job file {file_name} not found in the database")
+
+        completion = {
+            "JobId": textract_job_id,
+            "JobTag": job_id,
+            "DocumentLocation": {"S3Bucket": SOURCE_S3_BUCKET, "S3ObjectName": file_path}
+        }
+        # A job that finished before its id was saved had its completion dropped, and a redelivered message
+        # gets back the job an earlier delivery started, which Textract never notifies about again
+        status = extraction.job_status(textract_job_id)
+        if status in TEXTRACT_TERMINAL_STATUSES:
+            return handle_textract_completion({**completion, "Status": status}, extraction, dynamodb, s3_client)
+        # The poll channel returns a future of the completion's handling, so the message is held until then
+        handled = completion_channel.track(completion)
+        return handled if handled is not None else True
+    elif file_type in other_file_types:
+        logger.info(f"Performing extraction")
+        try:
+            extracted_document = extraction.extract_nonpdf(SOURCE_S3_BUCKET, file_path)
+            # Pages are parsed as they are saved
+            saved = extracted_document.s3_save(app_id, job_id, file_path, RESULTS_S3_BUCKET, s3_client)
+        except INVALID_FILE_ERRORS as e:
+            # A file that cannot be parsed fails the same way on every delivery
+            logger.error(f"Could not extract file {file_path}: {e}")
             update_job_file_entry(job_id, file_name, 'FAILED', dynamodb)
             update_job_entry(job_id, file_name, 'FAILED', dynamodb, app_id, extraction)
-            
-            # update_jobs_map(job_id, app_id, 'FAILED', dynamodb, file_name, None, extraction)           
-    finally:
-        semaphore.release()
+            return True
+        file_name = file_path.split('/')[-1]
+
+        update_job_file_entry(job_id, file_name, 'COMPLETED', dynamodb, saved["extracted_text_key"])
+        # update_jobs_map(job_id,app_id, 'COMPLETED', dynamodb, file_name, extracted_document, extraction)
+        update_job_entry(job_id, file_name, 'COMPLETED', dynamodb, app_id, extraction)
+        
+        return True
+    else:
+        logger.error(f"Unsupported file type: {file_type}")
+        update_job_file_entry(job_id, file_name, 'FAILED', dynamodb)
+        update_job_entry(job_id, file_name, 'FAILED', dynamodb, app_id, extraction)
+        
+        # update_jobs_map(job_id, app_id, 'FAILED', dynamodb, file_name, None, extraction)           
+        return True
+
+def handle_textract_completion(completion, extraction, dynamodb, s3_client) -> bool:
+    """Saves the results of a finished Textract job. Returns True when the completion is handled."""
+    textract_job_id = completion['JobId']
+    job_id = completion.get('JobTag')
+    file_path = completion['DocumentLocation']['S3ObjectName']
+    file_name = file_path.split('/')[-1]
+
+    extraction_job_file = ExtractionJobFiles.safe_get(job_id, file_name) if job_id else None
+    if extraction_job_file is None or extraction_job_file.textract_job_id != textract_job_id:
+        logger.warning(f"Ignoring completion of Textract job {textract_job_id}: no file is waiting for it")
+        return True
+    if extraction_job_file.status == 'COMPLETED':
+        logger.info(f"Ignoring duplicate completion of Textract job {textract_job_id}")
+        return True
+
+    extraction_job = ExtractionJobs.safe_get(job_id)
+    app_id = extraction_job.app_id if extraction_job else None
+    if completion['Status'] not in ('SUCCEEDED', 'PARTIAL_SUCCESS'):
+        logger.error(f"Textract job {textract_job_id} for file {file_path} finished with status {completion['Status']}")
+        update_job_file_entry(job_id, file_name, 'FAILED', dynamodb)
+        update_job_entry(job_id, textract_job_id, 'FAILED', dynamodb, app_id, extraction)
+        return True
 
-def extend_visibility_timeout(sqs_client, receipt_handle):
     try:
-        sqs_client.change_message_visibility(
-            QueueUrl=QUEUE_URL,
-            ReceiptHandle=receipt_handle,
-            VisibilityTimeout=VISIBILITY_TIMEOUT
-        )
+        extracted_document = extraction.get_document(textract_job_id, file_name)
+        logger.info(f"Extracted document for job {textract_job_id}")
+        saved = extracted_document.s3_save(app_id, job_id, file_path, RESULTS_S3_BUCKET, s3_client)
+        logger.info(f"Saved results for job {job_id}")
+
+        update_job_file_entry(job_id, file_name, 'COMPLETED', dynamodb, saved["extracted_text_key"])
+        update_job_entry(job_id, textract_job_id, 'COMPLETED', dynamodb, app_id, extraction)
+        logger.info(f"Extraction completed for job {job_id}")
+        return True
     except Exception as e:
-        logger.error(f"FAILED to extend visibility timeout: {e}")
-
-async def ensure_task_running(extraction: Extraction, sqs_client, dynamodb, s3_client):
-    global poll_task
-    logger.info("Starting background task")
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
-    while True:
-        if poll_task is None or poll_task.done():
-            logger.info("Polling task not running or done, starting new task")
-            poll_task = asyncio.create_task(poll_sqs(extraction, sqs_client, dynamodb, s3_client, semaphore))
-        await asyncio.sleep(CHECK_INTERVAL)
+        update_job_file_entry(job_id, file_name, 'FAILED', dynamodb)
+        update_job_entry(job_id, textract_job_id, 'FAILED', dynamodb, app_id, extraction)
+        logger.error(f"Error occurred during extraction for job {job_id}: {e}")
+        return False
 
 @app.on_event("startup")
 async def startup_event():
-    global REGION_NAME
+    global REGION_NAME, consumer, completion_channel, extraction
 
     if not ECS_METADATA_URL:
         raise HTTPException(status_code=500, detail="ECS_CONTAINER_METADATA_URI_V4 environment variable not set.")
@@ -232,7 +252,36 @@ async def startup_event():
         logger.info(f"Job Results Table: {JOB_RESULTS_TABLE}")
         logger.info(f"Queue URL: {QUEUE_URL}")
 
-        asyncio.create_task(ensure_task_running(extraction, sqs_client, dynamodb_client, s3_client))
+        # Textract jobs are submitted by the consumer and collected from the completion channel
+        completion_channel = create_completion_channel(sqs_client, extraction.textract_client, MAX_CONCURRENT_TASKS, VISIBILITY_TIMEOUT)
+        completion_channel.start(partial(handle_textract_completion, extraction=extraction, dynamodb=dynamodb_client, s3_client=s3_client))
+
+        consumer = SQSConsumer(
+            sqs_client,
+            QUEUE_URL,
+            partial(handle_extraction, extraction=extraction, dynamodb=dynamodb_client, s3_client=s3_client),
+            max_concurrency=MAX_CONCURRENT_TASKS,
+            visibility_timeout=VISIBILITY_TIMEOUT,
+            is_completed=extraction_completed,
+            name="extraction"
+        )
+        consumer.start()
 
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving ECS metadata: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if consumer:
+        await consumer.stop()
+    if completion_channel:
+        await completion_channel.stop()
+    if extraction:
+        extraction.close()
+
+@app.get("/extraction/service/metrics", include_in_schema=False)
+async def get_service_metrics():
+    return {
+        "consumer": consumer.stats() if consumer else None,
+        "textract_completions": completion_channel.stats() if completion_channel else None
+    }
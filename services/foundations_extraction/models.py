@@ -39,6 +39,10 @@ class ExtractionJobFiles(Dyntastic):
     file_path: str
     file_id: str
     status: str = "PENDING"
+    # Set while the file's Textract job runs, so its completion can be matched and a redelivery does not start another
+    textract_job_id: Optional[str] = None
+    # Key of the extracted text, which depends on the result format and encoding; unset for results saved before both
+    result_key: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.now)
     
 
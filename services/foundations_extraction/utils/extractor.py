@@ -1,143 +1,358 @@
+import io
+import os
 import boto3
 import re
+import shutil
+import tempfile
 import uuid
 import json
-from textractor import Textractor
-from textractor.data.constants import TextractFeatures, TextractAPI
-from textractor.entities.lazy_document import LazyDocument
+import hashlib
+import threading
+import multiprocessing
+import concurrent.futures
+from collections import defaultdict
+from textractor.data.constants import TextractFeatures
+from textractor.parsers.response_parser import parse
 from textractor.data.text_linearization_config import TextLinearizationConfig
 
-class ExtractedDocument:
-    def __init__(self, pages=None, tables=None, all_text=None, input_path=None):
-        self.pages = pages or []
-        self.tables = tables or {}
-        self.all_text = all_text
-        self.input_path = input_path
+from utils.native_extractors import get_extractor
+from utils.pdf_text_layer import (EXTRACTION_PDF_MAX_TEXTRACT_PAGES, PROBE_BATCH_SIZE, TEXT_LAYER, TEXTRACT,
+                                  TEXTRACT_SYNC_MAX_BYTES, page_count, probe_pages, single_page_pdf)
+from utils.result_writer import (EXTRACTION_RESULTS_FORMAT, EXTRACTION_RESULTS_ENCODING, RESULT_FORMATS,
+                                 PAGE_TEXT_CONTENT_TYPE, S3StreamWriter, page_text_key, result_key)
 
-    def s3_save(self, app_id, job_id, file_name, bucket, s3_client):
-        file_name = file_name.split('/')[-1]
+# Pages are linearized in this many processes, or in the calling thread when it is 1
+EXTRACTION_LINEARIZE_WORKERS = int(os.getenv('EXTRACTION_LINEARIZE_WORKERS', str(os.cpu_count() or 1)))
+TEXTRACT_RESULTS_PAGE_SIZE = 1000  # blocks per GetDocumentAnalysis call, the API maximum
+# Files extracted in process are held in memory up to this size and spooled to disk above it
+EXTRACTION_SPOOL_SIZE = int(os.getenv('EXTRACTION_SPOOL_SIZE', str(32 * 1024 * 1024)))
 
-        extracted_text_content = {
-            "job_id": job_id,
-            "file_name": file_name,
-            "pages": [{"page_number": i + 1, "page_text": page} for i, page in enumerate(self.pages)]
-        }
+LINEARIZATION_CONFIG = TextLinearizationConfig(
+    hide_figure_layout=True,
+    title_prefix="<title>",
+    title_suffix="</title>",
+    text_prefix="<text>",
+    text_suffix="</text>",
+    section_header_prefix="<header>",
+    section_header_suffix="</header>",
+    table_prefix="<table>",
+    table_suffix="</table>",
+    # table_linearization_format="HTML",
+    list_element_prefix="<list_element>",
+    list_element_suffix="</list_element>",
+    key_value_layout_prefix="<key_value>",
+    key_value_layout_suffix="</key_value>",
+    key_prefix="<key>",
+    key_suffix="</key>",
+    value_prefix="<value>",
+    value_suffix="</value>",
+    hide_footer_layout=True,
+    hide_page_num_layout=True
+    # table_row_prefix = "<tr>",
+    # table_row_suffix = "</tr>",
+    # table_cell_prefix = "<td>",
+    # table_cell_suffix = "</td>"
+)
 
-        extracted_tables_content = {
-            "job_id": job_id,
-            "file_name": file_name,
-            "pages": [{"page_number": i + 1, "tables": self.tables.get(i + 1, [])} for i in range(len(self.pages))]
-        }
 
-        extracted_text_key = f"{app_id}/{job_id}/{file_name}/extracted_text.json"
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=extracted_text_key,
-            Body=json.dumps(extracted_text_content),
-            ContentType="application/json",
-        )
+def extract_tables_from_page(page_text):
+    tables = re.findall(r"<table>.*?</table>", page_text, re.DOTALL)
+    page_no_tables_text = re.sub(r"<table>.*?</table>", "", page_text, flags=re.DOTALL)
+    tables_text = [table.strip() for table in tables]
+    return page_no_tables_text, tables_text
 
-        extracted_tables_key = f"{app_id}/{job_id}/{file_name}/extracted_tables.json"
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=extracted_tables_key,
-            Body=json.dumps(extracted_tables_content),
-            ContentType="application/json",
-        )
 
-        metadata_key = f"{app_id}/{job_id}/{file_name}/metadata.json"
-        try:
-            metadata_obj = s3_client.get_object(Bucket=bucket, Key=metadata_key)
-            metadata = json.loads(metadata_obj['Body'].read().decode('utf-8'))
-        except s3_client.exceptions.NoSuchKey:
-            metadata = {"job_id": job_id, "files": []}
+class PageRecordWriter:
+    """Serializes page records one at a time, as JSON Lines or as the {"job_id", "file_name", "pages"} object."""
+
+    def __init__(self, writer, result_format, job_id, file_name):
+        self.writer = writer
+        self.jsonl = result_format == "jsonl"
+        self.count = 0
+        if not self.jsonl:
+            writer.write('{"job_id": ' + json.dumps(job_id) + ', "file_name": ' + json.dumps(file_name) + ', "pages": [')
+
+    def write(self, record):
+        if self.jsonl:
+            self.writer.write(json.dumps(record, separators=(",", ":")) + "\n")
+        else:
+            self.writer.write((", " if self.count else "") + json.dumps(record))
+        self.count += 1
+
+    def close(self):
+        if not self.jsonl:
+            self.writer.write("]}")
+
+
+def linearize_page(blocks):
+    """Linearizes the Textract blocks of one page and returns the page text and its tables.
+
+    Runs in the linearization pool, so it only takes and returns picklable values.
+    """
+    document = parse({"Blocks": blocks, "DocumentMetadata": {"Pages": 1}})
+    page_text = document.pages[0].get_text(config=LINEARIZATION_CONFIG)
+    return page_text, extract_tables_from_page(page_text)[1]
+
+
+class ExtractedDocument:
+    def __init__(self, pages=None, input_path=None, page_sources=None, report=None):
+        # (page text, tables) of each page in order; extractors pass a generator, so pages
+        # are produced as s3_save writes them and can only be read once
+        self.pages = pages if pages is not None else iter([("", [])])
+        self.input_path = input_path
+        # Where each page was extracted from, text_layer or textract, by page number - 1
+        self.page_sources = page_sources
+        # The text layer probe of each page, saved as extraction_report.json
+        self.report = report
+
+    def s3_save(self, app_id, job_id, file_name, bucket, s3_client, result_format=EXTRACTION_RESULTS_FORMAT,
+                encoding=EXTRACTION_RESULTS_ENCODING):
+        """Streams the text and tables results to S3 page by page, in one pass over the pages, then writes the file's metadata.
+
+        The page texts are also written back to back to a page-delimited text object, with
+        each page's byte offset and length kept in the metadata's page_offsets, so a page can
+        be read with one ranged GET. Compressed, each page is its own gzip member or zstd frame.
+        metadata.json is written last and once, so its presence means the results are complete.
+        Textract and PDF results also record the source of each page, and the text layer report when one was made.
+        Returns the metadata entry of the file.
+        """
+        file_name = file_name.split('/')[-1]
+        prefix = f"{app_id}/{job_id}/{file_name}"
+        content_type = RESULT_FORMATS[result_format][1]
+
+        extracted_text_key = result_key(prefix, "extracted_text", result_format, encoding)
+        extracted_tables_key = result_key(prefix, "extracted_tables", result_format, encoding)
+        extracted_pages_key = page_text_key(prefix, encoding)
+        page_offsets = []
+        with S3StreamWriter(s3_client, bucket, extracted_text_key, content_type, encoding) as text_writer, \
+                S3StreamWriter(s3_client, bucket, extracted_tables_key, content_type, encoding) as tables_writer, \
+                S3StreamWriter(s3_client, bucket, extracted_pages_key, PAGE_TEXT_CONTENT_TYPE, encoding) as pages_writer:
+            text_records = PageRecordWriter(text_writer, result_format, job_id, file_name)
+            table_records = PageRecordWriter(tables_writer, result_format, job_id, file_name)
+            for page_number, (page_text, tables) in enumerate(self.pages, start=1):
+                text_records.write({"page_number": page_number, "page_text": page_text})
+                table_records.write({"page_number": page_number, "tables": tables})
+                offset = pages_writer.size
+                pages_writer.write(page_text)
+                pages_writer.end_frame()
+                page_offsets.append([offset, pages_writer.size - offset])
+            text_records.close()
+            table_records.close()
 
-        metadata["files"].append({
+        file_entry = {
             "file_name": file_name,
             "extracted_text_key": extracted_text_key,
-            "extracted_tables_key": extracted_tables_key
-        })
-
+            "extracted_tables_key": extracted_tables_key,
+            "format": result_format,
+            "content_encoding": encoding,
+            "page_count": len(page_offsets),
+            "page_text_key": extracted_pages_key,
+            # [byte offset, byte length] in page_text_key of each page, by page number - 1
+            "page_offsets": page_offsets
+        }
+        if self.page_sources is not None:
+            file_entry["page_sources"] = self.page_sources
+        if self.report is not None:
+            file_entry["report_key"] = f"{prefix}/extraction_report.json"
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=file_entry["report_key"],
+                Body=json.dumps({"job_id": job_id, "file_name": file_name, **self.report}),
+                ContentType="application/json",
+            )
         s3_client.put_object(
             Bucket=bucket,
-            Key=metadata_key,
-            Body=json.dumps(metadata),
+            Key=f"{prefix}/metadata.json",
+            Body=json.dumps({"job_id": job_id, "files": [file_entry]}),
             ContentType="application/json",
         )
+        return file_entry
 
 class Extraction:
-    def __init__(self, region_name):
+    def __init__(self, region_name, linearize_workers=EXTRACTION_LINEARIZE_WORKERS):
         self.region_name = region_name
+        self.textract_client = boto3.client("textract", region_name=region_name)
+        self.linearize_workers = linearize_workers
+        self._linearize_pool = None
+        self._lock = threading.Lock()
 
-    def extract(self, document_path):
-        extractor = Textractor(region_name=self.region_name)
-        client_request_token = str(uuid.uuid4())
-        document = extractor.start_document_analysis(
-            file_source=document_path,
-            features=[TextractFeatures.LAYOUT, TextractFeatures.TABLES],
-            client_request_token=client_request_token,
-            save_image=False,
-        )
-        return document.job_id
+    def extract(self, document_path, job_tag=None, notification_channel=None):
+        """Starts a Textract analysis of an s3:// document and returns the Textract job id without waiting for it.
+
+        The same document and job tag always use the same request token, so a redelivered
+        message gets the job that was already started instead of starting another one.
+        """
+        bucket, key = document_path[len("s3://"):].split("/", 1)
+        params = {
+            "DocumentLocation": {"S3Object": {"Bucket": bucket, "Name": key}},
+            "FeatureTypes": [TextractFeatures.LAYOUT.name, TextractFeatures.TABLES.name],
+            "ClientRequestToken": hashlib.sha256(f"{job_tag}\n{document_path}".encode("utf-8")).hexdigest()[:64] if job_tag else str(uuid.uuid4()),
+        }
+        if job_tag:
+            params["JobTag"] = job_tag
+        if notification_channel:
+            params["NotificationChannel"] = notification_channel
+        response = self.textract_client.start_document_analysis(**params)
+        return response["JobId"]
+
+    def job_status(self, job_id):
+        """The current status of a Textract analysis job."""
+        return self.textract_client.get_document_analysis(JobId=job_id, MaxResults=1)["JobStatus"]
 
     def extract_nonpdf(self, s3_bucket, s3_key):
-        # read s3 object
+        """Extracts a file in process with the native extractor registered for its file type.
+
+        The file is read into memory, or spooled to a temporary file when it is larger than
+        EXTRACTION_SPOOL_SIZE, and the extractor streams its pages from there as the document
+        is saved, so parse errors are raised by s3_save.
+        """
+        file_name = s3_key.split("/")[-1]
+        file_type = file_name.split(".")[-1].lower()
+        extractor = get_extractor(file_type)
+        if extractor is None:
+            raise ValueError(f"No native extractor for file type: {file_type}")
+
         s3_client = boto3.client("s3", region_name=self.region_name)
         s3_obj = s3_client.get_object(Bucket=s3_bucket, Key=s3_key)
-        file_content = s3_obj["Body"].read()
+        if s3_obj["ContentLength"] <= EXTRACTION_SPOOL_SIZE:
+            stream = io.BytesIO(s3_obj["Body"].read())
+        else:
+            stream = tempfile.TemporaryFile()
+            shutil.copyfileobj(s3_obj["Body"], stream)
+            stream.seek(0)
+
+        def pages():
+            with stream:
+                empty = True
+                for page in extractor(stream):
+                    empty = False
+                    yield page
+                if empty:
+                    yield "", []
+
+        return ExtractedDocument(pages=pages(), input_path=file_name)
+
+    def extract_pdf(self, s3_bucket, s3_key, max_textract_pages=EXTRACTION_PDF_MAX_TEXTRACT_PAGES):
+        """Extracts a PDF from its text layer, sending only the pages without a usable one to Textract.
+
+        The text layer is probed in batches of pages in the linearization pool. Pages that need
+        Textract are analyzed one at a time with AnalyzeDocument, as single-page PDFs, and
+        linearized like the results of a Textract job. Returns the document and the report of
+        the probe; the document is None when more than max_textract_pages pages need Textract,
+        and the PDF is then better analyzed as one Textract job.
+        """
         file_name = s3_key.split("/")[-1]
-        if isinstance(file_content, bytes):
-            file_content = file_content.decode("utf-8")
-        pages = [file_content]
-        return ExtractedDocument(pages=pages, tables={}, all_text=file_content, input_path=file_name)
+        s3_client = boto3.client("s3", region_name=self.region_name)
+        # Pool workers open the file by name, so it is spooled to disk rather than held in memory
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+            s3_client.download_fileobj(s3_bucket, s3_key, pdf_file)
+            pdf_file.flush()
+            last_page = page_count(pdf_file.name)
+            batches = [self._submit(probe_pages, pdf_file.name, first, min(first + PROBE_BATCH_SIZE - 1, last_page))
+                       for first in range(1, last_page + 1, PROBE_BATCH_SIZE)]
+            probes = [probe for batch in batches for probe in batch.result()]
+            textract_pages = [probe["page_number"] for probe in probes if probe["source"] == TEXTRACT]
+            report = {
+                "page_count": len(probes),
+                "text_layer_pages": len(probes) - len(textract_pages),
+                "textract_pages": len(textract_pages),
+                "pages": [{key: value for key, value in probe.items() if key != "page_text"} for probe in probes],
+            }
+            if len(textract_pages) > max_textract_pages:
+                return None, report
+
+            linearized = {}
+            for page_number in textract_pages:
+                page_pdf = single_page_pdf(pdf_file.name, page_number)
+                if len(page_pdf) > TEXTRACT_SYNC_MAX_BYTES:
+                    return None, report
+                response = self.textract_client.analyze_document(
+                    Document={"Bytes": page_pdf},
+                    FeatureTypes=[TextractFeatures.LAYOUT.name, TextractFeatures.TABLES.name])
+                linearized[page_number] = self._submit(linearize_page, response["Blocks"])
+
+        def pages():
+            for probe in probes:
+                if probe["source"] == TEXTRACT:
+                    yield linearized.pop(probe["page_number"]).result()
+                else:
+                    # Pages with a table went to Textract, so text layer pages have none
+                    yield probe.pop("page_text"), []
+            if not probes:
+                yield "", []
+
+        return ExtractedDocument(pages=pages(), input_path=file_name,
+                                 page_sources=[probe["source"] for probe in probes] or [TEXT_LAYER], report=report), report
 
     def extract_tables_from_page(self, page_text):
-        tables = re.findall(r"<table>.*?</table>", page_text, re.DOTALL)
-        page_no_tables_text = re.sub(r"<table>.*?</table>", "", page_text, flags=re.DOTALL)
-        tables_text = [table.strip() for table in tables]
-        return page_no_tables_text, tables_text
+        return extract_tables_from_page(page_text)
 
     def get_document(self, job_id, file_name):
-        textract_client = boto3.client("textract", region_name=self.region_name)
-        lazy_doc = LazyDocument(
-            job_id=job_id, textract_client=textract_client, api=TextractAPI.ANALYZE
-        )
+        """Reads the results of a finished Textract job and linearizes them page by page.
 
-        config = TextLinearizationConfig(
-            hide_figure_layout=True,
-            title_prefix="<title>",
-            title_suffix="</title>",
-            text_prefix="<text>",
-            text_suffix="</text>",
-            section_header_prefix="<header>",
-            section_header_suffix="</header>",
-            table_prefix="<table>",
-            table_suffix="</table>",
-            # table_linearization_format="HTML",
-            list_element_prefix="<list_element>",
-            list_element_suffix="</list_element>",
-            key_value_layout_prefix="<key_value>",
-            key_value_layout_suffix="</key_value>",
-            key_prefix="<key>",
-            key_suffix="</key>",
-            value_prefix="<value>",
-            value_suffix="</value>",
-            hide_footer_layout=True,
-            hide_page_num_layout=True
-            # table_row_prefix = "<tr>",
-            # table_row_suffix = "</tr>",
-            # table_cell_prefix = "<td>",
-            # table_cell_suffix = "</td>"
-        )
+        GetDocumentAnalysis results are paginated with NextToken, so they are read in order.
+        The next result page is always requested on a prefetch thread while the current one
+        is processed, and each document page is linearized as soon as the blocks of the next
+        page arrive, so linearization overlaps with fetching the rest of the results, inline
+        as well as in the linearization pool.
+        """
+        page_blocks = defaultdict(list)
+        linearized = {}
+        late_pages = set()
+        current_page = None
+
+        params = {"JobId": job_id, "MaxResults": TEXTRACT_RESULTS_PAGE_SIZE}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="textract-results") as prefetch:
+            next_response = prefetch.submit(self.textract_client.get_document_analysis, **params)
+            while next_response is not None:
+                response = next_response.result()
+                if response["JobStatus"] not in ("SUCCEEDED", "PARTIAL_SUCCESS"):
+                    raise RuntimeError(f"Textract job {job_id} is {response['JobStatus']}: {response.get('StatusMessage', '')}")
+                next_response = None
+                if response.get("NextToken"):
+                    next_response = prefetch.submit(self.textract_client.get_document_analysis,
+                                                    **{**params, "NextToken": response["NextToken"]})
+                for block in response["Blocks"]:
+                    page_number = block.get("Page", 1)
+                    page_blocks[page_number].append(block)
+                    if page_number in linearized:
+                        # Textract returns blocks in page order; this only guards against a page split out of order
+                        late_pages.add(page_number)
+                    elif page_number != current_page:
+                        if current_page is not None:
+                            linearized[current_page] = self._linearize(page_blocks[current_page])
+                        current_page = page_number
+        for page_number in sorted(late_pages | (set(page_blocks) - set(linearized))):
+            linearized[page_number] = self._linearize(page_blocks[page_number])
+
+        page_numbers = sorted(page_blocks)
+        page_blocks.clear()
+
+        def pages():
+            for page_number in page_numbers:
+                yield linearized.pop(page_number).result()
+
+        return ExtractedDocument(pages=pages(), input_path=file_name, page_sources=[TEXTRACT] * len(page_numbers))
+
+    def close(self):
+        if self._linearize_pool:
+            self._linearize_pool.shutdown(wait=False)
+
+    def _linearize(self, blocks) -> concurrent.futures.Future:
+        return self._submit(linearize_page, blocks)
 
-        e_pages = []
-        all_text = ""
-        all_tables = {}
-        for page_number, page in enumerate(lazy_doc.pages, start=1):
-            page_text = page.get_text(config=config)
-            page_no_tables_text, tables = self.extract_tables_from_page(page_text)
-            all_text += "<page>" + page_text + "</page>"
-            all_tables[page_number] = tables
-            e_pages.append(page_text)
-
-        return ExtractedDocument(pages=e_pages, tables=all_tables, all_text=all_text, input_path=file_name)
+    def _submit(self, fn, *args) -> concurrent.futures.Future:
+        """Runs fn in the linearization pool, or right away in the calling thread without one."""
+        if self.linearize_workers <= 1:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._lock:
+            if self._linearize_pool is None:
+                # spawn rather than fork, since the service process runs boto3 clients and consumer threads
+                self._linearize_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.linearize_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._linearize_pool.submit(fn, *args)
@@ -0,0 +1,450 @@
+import io
+import os
+import csv
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Rows of a CSV file or worksheet per logical page; each page repeats the header row
+EXTRACTION_ROWS_PER_PAGE = int(os.getenv('EXTRACTION_ROWS_PER_PAGE', '500'))
+READ_SIZE = 64 * 1024
+
+# An extractor reads a file and yields its logical pages as (page text, tables on the page). The page
+# text uses the same element tags as Textract results, with tables inlined as <table> elements.
+Page = Tuple[str, List[str]]
+NativeExtractor = Callable[[BinaryIO], Iterator[Page]]
+
+_EXTRACTORS: Dict[str, NativeExtractor] = {}
+
+# Raised by extractors for files that are corrupt or not what their extension says
+INVALID_FILE_ERRORS = (ValueError, KeyError, IndexError, zipfile.BadZipFile, ET.ParseError, csv.Error)
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+S = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def register_extractor(*file_types: str):
+    """Registers the decorated function as the extractor of the given file extensions."""
+    def register(extractor: NativeExtractor) -> NativeExtractor:
+        for file_type in file_types:
+            _EXTRACTORS[file_type] = extractor
+        return extractor
+    return register
+
+
+def get_extractor(file_type: str) -> Optional[NativeExtractor]:
+    return _EXTRACTORS.get(file_type.lower())
+
+
+def native_file_types() -> List[str]:
+    return sorted(_EXTRACTORS)
+
+
+def _element(tag: str, text: str) -> str:
+    return f"<{tag}>{text}</{tag}>"
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _table(rows: List[List[str]]) -> str:
+    """Renders rows like Textract's plaintext tables: tab separated cells, one row per line."""
+    return "<table>" + "\n".join("\t".join(_clean(cell) for cell in row) for row in rows) + "</table>"
+
+
+def _paged_rows(rows: Iterator[List[str]], heading: Optional[str] = None) -> Iterator[Page]:
+    """Splits rows into pages of EXTRACTION_ROWS_PER_PAGE rows, repeating the first row as a header."""
+    header, page_rows = None, []
+
+    def page():
+        table = _table(([header] if header is not page_rows[0] else []) + page_rows)
+        return "\n".join(([_element("header", heading)] if heading else []) + [table]), [table]
+
+    for row in rows:
+        if header is None:
+            header = row
+        page_rows.append(row)
+        if len(page_rows) >= EXTRACTION_ROWS_PER_PAGE:
+            yield page()
+            page_rows = []
+    if page_rows:
+        yield page()
+
+
+@register_extractor("txt", "md", "json", "jsonl")
+def extract_text(stream: BinaryIO) -> Iterator[Page]:
+    yield stream.read().decode("utf-8"), []
+
+
+@register_extractor("csv", "tsv")
+def extract_csv(stream: BinaryIO, delimiter=None) -> Iterator[Page]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+    if delimiter is None:
+        sample = text.read(READ_SIZE)
+        text.seek(0)
+        delimiter = "\t" if sample.count("\t") > sample.count(",") else ","
+    rows = (row for row in csv.reader(text, delimiter=delimiter) if any(cell.strip() for cell in row))
+    yield from _paged_rows(rows)
+
+
+def _relationships(archive: zipfile.ZipFile, part: str) -> Dict[str, str]:
+    """Maps the relationship ids of an OOXML part to the paths of their targets."""
+    rels = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+    targets = {}
+    for rel in ET.fromstring(archive.read(rels)).iter(f"{PKG_REL}Relationship"):
+        target = rel.get("Target")
+        targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(
+            posixpath.join(posixpath.dirname(part), target))
+    return targets
+
+
+class _DocxTable:
+    def __init__(self, depth: int):
+        # Paragraphs open around the table, more than none when it sits in a text box
+        self.depth = depth
+        self.rows = []
+        self.row = []
+        self.cell = []
+
+
+class _DocxParagraph:
+    def __init__(self):
+        self.text = []
+        self.style = None
+        self.listed = False
+        self.break_before = False
+        self.break_after = False
+
+
+@register_extractor("docx")
+def extract_docx(stream: BinaryIO) -> Iterator[Page]:
+    """Reads word/document.xml as a stream of elements.
+
+    Pages break where Word last rendered a page break, at explicit page breaks and at
+    section breaks. Title and heading styles become <title> and <header>, numbered and
+    list-styled paragraphs <list_element>; nested tables are flattened into the cell
+    holding them.
+    """
+    elements, tables = [], []
+    # Text boxes nest paragraphs inside paragraphs, and tables nest in table cells
+    paragraphs, tables_open = [], []
+    body = None
+
+    def page():
+        nonlocal elements, tables
+        result = "\n".join(elements), tables
+        elements, tables = [], []
+        return result
+
+    with zipfile.ZipFile(stream) as archive, archive.open("word/document.xml") as document:
+        for event, node in ET.iterparse(document, events=("start", "end")):
+            tag = node.tag
+            if event == "start":
+                if tag == f"{W}p":
+                    paragraphs.append(_DocxParagraph())
+                elif tag == f"{W}tbl":
+                    tables_open.append(_DocxTable(len(paragraphs)))
+                elif tag == f"{W}body":
+                    body = node
+                continue
+
+            paragraph = paragraphs[-1] if paragraphs else None
+            if paragraph is None:
+                pass
+            elif tag == f"{W}t":
+                paragraph.text.append(node.text or "")
+            elif tag == f"{W}tab":
+                paragraph.text.append("\t")
+            elif tag in (f"{W}br", f"{W}lastRenderedPageBreak"):
+                if tag == f"{W}br" and node.get(f"{W}type") != "page":
+                    paragraph.text.append("\n")
+                elif not tables_open:
+                    if "".join(paragraph.text).strip():
+                        paragraph.break_after = True
+                    else:
+                        paragraph.break_before = True
+            elif tag == f"{W}pStyle":
+                paragraph.style = (node.get(f"{W}val") or "").lower().replace(" ", "")
+            elif tag == f"{W}numPr":
+                paragraph.listed = True
+            elif tag == f"{W}sectPr" and not tables_open:
+                paragraph.break_after = True
+
+            if tag == f"{W}p":
+                paragraphs.pop()
+                text = "".join(paragraph.text).strip()
+                if tables_open and tables_open[-1].depth == len(paragraphs):
+                    if text:
+                        tables_open[-1].cell.append(text)
+                elif paragraphs:
+                    if text:
+                        paragraphs[-1].text.append(" " + text + " ")
+                else:
+                    if paragraph.break_before and elements:
+                        yield page()
+                    if text:
+                        if paragraph.style == "title":
+                            elements.append(_element("title", text))
+                        elif paragraph.style and paragraph.style.startswith("heading"):
+                            elements.append(_element("header", text))
+                        elif paragraph.listed or (paragraph.style and paragraph.style.startswith("list")):
+                            elements.append(_element("list_element", text))
+                        else:
+                            elements.append(_element("text", text))
+                    if paragraph.break_after and elements:
+                        yield page()
+                    body.clear()
+            elif tag == f"{W}tc" and tables_open:
+                table = tables_open[-1]
+                table.row.append(" ".join(table.cell))
+                table.cell = []
+            elif tag == f"{W}tr" and tables_open:
+                table = tables_open[-1]
+                table.rows.append(table.row)
+                table.row = []
+            elif tag == f"{W}tbl":
+                table = tables_open.pop()
+                if tables_open and tables_open[-1].depth == table.depth:
+                    tables_open[-1].cell.append(" ".join(" ".join(row) for row in table.rows))
+                elif table.depth:
+                    paragraphs[-1].text.append(" " + " ".join(" ".join(row) for row in table.rows) + " ")
+                else:
+                    if table.rows:
+                        rendered = _table(table.rows)
+                        elements.append(rendered)
+                        tables.append(rendered)
+                    body.clear()
+    if elements or tables:
+        yield page()
+
+
+def _pptx_shape_elements(shape, elements: List[str], tables: List[str]):
+    if shape.tag == f"{P}grpSp":
+        for child in shape:
+            _pptx_shape_elements(child, elements, tables)
+    elif shape.tag == f"{P}sp":
+        placeholder = shape.find(f"{P}nvSpPr/{P}nvPr/{P}ph")
+        placeholder_type = placeholder.get("type") if placeholder is not None else None
+        paragraphs = ["".join(run.text or "" for run in paragraph.iter(f"{A}t")).strip()
+                      for paragraph in shape.iter(f"{A}p")]
+        paragraphs = [paragraph for paragraph in paragraphs if paragraph]
+        if not paragraphs:
+            return
+        if placeholder_type in ("title", "ctrTitle"):
+            elements.append(_element("title", " ".join(paragraphs)))
+        elif placeholder_type == "subTitle":
+            elements.append(_element("header", " ".join(paragraphs)))
+        else:
+            elements.extend(_element("text", paragraph) for paragraph in paragraphs)
+    elif shape.tag == f"{P}graphicFrame":
+        for table in shape.iter(f"{A}tbl"):
+            rows = [["".join(t.text or "" for t in cell.iter(f"{A}t")) for cell in row.iter(f"{A}tc")]
+                    for row in table.iter(f"{A}tr")]
+            if rows:
+                rendered = _table(rows)
+                elements.append(rendered)
+                tables.append(rendered)
+
+
+@register_extractor("pptx")
+def extract_pptx(stream: BinaryIO) -> Iterator[Page]:
+    """One page per slide, in presentation order. Speaker notes are not included."""
+    with zipfile.ZipFile(stream) as archive:
+        presentation = "ppt/presentation.xml"
+        targets = _relationships(archive, presentation)
+        slide_ids = ET.fromstring(archive.read(presentation)).iter(f"{P}sldId")
+        for slide_id in slide_ids:
+            slide = ET.fromstring(archive.read(targets[slide_id.get(f"{R}id")]))
+            elements, tables = [], []
+            shapes = slide.find(f"{P}cSld/{P}spTree")
+            for shape in (shapes if shapes is not None else []):
+                _pptx_shape_elements(shape, elements, tables)
+            yield "\n".join(elements), tables
+
+
+def _column_index(reference: str) -> int:
+    index = 0
+    for character in reference:
+        if not character.isalpha():
+            break
+        index = index * 26 + ord(character.upper()) - ord("A") + 1
+    return index - 1
+
+
+def _worksheet_rows(archive: zipfile.ZipFile, path: str, shared_strings: List[str]) -> Iterator[List[str]]:
+    with archive.open(path) as worksheet:
+        row, sheet_data = {}, None
+        for event, node in ET.iterparse(worksheet, events=("start", "end")):
+            if event == "start":
+                if node.tag == f"{S}sheetData":
+                    sheet_data = node
+            elif node.tag == f"{S}c":
+                cell_type = node.get("t")
+                if cell_type == "inlineStr":
+                    value = "".join(t.text or "" for t in node.iter(f"{S}t"))
+                else:
+                    value_node = node.find(f"{S}v")
+                    value = value_node.text if value_node is not None and value_node.text else ""
+                    if cell_type == "s" and value:
+                        value = shared_strings[int(value)]
+                    elif cell_type == "b" and value:
+                        value = "TRUE" if value == "1" else "FALSE"
+                column = _column_index(node.get("r", "")) if node.get("r") else len(row)
+                if value:
+                    row[column] = value
+                node.clear()
+            elif node.tag == f"{S}row":
+                if row:
+                    yield [row.get(column, "") for column in range(max(row) + 1)]
+                row = {}
+                # Drops the rows read so far, so memory does not grow with the sheet
+                sheet_data.clear()
+
+
+@register_extractor("xlsx")
+def extract_xlsx(stream: BinaryIO) -> Iterator[Page]:
+    """Streams each worksheet's rows into pages of EXTRACTION_ROWS_PER_PAGE rows, headed by the sheet name.
+
+    Values are the stored cell values: formulas give their cached result, and dates
+    stay Excel serial numbers.
+    """
+    with zipfile.ZipFile(stream) as archive:
+        shared_strings = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            with archive.open("xl/sharedStrings.xml") as strings:
+                table = None
+                for event, node in ET.iterparse(strings, events=("start", "end")):
+                    if event == "start":
+                        if node.tag == f"{S}sst":
+                            table = node
+                    elif node.tag == f"{S}si":
+                        # Rich text keeps its runs under r; phonetic hints (rPh) are left out
+                        runs = node.findall(f"{S}t") + node.findall(f"{S}r/{S}t")
+                        shared_strings.append("".join(t.text or "" for t in runs))
+                        table.clear()
+        workbook = "xl/workbook.xml"
+        targets = _relationships(archive, workbook)
+        for sheet in ET.fromstring(archive.read(workbook)).iter(f"{S}sheet"):
+            yield from _paged_rows(_worksheet_rows(archive, targets[sheet.get(f"{R}id")], shared_strings), sheet.get("name"))
+
+
+class _HTMLText(HTMLParser):
+    """Turns HTML into tagged elements, starting a new page at each <h1> after the first content."""
+
+    SKIPPED = {"script", "style", "noscript", "template", "svg", "head"}
+    BLOCKS = {"p", "div", "section", "article", "main", "header", "footer", "nav", "aside", "blockquote", "pre",
+              "br", "hr", "ul", "ol", "dl", "dt", "dd", "form", "figure", "figcaption", "address"}
+    HEADERS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pages = []
+        self.elements, self.tables = [], []
+        self.text = []
+        self.kind = "text"
+        self.skip_depth = 0
+        self.in_title = False
+        self.tables_open = []
+
+    def _flush(self):
+        text = _clean("".join(self.text))
+        self.text = []
+        if not text:
+            return
+        if self.tables_open:
+            self.tables_open[-1]["cell"].append(text)
+        else:
+            self.elements.append(_element(self.kind, text))
+
+    def _page_break(self):
+        if self.elements:
+            self.pages.append(("\n".join(self.elements), self.tables))
+            self.elements, self.tables = [], []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self.in_title = True
+            return
+        if tag in self.SKIPPED:
+            self.skip_depth += 1
+            return
+        if tag == "table":
+            self._flush()
+            self.tables_open.append({"rows": [], "row": [], "cell": []})
+        elif tag in ("td", "th", "tr") and self.tables_open:
+            self._flush()
+        elif tag in self.HEADERS or tag == "li" or tag in self.BLOCKS:
+            self._flush()
+            # The document title stays on the first section's page
+            if tag == "h1" and not self.tables_open and any(not e.startswith("<title>") for e in self.elements):
+                self._page_break()
+            self.kind = "header" if tag in self.HEADERS else "list_element" if tag == "li" else "text"
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+            return
+        if tag in self.SKIPPED:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+            return
+        if tag in ("td", "th") and self.tables_open:
+            self._flush()
+            table = self.tables_open[-1]
+            table["row"].append(" ".join(table["cell"]))
+            table["cell"] = []
+        elif tag == "tr" and self.tables_open:
+            self._flush()
+            table = self.tables_open[-1]
+            if table["row"]:
+                table["rows"].append(table["row"])
+            table["row"] = []
+        elif tag == "table" and self.tables_open:
+            self._flush()
+            table = self.tables_open.pop()
+            if table["row"]:
+                table["rows"].append(table["row"])
+            if self.tables_open:
+                self.tables_open[-1]["cell"].append(" ".join(" ".join(row) for row in table["rows"]))
+            elif table["rows"]:
+                rendered = _table(table["rows"])
+                self.elements.append(rendered)
+                self.tables.append(rendered)
+        elif tag in self.HEADERS or tag == "li" or tag in self.BLOCKS:
+            self._flush()
+            self.kind = "text"
+
+    def handle_data(self, data):
+        if self.in_title:
+            title = _clean(data)
+            if title:
+                self.elements.append(_element("title", title))
+        elif not self.skip_depth:
+            self.text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+        self._page_break()
+
+
+@register_extractor("html", "htm")
+def extract_html(stream: BinaryIO) -> Iterator[Page]:
+    parser = _HTMLText()
+    text = io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+    while True:
+        data = text.read(READ_SIZE)
+        if not data:
+            break
+        parser.feed(data)
+        # Hand on the pages completed so far, so long documents are not held whole
+        yield from parser.pages
+        parser.pages = []
+    parser.close()
+    yield from parser.pages or [("", [])]
@@ -0,0 +1,231 @@
+import io
+import os
+import unicodedata
+from typing import Dict, List
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import IndirectObject
+
+# auto: each PDF's text layer is probed and the pages it covers are extracted in process, so only
+# scanned or low-quality pages go to Textract. off: every PDF goes to Textract as one job.
+EXTRACTION_PDF_TEXT_LAYER = os.getenv('EXTRACTION_PDF_TEXT_LAYER', 'auto')
+# A page's text layer is used when it has at least this many non-space characters...
+EXTRACTION_PDF_MIN_PAGE_CHARS = int(os.getenv('EXTRACTION_PDF_MIN_PAGE_CHARS', '50'))
+# ...and at least this fraction of them are assigned, non-private-use characters
+EXTRACTION_PDF_MIN_TEXT_QUALITY = float(os.getenv('EXTRACTION_PDF_MIN_TEXT_QUALITY', '0.95'))
+# Up to this many pages are sent to Textract one page at a time; a PDF with more is analyzed as one job
+EXTRACTION_PDF_MAX_TEXTRACT_PAGES = int(os.getenv('EXTRACTION_PDF_MAX_TEXTRACT_PAGES', '10'))
+PROBE_BATCH_SIZE = 16  # pages per probe task in the linearization pool
+TEXTRACT_SYNC_MAX_BYTES = 10 * 1024 * 1024  # AnalyzeDocument's limit for documents passed as bytes
+
+# Page sources recorded in the extraction report and the metadata's page_sources
+TEXT_LAYER = "text_layer"
+TEXTRACT = "textract"
+
+HEADING_SCALE = 1.15  # lines this much larger than the page's body text are headings
+# Pages with a table go to Textract, which recovers its cells. A table is this many consecutive
+# rows of text starting at the same TABLE_MIN_COLUMNS or more x positions, or a grid of ruled cells.
+TABLE_MIN_ROWS = 3
+TABLE_MIN_COLUMNS = 3
+TABLE_MIN_CELLS = 4
+PARAGRAPH_GAP = 1.3  # a vertical gap of more than this many times the page's line spacing starts a paragraph
+
+
+def _element(tag: str, text: str) -> str:
+    return f"<{tag}>{text}</{tag}>"
+
+
+def _multiply(m, n):
+    return [m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+            m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5]]
+
+
+def open_pdf(path: str) -> PdfReader:
+    reader = PdfReader(path)
+    if reader.is_encrypted and not reader.decrypt(""):
+        raise ValueError("PDF is encrypted with a user password")
+    return reader
+
+
+def page_count(path: str) -> int:
+    return len(open_pdf(path).pages)
+
+
+def single_page_pdf(path: str, page_number: int) -> bytes:
+    """A PDF of one page of the file, as AnalyzeDocument takes it."""
+    writer = PdfWriter()
+    writer.add_page(open_pdf(path).pages[page_number - 1])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def _count_images(resources, depth=0) -> int:
+    """Image XObjects drawn by a page, including those inside its form XObjects."""
+    if isinstance(resources, IndirectObject):
+        resources = resources.get_object()
+    if not resources or "/XObject" not in resources or depth > 3:
+        return 0
+    images = 0
+    for xobject in resources["/XObject"].get_object().values():
+        xobject = xobject.get_object()
+        if xobject.get("/Subtype") == "/Image":
+            images += 1
+        elif xobject.get("/Subtype") == "/Form":
+            images += _count_images(xobject.get("/Resources"), depth + 1)
+    return images
+
+
+def text_quality(text: str) -> float:
+    """The fraction of non-space characters that are not replacement, private-use, unassigned or control characters.
+
+    Text layers with broken font encodings come out as these, where the text cannot be mapped back to Unicode.
+    """
+    chars = [char for char in text if not char.isspace()]
+    if not chars:
+        return 1.0
+    bad = sum(1 for char in chars if char == "\ufffd" or unicodedata.category(char) in ("Co", "Cn", "Cc"))
+    return 1 - bad / len(chars)
+
+
+def _has_table(text_starts: List[tuple], cells: List[tuple]) -> bool:
+    """Whether text runs line up in columns over several rows, or rectangles form a grid of cells."""
+    rows = {}
+    for x, y in text_starts:
+        rows.setdefault(round(y), set()).add(round(x / 2))
+    aligned, previous = 0, None
+    for y in sorted(rows, reverse=True):
+        columns = rows[y] if len(rows[y]) >= TABLE_MIN_COLUMNS else None
+        aligned = aligned + 1 if columns and previous and len(columns & previous) >= TABLE_MIN_COLUMNS else 0
+        if aligned + 1 >= TABLE_MIN_ROWS:
+            return True
+        previous = columns
+    return (len(cells) >= TABLE_MIN_CELLS and len({round(x) for x, _ in cells}) >= 2
+            and len({round(y) for _, y in cells}) >= 2)
+
+
+def _read_page(page):
+    """The text lines of a page in content order, each with its baseline and font size, and whether it has a table."""
+    lines, text_starts, cells = [], [], []
+
+    def visit_operator(operator, operands, cm, tm):
+        if operator in (b"Tj", b"TJ", b"'", b'"'):
+            text_starts.append(tuple(_multiply(tm, cm)[4:]))
+        elif operator == b"re" and len(operands) == 4:
+            x, y, width, height = (float(operand) for operand in operands)
+            # Cells rather than backgrounds, rules or page borders
+            if abs(width) > 1 and abs(height) > 1 and abs(width) < float(page.mediabox.width) * 0.9:
+                cells.append(tuple(_multiply([1, 0, 0, 1, x, y], cm)[4:]))
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if not text:
+            return
+        a, b, c, d, x, y = _multiply(tm, cm)
+        if x == 0 and y == 0 and lines:
+            # pypdf passes no position for text it continues on the current line
+            y = lines[-1]["y"]
+        size = font_size * (abs(a * d - b * c) ** 0.5) or font_size
+        for index, segment in enumerate(text.split("\n")):
+            if index:
+                y = lines[-1]["y"] - size if lines else y
+                lines.append({"y": y, "size": size, "text": []})
+            if not segment.strip() and (not lines or not lines[-1]["text"]):
+                continue
+            if not lines or (lines[-1]["text"] and abs(lines[-1]["y"] - y) > size / 2):
+                lines.append({"y": y, "size": size, "text": []})
+            elif not lines[-1]["text"]:
+                lines[-1].update(y=y, size=size)
+            lines[-1]["text"].append(segment)
+            lines[-1]["size"] = max(lines[-1]["size"], size)
+
+    page.extract_text(visitor_text=visit, visitor_operand_before=visit_operator)
+    result = []
+    for line in lines:
+        text = " ".join("".join(line["text"]).split())
+        if text:
+            result.append({"y": line["y"], "size": line["size"], "text": text})
+    return result, _has_table(text_starts, cells)
+
+
+def linearize_text_layer(lines: List[dict], first_page=False) -> str:
+    """Groups the lines of a page into paragraphs and headings, tagged like Textract results."""
+    if not lines:
+        return ""
+    weights = {}
+    for line in lines:
+        size = round(line["size"], 1)
+        weights[size] = weights.get(size, 0) + len(line["text"])
+    body_size = max(weights, key=weights.get)
+    # The most common gap between consecutive body lines is the page's line spacing
+    gaps = {}
+    for previous, line in zip(lines, lines[1:]):
+        gap = round(previous["y"] - line["y"], 1)
+        if gap > 0 and round(line["size"], 1) == body_size:
+            gaps[gap] = gaps.get(gap, 0) + 1
+    leading = max(body_size, max(gaps, key=gaps.get) if gaps else body_size * 1.2)
+
+    paragraphs = []
+    for line in lines:
+        heading = line["size"] >= body_size * HEADING_SCALE
+        if paragraphs:
+            previous = paragraphs[-1]
+            gap = previous["y"] - line["y"]
+            if previous["heading"] == heading and abs(previous["size"] - line["size"]) <= line["size"] * 0.1 \
+                    and 0 < gap <= leading * PARAGRAPH_GAP * line["size"] / body_size:
+                previous["text"].append(line["text"])
+                previous["y"] = line["y"]
+                continue
+        paragraphs.append({"y": line["y"], "size": line["size"], "heading": heading, "text": [line["text"]]})
+
+    elements = []
+    for index, paragraph in enumerate(paragraphs):
+        text = " ".join(paragraph["text"])
+        if paragraph["heading"] and index == 0 and first_page:
+            elements.append(_element("title", text))
+        elif paragraph["heading"]:
+            elements.append(_element("header", text))
+        else:
+            elements.append(_element("text", text))
+    return "\n".join(elements)
+
+
+def probe_pages(path: str, first_page: int, last_page: int, min_chars=EXTRACTION_PDF_MIN_PAGE_CHARS,
+                min_quality=EXTRACTION_PDF_MIN_TEXT_QUALITY) -> List[Dict]:
+    """Reads the text layer of pages first_page to last_page of a PDF and decides where each page is extracted.
+
+    A page is extracted from its text layer when the layer has enough characters of good
+    quality, or when it has little text and no images, so there is nothing to recognize.
+    Otherwise, and for pages with a table, it is left for Textract. Runs in the linearization pool, so it takes the
+    path of the file rather than an open reader and returns plain dicts.
+    """
+    reader = open_pdf(path)
+    probes = []
+    for page_number in range(first_page, last_page + 1):
+        page = reader.pages[page_number - 1]
+        lines, has_table = _read_page(page)
+        text = "".join(line["text"] for line in lines)
+        chars = sum(1 for char in text if not char.isspace())
+        quality = text_quality(text)
+        images = _count_images(page.get("/Resources"))
+        if quality < min_quality:
+            source, reason = TEXTRACT, "low_text_quality"
+        elif has_table:
+            source, reason = TEXTRACT, "table"
+        elif chars >= min_chars:
+            source, reason = TEXT_LAYER, "text_layer"
+        elif images:
+            source, reason = TEXTRACT, "scanned"
+        else:
+            source, reason = TEXT_LAYER, "no_content"
+        probes.append({
+            "page_number": page_number,
+            "source": source,
+            "reason": reason,
+            "chars": chars,
+            "text_quality": round(quality, 4),
+            "images": images,
+            "page_text": linearize_text_layer(lines, page_number == 1) if source == TEXT_LAYER else None,
+        })
+    return probes
+
@@ -0,0 +1,129 @@
+import os
+import zlib
+
+import zstandard
+
+# json keeps the documented {"job_id", "file_name", "pages": [...]} objects; jsonl writes one compact page per line
+EXTRACTION_RESULTS_FORMAT = os.getenv('EXTRACTION_RESULTS_FORMAT', 'json')
+# Content-Encoding of the result objects: empty for none, gzip or zstd
+EXTRACTION_RESULTS_ENCODING = os.getenv('EXTRACTION_RESULTS_ENCODING', '')
+# Results larger than one part are written as multipart uploads; S3 requires parts of at least 5 MiB
+EXTRACTION_RESULTS_PART_SIZE = max(int(os.getenv('EXTRACTION_RESULTS_PART_SIZE', str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+
+RESULT_FORMATS = {"json": (".json", "application/json"), "jsonl": (".jsonl", "application/x-ndjson")}
+RESULT_ENCODINGS = {"": "", "gzip": ".gz", "zstd": ".zst"}
+PAGE_TEXT_CONTENT_TYPE = "text/plain; charset=utf-8"
+
+
+def result_key(prefix: str, name: str, result_format=EXTRACTION_RESULTS_FORMAT, encoding=EXTRACTION_RESULTS_ENCODING) -> str:
+    """The key of a result object, e.g. <prefix>/extracted_text.jsonl.gz."""
+    return f"{prefix}/{name}{RESULT_FORMATS[result_format][0]}{RESULT_ENCODINGS[encoding]}"
+
+
+def page_text_key(prefix: str, encoding=EXTRACTION_RESULTS_ENCODING) -> str:
+    """The key of the page-delimited text object, which holds the page texts back to back."""
+    return f"{prefix}/extracted_pages.txt{RESULT_ENCODINGS[encoding]}"
+
+
+def _compressor(encoding):
+    if not encoding:
+        return None
+    if encoding == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"Unsupported result encoding: {encoding}")
+
+
+class S3StreamWriter:
+    """Writes an S3 object from a sequence of writes, holding at most one part in memory.
+
+    Objects that fit in one part are written with a single put_object when the writer
+    is closed; larger ones are uploaded in parts as the writes arrive. Leaving the
+    writer's context with an exception aborts the upload, so no partial object is left.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, content_type: str, encoding=EXTRACTION_RESULTS_ENCODING,
+                 part_size=EXTRACTION_RESULTS_PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.encoding = encoding
+        self.part_size = part_size
+        self.requests = 0
+        self._compressor = _compressor(encoding)
+        self._compressing = False
+        self._buffer = bytearray()
+        self._uploaded = 0
+        self._upload_id = None
+        self._parts = []
+
+    @property
+    def size(self) -> int:
+        """Bytes written to the object so far, not counting input still held by the compressor."""
+        return self._uploaded + len(self._buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        if self._compressor:
+            self._buffer += self._compressor.compress(data)
+            self._compressing = True
+        else:
+            self._buffer += data
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+
+    def end_frame(self):
+        """Ends the current gzip member or zstd frame, so the bytes written since the last
+        frame can be read back with a ranged GET and decompressed on their own."""
+        if self._compressing:
+            self._buffer += self._compressor.flush()
+            self._compressor = _compressor(self.encoding)
+            self._compressing = False
+
+    def close(self):
+        self.end_frame()
+        if self._upload_id is None:
+            params = {"Bucket": self.bucket, "Key": self.key, "Body": bytes(self._buffer), "ContentType": self.content_type}
+            if self.encoding:
+                params["ContentEncoding"] = self.encoding
+            self.s3_client.put_object(**params)
+            self.requests += 1
+        else:
+            if self._buffer:
+                self._upload_part()
+            self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                                     MultipartUpload={"Parts": self._parts})
+            self.requests += 1
+        self._buffer = bytearray()
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            self.requests += 1
+        self._buffer = bytearray()
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            params = {"Bucket": self.bucket, "Key": self.key, "ContentType": self.content_type}
+            if self.encoding:
+                params["ContentEncoding"] = self.encoding
+            self._upload_id = self.s3_client.create_multipart_upload(**params)["UploadId"]
+            self.requests += 1
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                              PartNumber=part_number, Body=bytes(self._buffer))
+        self.requests += 1
+        self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        self._uploaded += len(self._buffer)
+        self._buffer = bytearray()
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import logging
+import threading
+import concurrent.futures
+from typing import Callable, Optional
+
+from botocore.exceptions import ClientError
+
+from utils.sqs_consumer import SQSConsumer
+
+logger = logging.getLogger(__name__)
+
+# sns: Textract publishes completions to TEXTRACT_SNS_TOPIC_ARN, which feeds TEXTRACT_COMPLETION_QUEUE_URL.
+# poll: one poller thread per task checks the jobs the task submitted, whose messages are held until they complete.
+# local: completions are published in process.
+TEXTRACT_SNS_TOPIC_ARN = os.getenv('TEXTRACT_SNS_TOPIC_ARN')
+TEXTRACT_SNS_ROLE_ARN = os.getenv('TEXTRACT_SNS_ROLE_ARN')
+TEXTRACT_COMPLETION_QUEUE_URL = os.getenv('TEXTRACT_COMPLETION_QUEUE_URL')
+TEXTRACT_COMPLETION_CHANNEL = os.getenv('TEXTRACT_COMPLETION_CHANNEL', 'sns' if TEXTRACT_SNS_TOPIC_ARN and TEXTRACT_COMPLETION_QUEUE_URL else 'poll')
+TEXTRACT_POLL_INTERVAL = float(os.getenv('TEXTRACT_POLL_INTERVAL', '5'))  # in seconds
+TEXTRACT_MAX_POLL_INTERVAL = 60  # in seconds, while Textract throttles status checks
+TEXTRACT_TERMINAL_STATUSES = {"SUCCEEDED", "FAILED", "ERROR", "PARTIAL_SUCCESS"}
+THROTTLING_ERRORS = {"ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException"}
+
+# Takes a completion shaped like Textract's SNS notification: JobId, Status, JobTag and
+# DocumentLocation (S3Bucket, S3ObjectName). Returns True once the completion is handled.
+CompletionHandler = Callable[[dict], bool]
+
+
+def parse_completion(message: dict) -> dict:
+    """Reads a Textract completion notification from an SQS message, unwrapping the SNS envelope."""
+    body = json.loads(message['Body'])
+    if body.get("Type") == "Notification":
+        body = json.loads(body["Message"])
+    return body
+
+
+class SQSCompletionChannel:
+    """Receives Textract completions that Textract publishes to SNS and SNS delivers to an SQS queue.
+
+    Completions survive task restarts, since they wait in the queue until handled.
+    """
+
+    def __init__(self, sqs_client, queue_url: str, topic_arn: str, role_arn: str, max_concurrency: int,
+                 visibility_timeout: Optional[int] = None):
+        self.topic_arn = topic_arn
+        self.role_arn = role_arn
+        self._consumer_args = dict(sqs_client=sqs_client, queue_url=queue_url, max_concurrency=max_concurrency,
+                                   visibility_timeout=visibility_timeout, name="textract-completions")
+        self.consumer = None
+
+    def notification_channel(self) -> Optional[dict]:
+        return {"SNSTopicArn": self.topic_arn, "RoleArn": self.role_arn}
+
+    def start(self, on_complete: CompletionHandler):
+        self.consumer = SQSConsumer(handler=lambda message: on_complete(parse_completion(message)), **self._consumer_args)
+        self.consumer.start()
+
+    def track(self, completion: dict):
+        # Textract publishes the completion itself, and it waits in the queue, so nothing is held
+        return None
+
+    async def stop(self):
+        if self.consumer:
+            await self.consumer.stop()
+
+    def stats(self) -> dict:
+        return {"channel": "sns", **(self.consumer.stats() if self.consumer else {})}
+
+
+class PollingCompletionChannel:
+    """Checks the status of every Textract job submitted by this task from one shared poller thread.
+
+    Replaces a blocked worker per document with one GetDocumentAnalysis call per job every
+    poll_interval, backing off while Textract throttles. Jobs are tracked in memory, so
+    track() returns a future of the completion's handling: the consumer holds the job's
+    message until it is done, and after a task restart the redelivered message tracks the
+    job again.
+    """
+
+    def __init__(self, textract_client, max_concurrency: int, poll_interval=TEXTRACT_POLL_INTERVAL):
+        self.textract_client = textract_client
+        self.poll_interval = poll_interval
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="textract-completions")
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._on_complete = None
+        self._stats = {"tracked": 0, "completed": 0, "status_checks": 0, "throttled": 0}
+
+    def notification_channel(self) -> Optional[dict]:
+        return None
+
+    def start(self, on_complete: CompletionHandler):
+        self._on_complete = on_complete
+        threading.Thread(target=self._run, name="textract-poller", daemon=True).start()
+
+    def track(self, completion: dict) -> concurrent.futures.Future:
+        """Polls the job in completion["JobId"] until it finishes, then hands completion on with its Status.
+
+        Returns a future of the handler's result.
+        """
+        with self._lock:
+            if completion["JobId"] not in self._pending:
+                self._pending[completion["JobId"]] = (completion, concurrent.futures.Future())
+                self._stats["tracked"] += 1
+            return self._pending[completion["JobId"]][1]
+
+    async def stop(self):
+        self._stopped.set()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"channel": "poll", "pending": len(self._pending), **self._stats}
+
+    def _run(self):
+        interval = self.poll_interval
+        while not self._stopped.wait(interval):
+            with self._lock:
+                pending = list(self._pending.values())
+            throttled = False
+            for completion, handled in pending:
+                try:
+                    response = self.textract_client.get_document_analysis(JobId=completion["JobId"], MaxResults=1)
+                except ClientError as e:
+                    if e.response.get("Error", {}).get("Code") in THROTTLING_ERRORS:
+                        throttled = True
+                        break
+                    logger.error(f"Failed to check Textract job {completion['JobId']}: {e}")
+                    response = {"JobStatus": "ERROR", "StatusMessage": str(e)}
+                self._stats["status_checks"] += 1
+                if response["JobStatus"] in TEXTRACT_TERMINAL_STATUSES:
+                    with self._lock:
+                        self._pending.pop(completion["JobId"], None)
+                        self._stats["completed"] += 1
+                    self._executor.submit(self._complete, {**completion, "Status": response["JobStatus"]}, handled)
+            if throttled:
+                self._stats["throttled"] += 1
+                interval = min(interval * 2, TEXTRACT_MAX_POLL_INTERVAL)
+            else:
+                interval = self.poll_interval
+
+    def _complete(self, completion: dict, handled: concurrent.futures.Future):
+        try:
+            handled.set_result(self._on_complete(completion))
+        except Exception as e:
+            logger.error(f"Error handling completion of Textract job {completion['JobId']}: {e}")
+            handled.set_exception(e)
+
+
+class LocalCompletionChannel:
+    """In-process stand-in for the SNS and SQS channel, for tests and local runs.
+
+    Nothing is polled; whatever stands in for Textract calls publish() with the completion
+    notification, and it is handled on a thread pool as if it had come from the queue.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="textract-completions")
+        self._on_complete = None
+        self._tracked = {}
+        self._lock = threading.Lock()
+
+    def notification_channel(self) -> Optional[dict]:
+        return None
+
+    def start(self, on_complete: CompletionHandler):
+        self._on_complete = on_complete
+
+    def track(self, completion: dict):
+        with self._lock:
+            self._tracked[completion["JobId"]] = completion
+
+    def publish(self, job_id: str, status="SUCCEEDED") -> concurrent.futures.Future:
+        """Delivers the completion of a tracked job, as Textract would through SNS."""
+        with self._lock:
+            completion = self._tracked.pop(job_id)
+        return self._executor.submit(self._on_complete, {**completion, "Status": status, "Timestamp": int(time.time() * 1000)})
+
+    async def stop(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"channel": "local", "pending": len(self._tracked)}
+
+
+def create_completion_channel(sqs_client, textract_client, max_concurrency: int, visibility_timeout: Optional[int] = None,
+                              channel=TEXTRACT_COMPLETION_CHANNEL):
+    if channel == "sns":
+        return SQSCompletionChannel(sqs_client, TEXTRACT_COMPLETION_QUEUE_URL, TEXTRACT_SNS_TOPIC_ARN, TEXTRACT_SNS_ROLE_ARN,
+                                    max_concurrency, visibility_timeout)
+    if channel == "poll":
+        return PollingCompletionChannel(textract_client, max_concurrency)
+    if channel == "local":
+        return LocalCompletionChannel(max_concurrency)
+    raise ValueError(f"Unsupported Textract completion channel: {channel}")
@@ -12,11 +12,13 @@ class StandardInput(BaseModel):
     top_k: Optional[int] = None
     stop_sequences: Optional[List[str]] = None
     text_to_embed: Optional[str] = None
+    texts: Optional[List[str]] = None
     input_type: Optional[str] = None
 
 class StandardOutput(BaseModel):
     output_text: Optional[str] = None
     embedding: Optional[List[float]] = None
+    embeddings: Optional[List[List[float]]] = None
     input_tokens: Optional[int] = None
     output_tokens: Optional[int] = None
 
@@ -185,6 +187,92 @@ def cohere_embed_output_adapter(response: dict) -> StandardOutput:
         embedding=response.get("embeddings", [[]])[0]
     )
 
+# Batch Embed Adapters
+# Cohere embeds up to 96 texts per request; Titan embeds one text per request and is fanned out instead.
+def titan_embed_batch_adapter(request: StandardInput) -> dict:
+    return {"inputText": request.texts[0]}
+
+def cohere_embed_batch_adapter(request: StandardInput) -> dict:
+    return {
+        "texts": request.texts,
+        "input_type": request.input_type or 'search_document',
+    }
+
+def titan_embed_batch_output_adapter(response: dict) -> StandardOutput:
+    return StandardOutput(
+        embeddings=[response.get("embedding")],
+        input_tokens=response.get("inputTextTokenCount")
+    )
+
+def cohere_embed_batch_output_adapter(response: dict) -> StandardOutput:
+    return StandardOutput(
+        embeddings=response.get("embeddings", [])
+    )
+
+# Streaming Output Adapters
+# Each adapter receives one decoded chunk from invoke_model_with_response_stream and
+# returns the text delta and any token counts it carries.
+def _invocation_metrics(chunk: dict) -> dict:
+    return chunk.get("amazon-bedrock-invocationMetrics", {})
+
+def titan_text_stream_output_adapter(chunk: dict) -> StandardOutput:
+    metrics = _invocation_metrics(chunk)
+    return StandardOutput(
+        output_text=chunk.get("outputText"),
+        input_tokens=metrics.get("inputTokenCount"),
+        output_tokens=metrics.get("outputTokenCount")
+    )
+
+def anthropic_stream_output_adapter(chunk: dict) -> StandardOutput:
+    metrics = _invocation_metrics(chunk)
+    chunk_type = chunk.get("type")
+    output_text = None
+    input_tokens = metrics.get("inputTokenCount")
+    output_tokens = metrics.get("outputTokenCount")
+    if chunk_type == "content_block_delta":
+        output_text = chunk.get("delta", {}).get("text")
+    elif chunk_type == "message_start" and input_tokens is None:
+        input_tokens = chunk.get("message", {}).get("usage", {}).get("input_tokens")
+    elif chunk_type == "message_delta" and output_tokens is None:
+        output_tokens = chunk.get("usage", {}).get("output_tokens")
+    return StandardOutput(
+        output_text=output_text,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens
+    )
+
+def cohere_command_stream_output_adapter(chunk: dict) -> StandardOutput:
+    metrics = _invocation_metrics(chunk)
+    return StandardOutput(
+        output_text=None if chunk.get("is_finished") else chunk.get("text"),
+        input_tokens=metrics.get("inputTokenCount"),
+        output_tokens=metrics.get("outputTokenCount")
+    )
+
+def cohere_command_r_stream_output_adapter(chunk: dict) -> StandardOutput:
+    metrics = _invocation_metrics(chunk)
+    return StandardOutput(
+        output_text=chunk.get("text") if chunk.get("event_type") == "text-generation" else None,
+        input_tokens=metrics.get("inputTokenCount"),
+        output_tokens=metrics.get("outputTokenCount")
+    )
+
+def meta_stream_output_adapter(chunk: dict) -> StandardOutput:
+    metrics = _invocation_metrics(chunk)
+    return StandardOutput(
+        output_text=chunk.get("generation"),
+        input_tokens=metrics.get("inputTokenCount"),
+        output_tokens=metrics.get("outputTokenCount")
+    )
+
+def mistral_stream_output_adapter(chunk: dict) -> StandardOutput:
+    metrics = _invocation_metrics(chunk)
+    return StandardOutput(
+        output_text=chunk.get("outputs", [{}])[0].get("text"),
+        input_tokens=metrics.get("inputTokenCount"),
+        output_tokens=metrics.get("outputTokenCount")
+    )
+
 # Register adapters
 input_adapters = {
     "TITAN_TEXT_PREMIER_V1": titan_text_adapter,
@@ -242,6 +330,29 @@ output_adapters = {
     "COHERE_EMBED_MULTILINGUAL_V3": cohere_embed_output_adapter,
 }
 
+# AI21 Jurassic and the embed models do not support response streaming on Bedrock.
+stream_output_adapters = {
+    "TITAN_TEXT_PREMIER_V1": titan_text_stream_output_adapter,
+    "TITAN_TEXT_LITE_V1": titan_text_stream_output_adapter,
+    "TITAN_TEXT_EXPRESS_V1": titan_text_stream_output_adapter,
+    "ANTHROPIC_CLAUDE_INSTANT_V1": anthropic_stream_output_adapter,
+    "ANTHROPIC_CLAUDE_V2:1": anthropic_stream_output_adapter,
+    "ANTHROPIC_CLAUDE_V2": anthropic_stream_output_adapter,
+    "ANTHROPIC_CLAUDE_3_SONNET_V1": anthropic_stream_output_adapter,
+    "ANTHROPIC_CLAUDE_3_HAIKU_V1": anthropic_stream_output_adapter,
+    "COHERE_COMMAND_LIGHT_TEXT_V14": cohere_command_stream_output_adapter,
+    "COHERE_COMMAND_TEXT_V14": cohere_command_stream_output_adapter,
+    "COHERE_COMMAND_R_V1": cohere_command_r_stream_output_adapter,
+    "COHERE_COMMAND_R_PLUS_V1": cohere_command_r_stream_output_adapter,
+    "META_LLAMA2_CHAT_13B_V1": meta_stream_output_adapter,
+    "META_LLAMA2_CHAT_70B_V1": meta_stream_output_adapter,
+    "META_LLAMA3_8B_INSTRUCT_V1": meta_stream_output_adapter,
+    "META_LLAMA3_70B_INSTRUCT_V1": meta_stream_output_adapter,
+    "MISTRAL_7B_INSTRUCT_V0:2": mistral_stream_output_adapter,
+    "MIXTRAL_8X7B_INSTRUCT_V0:1": mistral_stream_output_adapter,
+    "MISTRAL_LARGE_V1:0": mistral_stream_output_adapter,
+}
+
 model_id_map = {
     "TITAN_TEXT_PREMIER_V1": "amazon.titan-text-premier-v1:0",
     "TITAN_TEXT_LITE_V1": "amazon.titan-text-lite-v1",
@@ -269,3 +380,11 @@ model_id_map = {
     "COHERE_EMBED_ENGLISH_V3": "cohere.embed-english-v3",
     "COHERE_EMBED_MULTILINGUAL_V3": "cohere.embed-multilingual-v3"
 }
+
+# Maximum number of texts per Bedrock request, with the adapters used to build and parse it
+embed_batch_adapters = {
+    "TITAN_EMBED_TEXT_V1": (1, titan_embed_batch_adapter, titan_embed_batch_output_adapter),
+    "TITAN_TEXT_EMBED_V2": (1, titan_embed_batch_adapter, titan_embed_batch_output_adapter),
+    "COHERE_EMBED_ENGLISH_V3": (96, cohere_embed_batch_adapter, cohere_embed_batch_output_adapter),
+    "COHERE_EMBED_MULTILINGUAL_V3": (96, cohere_embed_batch_adapter, cohere_embed_batch_output_adapter),
+}
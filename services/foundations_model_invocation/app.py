@@ -3,7 +3,7 @@ import logging
 import uuid
 import os
 from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Dict, List, Optional, Union
 import boto3
 from botocore.config import Config
@@ -23,7 +23,11 @@ from fastapi import status
 from pydantic import error_wrappers
 
 
-from adapters import input_adapters, output_adapters, StandardInput, StandardOutput, model_id_map
+from adapters import input_adapters, output_adapters, stream_output_adapters, embed_batch_adapters, StandardInput, StandardOutput, model_id_map
+from auth import AppClientResolver, check_platform_client
+from invocation_executor import ModelInvocationExecutor, MODEL_INVOCATION_WORKERS
+from invocation_log_writer import InvocationLogWriter
+from response_cache import ResponseCache, RESPONSE_CACHE_EMBED_MODEL
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +41,7 @@ MAX_RETRIES = 10
 ECS_METADATA_URL = os.getenv("ECS_CONTAINER_METADATA_URI_V4", "")
 REDIS_URL = os.getenv("REDIS_URL")
 REDIS_PORT = os.getenv("REDIS_PORT")
+EMBED_BATCH_MAX_TEXTS = int(os.getenv("EMBED_BATCH_MAX_TEXTS", "2048"))
 
 
 # Global variables. Initialized in the startup event function.
@@ -45,11 +50,17 @@ session = None
 bedrock_client = None
 dynamodb = None
 redis_client = None
+app_client_resolver = None
+invocation_log_writer = None
+response_cache = None
+invocation_executor = ModelInvocationExecutor()
+# Keeps references to fire-and-forget async invocations until they finish
+background_invocations = set()
 
 
 app = FastAPI()
 
-retry_config = Config(retries={"max_attempts": MAX_RETRIES, "mode": "standard"})
+retry_config = Config(retries={"max_attempts": MAX_RETRIES, "mode": "standard"}, max_pool_connections=MODEL_INVOCATION_WORKERS)
 
 #################### COGNITO TOKEN PROCESSING ####################
 
@@ -61,14 +72,7 @@ def decode_token_without_verification(token: str):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def get_app_id_from_dynamodb(client_id: str):
-    response = dynamodb.scan(TableName=CLIENTS_TABLE)
-    items = response['Items']
-    if not items:
-        raise HTTPException(status_code=401, detail="No items found in DynamoDB")
-    for item in items:
-        if 'client_id' in item and client_id == item['client_id']['S']:
-            return item['app_id']['S']
-    raise HTTPException(status_code=401, detail="Client ID not found in DynamoDB")
+    return app_client_resolver.get_app_id(client_id)
 
 async def get_app_id_from_token(request: Request):
 
@@ -85,6 +89,13 @@ async def get_app_id_from_token(request: Request):
     except KeyError:
         raise HTTPException(status_code=401, detail="Client ID not found in token")
 
+async def verify_platform_client(request: Request):
+    authorization: str = request.headers.get("Authorization")
+    if authorization is None:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+    decoded_token = decode_token_without_verification(authorization.replace("Bearer ", ""))
+    check_platform_client(decoded_token.get('client_id'))
+
 #################### END COGNITO TOKEN PROCESSING ####################
 
 def save_invocation_log(model_name, model_id, input_tokens, output_tokens, status, error_message, app_id):
@@ -97,7 +108,7 @@ def save_invocation_log(model_name, model_id, input_tokens, output_tokens, statu
         error_message=error_message,
         app_id=app_id
     )
-    invocation.save()
+    invocation_log_writer.submit(invocation)
     return invocation.invocation_id
 
 
@@ -138,6 +149,173 @@ def invoke_model_and_log(model_name: str, model_id: str, adapted_input: dict, ap
         )
         raise e
 
+def converse_and_log(model_name: str, model_id: str, converse_params: dict, app_id: str):
+    try:
+        response = bedrock_client.converse(
+            modelId=model_id,
+            **converse_params
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error invoking model: {str(e)}")
+
+    logger.info(f"Response: {response}")
+
+    # Check if the keys are present in the response
+    if "output" not in response or "usage" not in response:
+        raise HTTPException(status_code=500, detail="Unexpected response from model")
+
+    output_text =""
+    if "message" in response["output"] and "content" in response["output"]["message"] and len(response["output"]["message"]["content"]) > 0:
+        output_text = response["output"]["message"]["content"][0]["text"]
+
+    adapted_output = StandardOutput(
+        output_text=output_text,
+        input_tokens=response["usage"]["inputTokens"],
+        output_tokens=response["usage"]["outputTokens"]
+    )
+
+    save_invocation_log(
+        model_name=model_name,
+        model_id=model_id,
+        input_tokens=adapted_output.input_tokens,
+        output_tokens=adapted_output.output_tokens,
+        status="SUCCESS",
+        error_message="NA",
+        app_id=app_id
+    )
+
+    return adapted_output
+
+def embed_cache_prompt(text: str, app_id: str) -> List[float]:
+    """Embeds a prompt for the similarity tier of the response cache."""
+    standard_input = StandardInput(model_name=RESPONSE_CACHE_EMBED_MODEL, text_to_embed=text)
+    adapted_input = input_adapters[RESPONSE_CACHE_EMBED_MODEL](standard_input)
+    adapted_output = invoke_model_and_log(RESPONSE_CACHE_EMBED_MODEL, model_id_map[RESPONSE_CACHE_EMBED_MODEL], adapted_input, app_id)
+    return adapted_output.embedding
+
+def embed_texts(model_name: str, model_id: str, texts: List[str], input_type: Optional[str] = None):
+    """Embeds texts in a single Bedrock request. Returns the vectors and the input token count."""
+    _, batch_adapter, batch_output_adapter = embed_batch_adapters[model_name]
+    standard_input = StandardInput(model_name=model_name, texts=texts, input_type=input_type)
+    response = bedrock_client.invoke_model(
+        body=json.dumps(batch_adapter(standard_input)),
+        modelId=model_id
+    )
+    adapted_output = batch_output_adapter(json.loads(response['body'].read()))
+    if len(adapted_output.embeddings) != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings, got {len(adapted_output.embeddings)}")
+
+    input_tokens = adapted_output.input_tokens
+    if input_tokens is None:
+        # Cohere only reports token usage in the response headers
+        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        input_tokens = int(headers.get('x-amzn-bedrock-input-token-count', 0))
+    return adapted_output.embeddings, input_tokens
+
+def build_converse_params(request: InvokeModelRequest) -> dict:
+    """Builds the converse/converse_stream parameters for a messages prompt."""
+    if request.model_name in ["AI21_JURASSIC_2_ULTRA", "AI21_JURASSIC_2_MID", "COHERE_COMMAND_LIGHT_TEXT_V14", "COHERE_COMMAND_TEXT_V14"]:
+        if len(request.prompt) > 1:
+            request.prompt = [request.prompt[-1]]
+
+    inference_config = {}
+    if request.max_tokens:
+        inference_config["maxTokens"] = request.max_tokens
+    if request.temperature:
+        inference_config["temperature"] = request.temperature
+    if request.top_p:
+        inference_config["topP"] = request.top_p
+    if request.stop_sequences:
+        inference_config["stopSequences"] = request.stop_sequences
+
+    additional_model_request_fields = {}
+    if request.top_k and request.model_name != 'MISTRAL_LARGE_V1:0':
+        if 'ANTHROPIC' in request.model_name or 'MISTRAL' in request.model_name:
+            additional_model_request_fields["top_k"] = request.top_k
+        elif 'COHERE' in request.model_name:
+            additional_model_request_fields["k"] = request.top_k
+
+    return {
+        "messages": request.prompt,
+        "system": request.system_prompts if request.system_prompts else [],
+        "inferenceConfig": inference_config if inference_config else {},
+        "additionalModelRequestFields": additional_model_request_fields if additional_model_request_fields else {}
+    }
+
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def stream_model_and_log(model_name: str, model_id: str, app_id: str, adapted_input: Optional[dict] = None, converse_params: Optional[dict] = None):
+    """Streams a model response as server-sent events and logs token usage once the stream ends."""
+    input_tokens = 0
+    output_tokens = 0
+    try:
+        logger.info(f"Invoking model with response stream: {model_name}")
+        if converse_params is not None:
+            response = bedrock_client.converse_stream(modelId=model_id, **converse_params)
+            for event in response['stream']:
+                if 'contentBlockDelta' in event:
+                    output_text = event['contentBlockDelta'].get('delta', {}).get('text')
+                    if output_text:
+                        yield format_sse(StandardOutput(output_text=output_text).dict(exclude_none=True))
+                elif 'metadata' in event:
+                    usage = event['metadata'].get('usage', {})
+                    input_tokens = usage.get('inputTokens', input_tokens)
+                    output_tokens = usage.get('outputTokens', output_tokens)
+        else:
+            response = bedrock_client.invoke_model_with_response_stream(
+                body=json.dumps(adapted_input),
+                modelId=model_id
+            )
+            for event in response['body']:
+                if 'chunk' not in event:
+                    continue
+                chunk = json.loads(event['chunk']['bytes'])
+                adapted_output = stream_output_adapters[model_name](chunk)
+                if adapted_output.input_tokens is not None:
+                    input_tokens = adapted_output.input_tokens
+                if adapted_output.output_tokens is not None:
+                    output_tokens = adapted_output.output_tokens
+                if adapted_output.output_text:
+                    yield format_sse(StandardOutput(output_text=adapted_output.output_text).dict(exclude_none=True))
+
+        save_invocation_log(
+            model_name=model_name,
+            model_id=model_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            status="SUCCESS",
+            error_message="NA",
+            app_id=app_id
+        )
+        yield format_sse({"input_tokens": input_tokens, "output_tokens": output_tokens}, event="done")
+
+    except GeneratorExit:
+        # Client disconnected before the stream finished; tokens were still consumed.
+        save_invocation_log(
+            model_name=model_name,
+            model_id=model_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            status="CANCELLED",
+            error_message="Client disconnected",
+            app_id=app_id
+        )
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming model response: {e}")
+        save_invocation_log(
+            model_name=model_name,
+            model_id=model_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            status="FAILED",
+            error_message=str(e),
+            app_id=app_id
+        )
+        yield format_sse({"detail": f"Error invoking model: {str(e)}"}, event="error")
+
 def async_invoke_model(model_name: str, model_id: str, adapted_input: dict, app_id: str, invocation_id: str):
     try:
 
@@ -254,8 +432,9 @@ async def async_invoke_model_endpoint(request: InvokeModelRequest, background_ta
         adapted_input = input_adapters[request.model_name](standard_input)
 
         invocation_id = str(uuid.uuid4())
-        loop = asyncio.get_event_loop()
-        loop.run_in_executor(None, async_invoke_model, request.model_name, model_id, adapted_input, app_id, invocation_id)
+        task = asyncio.create_task(invocation_executor.run(request.model_name, async_invoke_model, request.model_name, model_id, adapted_input, app_id, invocation_id))
+        background_invocations.add(task)
+        task.add_done_callback(background_invocations.discard)
 
         return {"invocation_id": invocation_id}
     except HTTPException as e:
@@ -333,6 +512,23 @@ async def http_exception_handler(request, exc):
 async def health_check():
     return {"status": "UP"}
 
+@app.get("/model/service/metrics", include_in_schema=False)
+async def get_service_metrics():
+    metrics = invocation_executor.metrics()
+    metrics["invocation_logs"] = invocation_log_writer.metrics()
+    return metrics
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    invocation_executor.shutdown()
+    # Flush queued invocation logs before the task exits
+    invocation_log_writer.shutdown()
+
+@app.post("/model/service/auth/invalidate", include_in_schema=False)
+async def invalidate_auth_cache(request: InvalidateAuthCacheRequest, _: None = Depends(verify_platform_client)):
+    app_client_resolver.invalidate(client_id=request.client_id, app_id=request.app_id)
+    return {"status": "INVALIDATED"}
+
 @app.get("/model/service/meta", include_in_schema=False)
 async def get_metadata():
     return app.openapi()
@@ -409,6 +605,7 @@ async def invoke_model(request: InvokeModelRequest, app_id: str = Depends(get_ap
     | top_k           | Optional[int]                                             | The number of highest probability vocabulary tokens to keep for top-k filtering.                       |
     | stop_sequences  | Optional[List[str]]                                       | Sequences where the generation will stop.                                                             |
     | system_prompts  | Optional[List[Dict[str, str]]]                            | A list of dictionaries for system prompts, each with a single key "text".                              |
+    | cache           | Optional[bool]                                            | Serve identical (or, if enabled, near-identical) earlier requests of the app from the response cache. Defaults to false. |
 
     ***
     
@@ -501,6 +698,23 @@ async def invoke_model(request: InvokeModelRequest, app_id: str = Depends(get_ap
 
     logger.info(f"Model ID: {model_id}")
 
+    cache_lookup = None
+    if request.cache and response_cache:
+        cache_lookup = await asyncio.to_thread(response_cache.lookup, app_id, request.dict(exclude={"cache"}))
+        if cache_lookup.output is not None:
+            logger.info(f"Response cache hit ({cache_lookup.match}) for model: {request.model_name}")
+            # Tokens of the cached response are recorded as saved, not consumed
+            save_invocation_log(
+                model_name=request.model_name,
+                model_id=model_id,
+                input_tokens=cache_lookup.output.get("input_tokens"),
+                output_tokens=cache_lookup.output.get("output_tokens"),
+                status="CACHE_HIT",
+                error_message="NA",
+                app_id=app_id
+            )
+            return cache_lookup.output
+
     standard_input = StandardInput(
         model_name=request.model_name,
         prompt=request.prompt,
@@ -517,72 +731,91 @@ async def invoke_model(request: InvokeModelRequest, app_id: str = Depends(get_ap
 
     if isinstance(request.prompt, list):  # Handle messages input
 
-        if request.model_name in ["AI21_JURASSIC_2_ULTRA", "AI21_JURASSIC_2_MID", "COHERE_COMMAND_LIGHT_TEXT_V14", "COHERE_COMMAND_TEXT_V14"]:
-            if len(request.prompt) > 1:
-                request.prompt = [request.prompt[-1]]
-
-        inference_config = {}
-        if request.max_tokens:
-            inference_config["maxTokens"] = request.max_tokens
-        if request.temperature:
-            inference_config["temperature"] = request.temperature
-        if request.top_p:
-            inference_config["topP"] = request.top_p
-        if request.stop_sequences:
-            inference_config["stopSequences"] = request.stop_sequences
-
-        additional_model_request_fields = {}
-        if request.top_k and request.model_name != 'MISTRAL_LARGE_V1:0':
-            if 'ANTHROPIC' in request.model_name or 'MISTRAL' in request.model_name:
-                additional_model_request_fields["top_k"] = request.top_k
-            elif 'COHERE' in request.model_name:
-                additional_model_request_fields["k"] = request.top_k
-
-        messages = request.prompt
-        system_prompts = request.system_prompts if request.system_prompts else []
-
-        try:
-            response = bedrock_client.converse(
-                modelId=model_id,
-                messages=messages,
-                system=system_prompts,
-                inferenceConfig=inference_config if inference_config else {},
-                additionalModelRequestFields=additional_model_request_fields if additional_model_request_fields else {}
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error invoking model: {str(e)}")
+        converse_params = build_converse_params(request)
+        adapted_output = await invocation_executor.run(request.model_name, converse_and_log, request.model_name, model_id, converse_params, app_id)
 
-        logger.info(f"Response: {response}")
+    else:  # Handle text input
+        adapted_output = await invocation_executor.run(request.model_name, invoke_model_and_log, request.model_name, model_id, adapted_input, app_id)
 
-        # Check if the keys are present in the response
-        if "output" not in response or "usage" not in response:
-            raise HTTPException(status_code=500, detail="Unexpected response from model")
-        
-        output_text =""
-        if "message" in response["output"] and "content" in response["output"]["message"] and len(response["output"]["message"]["content"]) > 0:
-            output_text = response["output"]["message"]["content"][0]["text"]
-
-        adapted_output = StandardOutput(
-            output_text=output_text,
-            input_tokens=response["usage"]["inputTokens"],
-            output_tokens=response["usage"]["outputTokens"]
-        )
+    logger.info(f"Adapted Output: {adapted_output.dict()}")
+    if cache_lookup:
+        await asyncio.to_thread(response_cache.store, cache_lookup, adapted_output.dict(exclude_none=True))
+    return adapted_output.dict(exclude_none=True)
 
-        save_invocation_log(
-            model_name=request.model_name,
-            model_id=model_id,
-            input_tokens=adapted_output.input_tokens,
-            output_tokens=adapted_output.output_tokens,
-            status="SUCCESS",
-            error_message="NA",
-            app_id=app_id
-        )
+@app.post("/model/invoke_stream", tags=["Model Invocation"])
+async def invoke_model_stream(request: InvokeModelRequest, app_id: str = Depends(get_app_id_from_token)):
+    """
+    ## Endpoint to Invoke a Model on Bedrock with a Streamed Response
+    This endpoint accepts the same request body as `/model/invoke` and streams the generated text back as server-sent events (`text/event-stream`) while the model is generating.
+
+    ***
+
+    ## Request Body
+
+    Same as `/model/invoke`.
 
+    ***
+
+    ## Response Stream
+
+    | Event          | Data                                           | Description                                   |
+    |----------------|------------------------------------------------|-----------------------------------------------|
+    | (default)      | `{"output_text": "<text>"}`                    | A chunk of generated text.                    |
+    | done           | `{"input_tokens": 10, "output_tokens": 42}`    | Sent once when generation finishes.           |
+    | error          | `{"detail": "<message>"}`                      | Sent if the model fails mid-stream.           |
+
+    #### Example
+
+    ```
+    data: {"output_text": "Bonjour"}
+
+    data: {"output_text": ", comment allez-vous ?"}
+
+    event: done
+    data: {"input_tokens": 18, "output_tokens": 9}
+    ```
+
+    ***
+
+    #### Errors
+
+    - **400 Bad Request**: If the model is not supported or does not support streaming.
+    - **401 Unauthorized**: If the authorization header is missing or invalid.
+
+    """
+
+    logger.info(f"Received stream request: {request.dict()}")
+    logger.info(f"App ID: {app_id}")
+
+    if request.model_name not in input_adapters or request.model_name not in output_adapters:
+        raise HTTPException(status_code=400, detail=f"Unsupported model: {request.model_name}")
+
+    model_id = model_id_map.get(request.model_name)
+    if not model_id:
+        raise HTTPException(status_code=400, detail=f"Model ID not found for model: {request.model_name}")
+
+    if isinstance(request.prompt, list):  # Handle messages input
+        converse_params = build_converse_params(request)
+        stream = stream_model_and_log(request.model_name, model_id, app_id, converse_params=converse_params)
     else:  # Handle text input
-        adapted_output = invoke_model_and_log(request.model_name, model_id, adapted_input, app_id)
+        if request.model_name not in stream_output_adapters:
+            raise HTTPException(status_code=400, detail=f"Model does not support streaming: {request.model_name}")
 
-    logger.info(f"Adapted Output: {adapted_output.dict()}")
-    return adapted_output.dict(exclude_none=True)
+        standard_input = StandardInput(
+            model_name=request.model_name,
+            prompt=request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            top_p=request.top_p,
+            top_k=request.top_k,
+            stop_sequences=request.stop_sequences
+        )
+        adapted_input = input_adapters[request.model_name](standard_input)
+        if "stream" in adapted_input:
+            adapted_input["stream"] = True
+        stream = stream_model_and_log(request.model_name, model_id, app_id, adapted_input=adapted_input)
+
+    return StreamingResponse(invocation_executor.stream(request.model_name, stream), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.post("/model/embed", tags=["Model Invocation"])
 async def invoke_embed(request: InvokeEmbedModelRequest, app_id: str = Depends(get_app_id_from_token)):
@@ -646,12 +879,113 @@ async def invoke_embed(request: InvokeEmbedModelRequest, app_id: str = Depends(g
     
 
     adapted_input = input_adapters[request.model_name](standard_input)
-    adapted_output = invoke_model_and_log(request.model_name, model_id, adapted_input, app_id)
+    adapted_output = await invocation_executor.run(request.model_name, invoke_model_and_log, request.model_name, model_id, adapted_input, app_id)
     return adapted_output.dict(exclude_none=True)
 
+@app.post("/model/embed_batch", tags=["Model Invocation"])
+async def invoke_embed_batch(request: InvokeEmbedBatchModelRequest, app_id: str = Depends(get_app_id_from_token)):
+    """
+    ## Endpoint to Invoke Embed Models on a Batch of Texts
+    This endpoint embeds a list of texts in as few Bedrock requests as the model allows. Cohere models embed up to 96 texts per request; Titan models embed one text per request, and those requests run in parallel.
+
+    ***
+
+    #### Request Body
+
+    | Parameter    | Type            | Description                                                      |
+    |--------------|-----------------|------------------------------------------------------------------|
+    | model_name   | str             | The name of the embed model to invoke. Must be one of the supported models. |
+    | input_texts  | List[str]       | The texts to embed.                                              |
+    | input_type   | Optional[str]   | Cohere only: `search_document` (default), `search_query`, `classification` or `clustering`. |
+
+    ***
+
+    #### Response Body
+
+    | Field          | Type        | Description                                                      |
+    |----------------|-------------|------------------------------------------------------------------|
+    | results        | List[Dict]  | One entry per input text, in input order, with either an `embedding` or an `error`. |
+    | input_tokens   | int         | The number of input tokens used across the batch.                |
+    | success_count  | int         | The number of texts that were embedded.                          |
+    | failure_count  | int         | The number of texts that failed.                                 |
+
+    ***
+
+    #### Errors
+
+    - **400 Bad Request**: If the model is not an embed model or the batch is empty or too large.
+    - **401 Unauthorized**: If the authorization header is missing or invalid.
+
+    ***
+
+    #### Notes
+
+    A single invocation log is written per batch. It is marked FAILED only if every text failed.
+    """
+
+    if request.model_name not in embed_batch_adapters:
+        raise HTTPException(status_code=400, detail=f"Model is not an embed model: {request.model_name}")
+
+    model_id = model_id_map.get(request.model_name)
+    if not model_id:
+        raise HTTPException(status_code=400, detail=f"Model ID not found for model: {request.model_name}")
+
+    if not request.input_texts:
+        raise HTTPException(status_code=400, detail="input_texts must not be empty")
+    if len(request.input_texts) > EMBED_BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=400, detail=f"input_texts must not contain more than {EMBED_BATCH_MAX_TEXTS} texts")
+
+    results = [None] * len(request.input_texts)
+    indexes = []
+    for index, text in enumerate(request.input_texts):
+        if text and text.strip():
+            indexes.append(index)
+        else:
+            results[index] = {"error": "Text is empty"}
+
+    batch_size = embed_batch_adapters[request.model_name][0]
+    batches = [indexes[start:start + batch_size] for start in range(0, len(indexes), batch_size)]
+    responses = await asyncio.gather(*[
+        invocation_executor.run(request.model_name, embed_texts, request.model_name, model_id,
+                                [request.input_texts[index] for index in batch], request.input_type)
+        for batch in batches
+    ], return_exceptions=True)
+
+    input_tokens = 0
+    errors = []
+    for batch, response in zip(batches, responses):
+        if isinstance(response, Exception):
+            logger.error(f"Error embedding batch: {response}")
+            errors.append(str(response))
+            for index in batch:
+                results[index] = {"error": str(response)}
+            continue
+        embeddings, tokens = response
+        input_tokens += tokens
+        for index, embedding in zip(batch, embeddings):
+            results[index] = {"embedding": embedding}
+
+    failure_count = sum(1 for result in results if "error" in result)
+    save_invocation_log(
+        model_name=request.model_name,
+        model_id=model_id,
+        input_tokens=input_tokens,
+        output_tokens=0,
+        status="FAILED" if failure_count == len(results) else "SUCCESS",
+        error_message=f"{failure_count} of {len(results)} texts failed: {errors[0] if errors else 'Text is empty'}" if failure_count else "NA",
+        app_id=app_id
+    )
+
+    return {
+        "results": results,
+        "input_tokens": input_tokens,
+        "success_count": len(results) - failure_count,
+        "failure_count": failure_count
+    }
+
 @app.on_event("startup")
 async def fetch_metadata():
-    global session, bedrock_client, dynamodb, redis_client
+    global session, bedrock_client, dynamodb, redis_client, app_client_resolver, invocation_log_writer, response_cache
 
     if not ECS_METADATA_URL:
         raise HTTPException(status_code=500, detail="ECS_CONTAINER_METADATA_URI_V4 environment variable not set.")
@@ -665,8 +999,12 @@ async def fetch_metadata():
         session = boto3.Session(region_name=region_name)
         bedrock_client = session.client(service_name='bedrock-runtime', config=retry_config)
         dynamodb = session.client('dynamodb', region_name=region_name)
+        app_client_resolver = AppClientResolver(dynamodb, CLIENTS_TABLE)
+        invocation_log_writer = InvocationLogWriter(dynamodb, LOGGING_TABLE)
+        invocation_log_writer.start()
 
         redis_client = redis.Redis(host=REDIS_URL, port=REDIS_PORT, decode_responses=True, ssl=True)
+        response_cache = ResponseCache(redis_client, embed_fn=embed_cache_prompt)
 
         # Not used currently, but can be used to validate the JWT token
         COGNITO_JWKS_URL = f'https://cognito-idp.{region_name}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json'
@@ -0,0 +1,109 @@
+import os
+import json
+import asyncio
+import functools
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MODEL_INVOCATION_WORKERS = int(os.getenv('MODEL_INVOCATION_WORKERS', '64'))
+MODEL_CONCURRENCY_LIMIT = int(os.getenv('MODEL_CONCURRENCY_LIMIT', '16'))
+# JSON map of model_name -> concurrency limit, e.g. {"ANTHROPIC_CLAUDE_3_SONNET_V1": 8}
+MODEL_CONCURRENCY_LIMITS = json.loads(os.getenv('MODEL_CONCURRENCY_LIMITS', '{}'))
+
+_STREAM_END = object()
+
+
+class ModelInvocationExecutor:
+    """Runs blocking Bedrock calls on a bounded thread pool with a concurrency limit per model.
+
+    Requests over a model's limit wait on that model's semaphore instead of occupying a
+    worker thread, so one saturated model cannot starve the others. Queue depth and
+    in-flight counts are tracked per model and exposed through metrics().
+    """
+
+    def __init__(self, max_workers=MODEL_INVOCATION_WORKERS, default_limit=MODEL_CONCURRENCY_LIMIT, model_limits=None):
+        self.max_workers = max_workers
+        self.default_limit = default_limit
+        self.model_limits = model_limits if model_limits is not None else MODEL_CONCURRENCY_LIMITS
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock-invoke")
+        self._semaphores = {}
+        self._queued = defaultdict(int)
+        self._in_flight = defaultdict(int)
+        self._completed = defaultdict(int)
+
+    def _limit(self, model_name: str) -> int:
+        return int(self.model_limits.get(model_name, self.default_limit))
+
+    def _semaphore(self, model_name: str) -> asyncio.Semaphore:
+        if model_name not in self._semaphores:
+            self._semaphores[model_name] = asyncio.Semaphore(self._limit(model_name))
+        return self._semaphores[model_name]
+
+    async def run(self, model_name: str, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the worker pool once a slot for the model is free."""
+        loop = asyncio.get_running_loop()
+        self._queued[model_name] += 1
+        dequeued = False
+        try:
+            async with self._semaphore(model_name):
+                self._queued[model_name] -= 1
+                dequeued = True
+                self._in_flight[model_name] += 1
+                try:
+                    return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+                finally:
+                    self._in_flight[model_name] -= 1
+                    self._completed[model_name] += 1
+        finally:
+            if not dequeued:
+                self._queued[model_name] -= 1
+
+    async def stream(self, model_name: str, generator):
+        """Drains a blocking generator on the worker pool while holding a slot for the model."""
+        loop = asyncio.get_running_loop()
+        self._queued[model_name] += 1
+        dequeued = False
+        try:
+            async with self._semaphore(model_name):
+                self._queued[model_name] -= 1
+                dequeued = True
+                self._in_flight[model_name] += 1
+                try:
+                    while True:
+                        item = await loop.run_in_executor(self._executor, next, generator, _STREAM_END)
+                        if item is _STREAM_END:
+                            break
+                        yield item
+                finally:
+                    try:
+                        generator.close()
+                    except ValueError:
+                        # Still running on a worker after a client disconnect; it is closed when collected.
+                        pass
+                    self._in_flight[model_name] -= 1
+                    self._completed[model_name] += 1
+        finally:
+            if not dequeued:
+                self._queued[model_name] -= 1
+
+    def metrics(self) -> dict:
+        models = set(self._queued) | set(self._in_flight) | set(self._completed)
+        return {
+            "max_workers": self.max_workers,
+            "queued": sum(self._queued.values()),
+            "in_flight": sum(self._in_flight.values()),
+            "models": {
+                model_name: {
+                    "limit": self._limit(model_name),
+                    "queued": self._queued[model_name],
+                    "in_flight": self._in_flight[model_name],
+                    "completed": self._completed[model_name]
+                } for model_name in sorted(models)
+            }
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import threading
+from collections import defaultdict
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+INVOCATION_LOG_QUEUE_SIZE = int(os.getenv('INVOCATION_LOG_QUEUE_SIZE', '10000'))
+INVOCATION_LOG_FLUSH_INTERVAL = float(os.getenv('INVOCATION_LOG_FLUSH_INTERVAL', '1.0'))  # in seconds
+INVOCATION_LOG_MAX_RETRIES = int(os.getenv('INVOCATION_LOG_MAX_RETRIES', '5'))
+# When set, batches that cannot be written (throttling, full queue) are spilled to this
+# directory as JSON lines and replayed once DynamoDB accepts writes again.
+INVOCATION_LOG_SPILL_DIR = os.getenv('INVOCATION_LOG_SPILL_DIR')
+INVOCATION_LOG_REPLAY_INTERVAL = float(os.getenv('INVOCATION_LOG_REPLAY_INTERVAL', '30'))  # in seconds
+
+BATCH_WRITE_MAX_ITEMS = 25
+THROTTLING_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded")
+
+_STOP = object()
+
+
+class InvocationLogWriter:
+    """Writes model invocation logs to DynamoDB off the request path.
+
+    Logs are put on a bounded in-memory queue and drained by a background thread in
+    BatchWriteItem calls of up to 25 items. Unprocessed items are retried with backoff.
+    If a spill directory is configured, batches that still fail (or logs that arrive
+    while the queue is full) are written to local disk and replayed later; otherwise
+    they are written inline or dropped with an error log as a last resort.
+    """
+
+    def __init__(self, dynamodb_client, table_name, max_queue_size=INVOCATION_LOG_QUEUE_SIZE,
+                 flush_interval=INVOCATION_LOG_FLUSH_INTERVAL, max_retries=INVOCATION_LOG_MAX_RETRIES,
+                 spill_dir=INVOCATION_LOG_SPILL_DIR, replay_interval=INVOCATION_LOG_REPLAY_INTERVAL):
+        self.dynamodb = dynamodb_client
+        self.table_name = table_name
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spill_dir = spill_dir
+        self.replay_interval = replay_interval
+        self._next_replay = 0.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._serializer = TypeSerializer()
+        self._thread = None
+        self._spill_lock = threading.Lock()
+        self._counters = defaultdict(int)
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="invocation-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, invocation):
+        """Queues a ModelInvocationLogs record for writing without blocking the caller."""
+        item = self._serialize(invocation)
+        try:
+            self._queue.put_nowait(item)
+            self._counters["submitted"] += 1
+        except queue.Full:
+            logger.warning("Invocation log queue is full")
+            if self.spill_dir:
+                self._spill([item])
+            else:
+                self._write_batch([item])
+
+    def shutdown(self, timeout=None):
+        """Flushes everything still queued and stops the background thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def metrics(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self._counters["submitted"],
+            "written": self._counters["written"],
+            "retried": self._counters["retried"],
+            "spilled": self._counters["spilled"],
+            "replayed": self._counters["replayed"],
+            "dropped": self._counters["dropped"],
+            "spill_files": len(self._spill_files())
+        }
+
+    def _serialize(self, invocation) -> dict:
+        data = json.loads(invocation.json())
+        return {key: self._serializer.serialize(value) for key, value in data.items() if value is not None}
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < BATCH_WRITE_MAX_ITEMS:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            if stopping:
+                batch.extend(self._drain())
+            for start in range(0, len(batch), BATCH_WRITE_MAX_ITEMS):
+                self._write_or_spill(batch[start:start + BATCH_WRITE_MAX_ITEMS])
+            if self.spill_dir and (stopping or time.monotonic() >= self._next_replay):
+                self._next_replay = time.monotonic() + self.replay_interval
+                self._replay_spilled()
+
+    def _drain(self) -> list:
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _write_or_spill(self, items):
+        unprocessed = self._write_batch(items, drop=not self.spill_dir)
+        if unprocessed:
+            self._spill(unprocessed)
+
+    def _write_batch(self, items, drop=True) -> list:
+        """Writes up to 25 items, retrying unprocessed ones. Returns items that could not be written."""
+        requests = [{"PutRequest": {"Item": item}} for item in items]
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._counters["retried"] += len(requests)
+                time.sleep(min(0.05 * 2 ** attempt, 5) * random.uniform(0.5, 1.5))
+            try:
+                response = self.dynamodb.batch_write_item(RequestItems={self.table_name: requests})
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in THROTTLING_ERRORS:
+                    logger.warning(f"Invocation log write throttled: {e}")
+                    continue
+                logger.error(f"Error writing invocation logs: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Error writing invocation logs: {e}")
+                break
+
+            written = len(requests)
+            requests = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            self._counters["written"] += written - len(requests)
+            if not requests:
+                return []
+
+        remaining = [request["PutRequest"]["Item"] for request in requests]
+        if drop:
+            logger.error(f"Dropping {len(remaining)} invocation logs after {self.max_retries} retries")
+            self._counters["dropped"] += len(remaining)
+            return []
+        return remaining
+
+    def _spill(self, items):
+        path = os.path.join(self.spill_dir, f"{time.time_ns()}-{uuid.uuid4().hex}.jsonl")
+        with self._spill_lock:
+            with open(path + ".tmp", "w") as f:
+                for item in items:
+                    f.write(json.dumps(item) + "\n")
+            os.replace(path + ".tmp", path)
+        self._counters["spilled"] += len(items)
+        logger.warning(f"Spilled {len(items)} invocation logs to {path}")
+
+    def _spill_files(self) -> list:
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return []
+        return sorted(name for name in os.listdir(self.spill_dir) if name.endswith(".jsonl"))
+
+    def _replay_spilled(self):
+        for name in self._spill_files():
+            path = os.path.join(self.spill_dir, name)
+            with open(path) as f:
+                items = [json.loads(line) for line in f if line.strip()]
+            for start in range(0, len(items), BATCH_WRITE_MAX_ITEMS):
+                unprocessed = self._write_batch(items[start:start + BATCH_WRITE_MAX_ITEMS], drop=False)
+                if unprocessed:
+                    # Still throttled; keep what is left on disk and try again later
+                    remaining = unprocessed + items[start + BATCH_WRITE_MAX_ITEMS:]
+                    with self._spill_lock:
+                        with open(path + ".tmp", "w") as f:
+                            for item in remaining:
+                                f.write(json.dumps(item) + "\n")
+                        os.replace(path + ".tmp", path)
+                    self._counters["replayed"] += len(items) - len(remaining)
+                    return
+            os.remove(path)
+            self._counters["replayed"] += len(items)
@@ -3,7 +3,7 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any, Union, Tuple
 
 from dyntastic import Dyntastic
-from pydantic import Field, validator
+from pydantic import Field, validator, model_validator
 import os
 from pydantic import BaseModel
 from enum import Enum
@@ -35,6 +35,7 @@ class InvokeModelRequest(BaseModel):
     stop_sequences: Optional[List[str]] = None
     system_prompts: Optional[List[Dict[str, Union[str, List[Dict[str, str]]]]]] = Field(None,
     example=[{"text":"You are a helpful assistant."}])
+    cache: Optional[bool] = False
 
     @validator('prompt', pre=True, always=True)
     def check_prompt(cls, v):
@@ -54,4 +55,20 @@ class InvokeModelWithRawInputRequest(BaseModel):
 
 class InvokeEmbedModelRequest(BaseModel):
     model_name: str
-    input_text: Optional[str] = None
\ No newline at end of file
+    input_text: Optional[str] = None
+
+class InvokeEmbedBatchModelRequest(BaseModel):
+    model_name: str
+    input_texts: List[str]
+    input_type: Optional[str] = None
+
+
+class InvalidateAuthCacheRequest(BaseModel):
+    client_id: Optional[str] = None
+    app_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if not self.client_id and not self.app_id:
+            raise ValueError("client_id or app_id is required")
+        return self
@@ -0,0 +1,184 @@
+import os
+import json
+import math
+import time
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))  # in seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))  # per app
+RESPONSE_CACHE_MAX_RESPONSE_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_RESPONSE_BYTES', '65536'))
+# Enables the near-duplicate tier when set, e.g. 0.95. Prompts are embedded with RESPONSE_CACHE_EMBED_MODEL.
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(os.getenv('RESPONSE_CACHE_SIMILARITY_THRESHOLD', '0') or 0) or None
+RESPONSE_CACHE_EMBED_MODEL = os.getenv('RESPONSE_CACHE_EMBED_MODEL', 'TITAN_TEXT_EMBED_V2')
+
+KEY_PREFIX = "response_cache"
+
+
+def canonical_hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def split_prompt(payload: dict):
+    """Separates the text of the latest user turn from the rest of the request.
+
+    Returns (context, text): context is the request with that text blanked out, so only
+    prompts that share everything else (model, parameters, system prompts, history) are
+    compared by similarity.
+    """
+    context = json.loads(json.dumps(payload))
+    prompt = context.get("prompt")
+    if isinstance(prompt, str):
+        context["prompt"] = None
+        return context, prompt
+
+    for message in reversed(prompt or []):
+        if message.get("role") != "user" or not isinstance(message.get("content"), list):
+            continue
+        texts = [block.get("text") for block in message["content"] if isinstance(block, dict) and block.get("text")]
+        for block in message["content"]:
+            if isinstance(block, dict) and "text" in block:
+                block["text"] = None
+        return context, "\n".join(texts)
+    return context, None
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class CacheLookup:
+    app_id: str
+    key: str
+    context_key: str
+    prompt_text: Optional[str] = None
+    embedding: Optional[List[float]] = None
+    output: Optional[dict] = None
+    match: Optional[str] = None
+    similarity: Optional[float] = None
+
+
+class ResponseCache:
+    """Caches model responses in Redis, scoped per app.
+
+    Entries are keyed by a canonical hash of the normalized request. When a similarity
+    threshold and an embedding function are configured, a miss on the exact key falls
+    back to comparing the prompt's embedding against cached prompts that share the same
+    context. Each app keeps at most max_entries entries; the oldest are evicted first.
+    All keys of an app share a Redis hash tag so they live in the same cluster slot.
+    """
+
+    def __init__(self, redis_client, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_response_bytes=RESPONSE_CACHE_MAX_RESPONSE_BYTES,
+                 similarity_threshold=RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+                 embed_fn: Optional[Callable[[str, str], List[float]]] = None):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_response_bytes = max_response_bytes
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return bool(self.similarity_threshold and self.embed_fn)
+
+    def _entry_key(self, app_id, key):
+        return f"{KEY_PREFIX}:{{{app_id}}}:entry:{key}"
+
+    def _index_key(self, app_id):
+        return f"{KEY_PREFIX}:{{{app_id}}}:index"
+
+    def _vectors_key(self, app_id, context_key):
+        return f"{KEY_PREFIX}:{{{app_id}}}:vectors:{context_key}"
+
+    def lookup(self, app_id: str, payload: dict) -> CacheLookup:
+        """Looks up a cached response for the normalized request payload.
+
+        The returned CacheLookup has output set on a hit; on a miss, pass it to store()
+        once the model has responded so the prompt embedding is not computed twice.
+        """
+        context, prompt_text = split_prompt(payload)
+        lookup = CacheLookup(app_id=app_id, key=canonical_hash(payload), context_key=canonical_hash(context),
+                             prompt_text=prompt_text)
+        try:
+            cached = self.redis.get(self._entry_key(app_id, lookup.key))
+            if cached:
+                lookup.output = json.loads(cached)["output"]
+                lookup.match = "exact"
+                return lookup
+
+            if self.semantic_enabled and prompt_text:
+                self._semantic_lookup(lookup)
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+        return lookup
+
+    def _semantic_lookup(self, lookup: CacheLookup):
+        lookup.embedding = self.embed_fn(lookup.prompt_text, lookup.app_id)
+        vectors_key = self._vectors_key(lookup.app_id, lookup.context_key)
+        candidates = self.redis.hgetall(vectors_key)
+
+        best_key, best_score = None, -1.0
+        for key, embedding in candidates.items():
+            score = cosine_similarity(lookup.embedding, json.loads(embedding))
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is None or best_score < self.similarity_threshold:
+            return
+
+        cached = self.redis.get(self._entry_key(lookup.app_id, best_key))
+        if not cached:
+            # The entry expired or was evicted; drop its vector too
+            self.redis.hdel(vectors_key, best_key)
+            return
+        lookup.output = json.loads(cached)["output"]
+        lookup.match = "semantic"
+        lookup.similarity = best_score
+
+    def store(self, lookup: CacheLookup, output: dict):
+        """Caches a model response for a lookup that missed."""
+        entry = json.dumps({"output": output, "created_at": time.time()})
+        if len(entry) > self.max_response_bytes:
+            return
+
+        app_id = lookup.app_id
+        index_key = self._index_key(app_id)
+        now = time.time()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(self._entry_key(app_id, lookup.key), entry, ex=self.ttl)
+            pipe.zadd(index_key, {f"{lookup.context_key}:{lookup.key}": now})
+            pipe.expire(index_key, self.ttl)
+            if lookup.embedding is not None:
+                vectors_key = self._vectors_key(app_id, lookup.context_key)
+                pipe.hset(vectors_key, lookup.key, json.dumps(lookup.embedding))
+                pipe.expire(vectors_key, self.ttl)
+            pipe.execute()
+            self._evict(app_id, now)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    def _evict(self, app_id: str, now: float):
+        index_key = self._index_key(app_id)
+        expired = self.redis.zrangebyscore(index_key, 0, now - self.ttl)
+        overflow = self.redis.zcard(index_key) - len(expired) - self.max_entries
+        if overflow > 0:
+            expired += self.redis.zrange(index_key, len(expired), len(expired) + overflow - 1)
+        if not expired:
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        for member in expired:
+            context_key, key = member.split(":", 1)
+            pipe.delete(self._entry_key(app_id, key))
+            pipe.hdel(self._vectors_key(app_id, context_key), key)
+        pipe.zrem(index_key, *expired)
+        pipe.execute()
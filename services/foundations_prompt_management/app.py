@@ -12,6 +12,7 @@ from fastapi import FastAPI, HTTPException, Depends, Request
 from pydantic import BaseModel
 from collections import defaultdict
 from models import *
+from auth import AppClientResolver, check_platform_client
 from dyntastic import A
 from fastapi.exceptions import RequestValidationError
 from fastapi.encoders import jsonable_encoder
@@ -33,6 +34,7 @@ COGNITO_JWKS_URL = ''
 # clients_table = None
 metadata = {}
 dynamodb = None
+app_client_resolver = None
 
 app = FastAPI()
 
@@ -47,17 +49,7 @@ def decode_token_without_verification(token: str):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def get_app_id_from_dynamodb(client_id: str):
-    table = dynamodb.Table(CLIENTS_TABLE)
-    response = table.scan()
-    print(f"Response: {response}")
-    items = response['Items']
-    if not items:
-        raise HTTPException(status_code=401, detail="No items found in DynamoDB")
-    for item in items:
-        if 'client_id' in item and client_id == item['client_id']:
-            return item['app_id']
-
-    raise HTTPException(status_code=401, detail="Client ID not found in DynamoDB")
+    return app_client_resolver.get_app_id(client_id)
 
 async def get_app_id_from_token(request: Request):
 
@@ -74,6 +66,13 @@ async def get_app_id_from_token(request: Request):
     except KeyError:
         raise HTTPException(status_code=401, detail="Client ID not found in token")
 
+async def verify_platform_client(request: Request):
+    authorization: str = request.headers.get("Authorization")
+    if authorization is None:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+    decoded_token = decode_token_without_verification(authorization.replace("Bearer ", ""))
+    check_platform_client(decoded_token.get('client_id'))
+
 #################### END COGNITO AUTHENTICATION ####################
 
 
@@ -119,6 +118,11 @@ def get_new_version(template_name: str,app_id):
 async def health_check():
     return {"status": "UP"}
 
+@app.post("/prompt/service/auth/invalidate", include_in_schema=False)
+async def invalidate_auth_cache(request: InvalidateAuthCacheRequest, _: None = Depends(verify_platform_client)):
+    app_client_resolver.invalidate(client_id=request.client_id, app_id=request.app_id)
+    return {"status": "INVALIDATED"}
+
 @app.get("/prompt/service/meta", include_in_schema=False)
 async def get_metadata():
     return app.openapi()
@@ -416,7 +420,7 @@ async def list_prompt_template(app_id: str = Depends(get_app_id_from_token)):
     
 @app.on_event("startup")
 async def startup_event():
-    global metadata,dynamodb, COGNITO_JWKS_URL, clients_table
+    global metadata,dynamodb, COGNITO_JWKS_URL, clients_table, app_client_resolver
 
     if not ECS_METADATA_URL:
         raise HTTPException(status_code=500, detail="ECS_CONTAINER_METADATA_URI_V4 environment variable not set.")
@@ -427,6 +431,7 @@ async def startup_event():
         metadata = response.json()
         region_name = metadata.get("Labels", {}).get("com.amazonaws.ecs.task-arn", "").split(":")[3]
         dynamodb = boto3.resource('dynamodb',region_name=region_name)
+        app_client_resolver = AppClientResolver(dynamodb.meta.client, CLIENTS_TABLE)
         table = dynamodb.Table(PROMPT_TEMPLATE_TABLE)
 
     except requests.exceptions.RequestException as e:
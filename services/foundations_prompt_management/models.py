@@ -3,7 +3,7 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 
 from dyntastic import Dyntastic
-from pydantic import Field
+from pydantic import Field, model_validator
 import os
 from pydantic import BaseModel
 from enum import Enum
@@ -39,6 +39,16 @@ class TemplateResponse(BaseModel):
     prompt_template: str
     version: int
 
+class InvalidateAuthCacheRequest(BaseModel):
+    client_id: Optional[str] = None
+    app_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if not self.client_id and not self.app_id:
+            raise ValueError("client_id or app_id is required")
+        return self
+
 
 
 
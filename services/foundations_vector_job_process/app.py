@@ -1,7 +1,6 @@
 import json
 import logging
 import os
-import asyncio
 from fastapi import FastAPI, BackgroundTasks, HTTPException, Depends
 from pydantic import BaseModel
 import boto3
@@ -11,6 +10,13 @@ import requests
 from models import VectorizationJobs, VectorizationJobFiles
 
 from utils.vectorize import OpenSearchVectorDB
+from utils.local_vector_db import LocalVectorDB
+from utils.local_vector_index import is_local_host
+from utils.vector_db_pool import VectorDBPool
+from utils.embedding import EMBEDDING_MODEL_ID
+from utils.index_manifest import IndexManifest, source_path
+from utils.sqs_consumer import SQSConsumer
+from functools import partial
 
 
 # Configure structured logging
@@ -38,9 +44,7 @@ dynamodb = None
 
 retry_config = Config(retries={"max_attempts": MAX_RETRIES, "mode": "standard"})
 
-# Background task checking interval (in seconds)
-CHECK_INTERVAL = 60
-poll_task = None
+consumer = None
 
 app = FastAPI()
 
@@ -55,8 +59,16 @@ def get_boto3_clients(region_name):
     dynamodb_client = session.client('dynamodb', config=retry_config)
     return s3_client, sqs_client, dynamodb_client
 
-def get_vector_db(host: str, index_name: str) -> OpenSearchVectorDB:
-    return OpenSearchVectorDB(host=host, index_name=index_name, region_name=REGION_NAME)
+def create_vector_db(host: str, index_name: str, region_name: str, embedding_model_id: str = EMBEDDING_MODEL_ID, dimension: int = None) -> OpenSearchVectorDB:
+    if is_local_host(host):
+        return LocalVectorDB(host=host, index_name=index_name, region_name=region_name, embedding_model_id=embedding_model_id, dimension=dimension)
+    return OpenSearchVectorDB(host=host, index_name=index_name, region_name=region_name, embedding_model_id=embedding_model_id, dimension=dimension)
+
+# Messages for the same index reuse one OpenSearch client instead of building one per file
+vector_db_pool = VectorDBPool(create_vector_db)
+
+def get_vector_db(host: str, index_name: str, embedding_model_id: str = EMBEDDING_MODEL_ID, dimension: int = None) -> OpenSearchVectorDB:
+    return vector_db_pool.get(host, index_name, REGION_NAME, embedding_model_id=embedding_model_id, dimension=dimension)
 
 def update_job_entry(job_id: str, status:str, dynamodb):
     try:
@@ -101,32 +113,49 @@ def update_job_file_entry(file_id:str, status:str, dynamodb):
         logger.error(f"Error occurred while saving results: {e}")
     
 
-async def perform_vectorization(file_path: str, file_id: str, app_id: str, vectorize_job_id: str, index_id: str, host:str, dynamodb, s3_client, sqs_client, receipt_handle: str):
-    try:
-        
-        await extend_visibility_timeout(sqs_client, receipt_handle)
+def vectorization_completed(message) -> bool:
+    """True when an earlier delivery of the message already vectorized its file."""
+    vectorize_job_file = VectorizationJobFiles.safe_get(json.loads(message['Body'])['file_id'])
+    return vectorize_job_file is not None and vectorize_job_file.status == 'COMPLETED'
+
+def handle_vectorization(message, dynamodb, s3_client) -> bool:
+    """Vectorizes the chunk file of one queue message. Returns True when the message should be deleted."""
+    message_body = json.loads(message['Body'])
+    file_path = message_body['file_path']
+    app_id = message_body['app_id']
+    index_id = message_body['index_id']
+    index_name = message_body['index_name']
+    host = message_body['host']
+    file_id = message_body['file_id']
+    vectorize_job_id = message_body['vectorize_job_id']
+    mode = message_body.get('mode', 'full')
+    # Chunk files are stored under {app_id}/{extraction_job_id}/{file_name}/, which names their source document
+    source = message_body.get('source_path') or source_path(file_path)
+    # Messages queued before indexes recorded their model use the default model
+    embedding_model_id = message_body.get('embedding_model_id', EMBEDDING_MODEL_ID)
+    dimension = message_body.get('dimension')
 
+    try:
         # Read the text from the S3 file
-        vector_db = get_vector_db(host, index_id)
+        # vector_db = get_vector_db(host, index_id)
+        vector_db = get_vector_db(host, index_name, embedding_model_id, dimension)
         txt = vector_db.read_s3_txt(file_path, RESULTS_S3_BUCKET, s3_client)
 
-        # Vectorize the text and store in OpenSearch
-        vector_db.vectorize_and_store(txt)
+        # Vectorize the text and store in OpenSearch, replacing what this file indexed before
+        manifest = IndexManifest.load(s3_client, RESULTS_S3_BUCKET, index_id, source)
+        try:
+            result = vector_db.vectorize_and_store(txt, manifest=manifest, incremental=(mode == 'incremental'))
+        finally:
+            manifest.save(s3_client, RESULTS_S3_BUCKET)
+        logger.info(f"Vectorized {file_path} ({mode}): {result}")
 
         # Sample similiarity search
         # sim_docs = vector_db.docsearch.similarity_search("intrafusal fibers")
-        
-        sqs_client.delete_message(
-            QueueUrl=VECTORIZATION_QUEUE_URL,
-            ReceiptHandle=receipt_handle
-        )
-
-        print(f"Deleted message from queue: {receipt_handle}")
 
         # Update the job status in the database
         update_job_file_entry(file_id, 'COMPLETED', dynamodb)
         update_job_entry(vectorize_job_id, 'COMPLETED', dynamodb)
-
+        return True
 
     except Exception as e:
         job_results = {
@@ -135,112 +164,17 @@ async def perform_vectorization(file_path: str, file_id: str, app_id: str, vecto
         }
         update_job_file_entry(file_id, 'FAILED', dynamodb)
         update_job_entry(app_id, 'FAILED', dynamodb)
-        logger.error(f"Error occurred during extraction for job {job_id}: {e}")
-
-async def poll_sqs(sqs_client, dynamodb, s3_client, semaphore):
-    logger.info("Polling SQS queue")
-    
-    while True:
-        print("Polling SQS queue")
-        try:
-            response = sqs_client.receive_message(
-                QueueUrl=VECTORIZATION_QUEUE_URL,
-                MaxNumberOfMessages=3,
-                WaitTimeSeconds=5,
-                VisibilityTimeout=VISIBILITY_TIMEOUT  # initial visibility timeout
-            )
-            messages = response.get('Messages', [])
-            logger.info(f"Received {len(messages)} messages")
-            for message in messages:
-                await semaphore.acquire()
-                loop = asyncio.get_event_loop()
-                loop.run_in_executor(None, handle_vectorization, semaphore, message, dynamodb, s3_client, sqs_client, message['ReceiptHandle'])
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Error occurred: {e}")
-            await asyncio.sleep(5)
-
-def handle_vectorization(semaphore, message, dynamodb, s3_client, sqs_client, receipt_handle):
-    try:
-        message_body = json.loads(message['Body'])
-        file_path = message_body['file_path']
-        app_id = message_body['app_id']
-        index_id = message_body['index_id']
-        index_name = message_body['index_name']
-        host = message_body['host']
-        file_id = message_body['file_id']
-        vectorize_job_id = message_body['vectorize_job_id']
-
-        # await perform_vectorization(file_path, file_id, app_id, vectorize_job_id, index_name, host, dynamodb, s3_client, sqs_client, receipt_handle)
-        try:
-        
-            extend_visibility_timeout(sqs_client, receipt_handle)
-
-            # Read the text from the S3 file
-            # vector_db = get_vector_db(host, index_id)
-            vector_db = get_vector_db(host, index_name)
-            txt = vector_db.read_s3_txt(file_path, RESULTS_S3_BUCKET, s3_client)
-
-            # Vectorize the text and store in OpenSearch
-            vector_db.vectorize_and_store(txt)
-
-            # Sample similiarity search
-            # sim_docs = vector_db.docsearch.similarity_search("intrafusal fibers")
-            
-            sqs_client.delete_message(
-                QueueUrl=VECTORIZATION_QUEUE_URL,
-                ReceiptHandle=receipt_handle
-            )
-
-            print(f"Deleted message from queue: {receipt_handle}")
-
-            # Update the job status in the database
-            update_job_file_entry(file_id, 'COMPLETED', dynamodb)
-            update_job_entry(vectorize_job_id, 'COMPLETED', dynamodb)
-
-
-        except Exception as e:
-            job_results = {
-                'status': "Failed",
-                'error': str(e)
-            }
-            update_job_file_entry(file_id, 'FAILED', dynamodb)
-            update_job_entry(app_id, 'FAILED', dynamodb)
-            logger.error(f"Error occurred during vectorization: {e}")
-    finally:
-        semaphore.release()
-
-def extend_visibility_timeout(sqs_client, receipt_handle):
-    try:
-        sqs_client.change_message_visibility(
-            QueueUrl=VECTORIZATION_QUEUE_URL,
-            ReceiptHandle=receipt_handle,
-            VisibilityTimeout=VISIBILITY_TIMEOUT  # extend the visibility timeout
-        )
-    except Exception as e:
-        logger.error(f"Failed to extend visibility timeout: {e}")
-
-async def ensure_task_running(background_tasks: BackgroundTasks, sqs_client, dynamodb, s3_client):
-    global poll_task
-    logger.info("Starting background task")
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
-    while True:
-        if poll_task is None or poll_task.done():
-            logger.info("Polling task not running or done, starting new task")
-            poll_task = asyncio.create_task(poll_sqs(sqs_client, dynamodb, s3_client, semaphore))
-            background_tasks.add_task(lambda: poll_task)
-            logger.info("Started new polling task")
-        await asyncio.sleep(CHECK_INTERVAL)
-
+        logger.error(f"Error occurred during vectorization: {e}")
+        return False
 
 @app.get("/vectorization/service/health")
 async def health_check():
     return {"status": "UP"}
 
 @app.on_event("startup")
-async def startup_event(background_tasks: BackgroundTasks = BackgroundTasks()):
+async def startup_event():
 
-    global REGION_NAME
+    global REGION_NAME, consumer
 
     if not ECS_METADATA_URL:
         raise HTTPException(status_code=500, detail="ECS_CONTAINER_METADATA_URI_V4 environment variable not set.")
@@ -258,4 +192,22 @@ async def startup_event(background_tasks: BackgroundTasks = BackgroundTasks()):
         raise HTTPException(status_code=500, detail=f"Error retrieving ECS metadata: {str(e)}")
 
 
-    asyncio.create_task(ensure_task_running(background_tasks, sqs_client, dynamodb_client, s3_client))
+    consumer = SQSConsumer(
+        sqs_client,
+        VECTORIZATION_QUEUE_URL,
+        partial(handle_vectorization, dynamodb=dynamodb_client, s3_client=s3_client),
+        max_concurrency=MAX_CONCURRENT_TASKS,
+        visibility_timeout=VISIBILITY_TIMEOUT,
+        is_completed=vectorization_completed,
+        name="vectorization"
+    )
+    consumer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if consumer:
+        await consumer.stop()
+
+@app.get("/vectorization/service/metrics", include_in_schema=False)
+async def get_service_metrics():
+    return {"consumer": consumer.stats() if consumer else None, "vector_db_pool": vector_db_pool.stats()}
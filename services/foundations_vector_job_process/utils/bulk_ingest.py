@@ -0,0 +1,274 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+import collections
+import concurrent.futures
+from typing import Iterable, List, Optional
+
+from opensearchpy.exceptions import TransportError
+from opensearchpy.helpers import expand_action
+
+logger = logging.getLogger("document_processor")
+
+VECTORIZE_EMBED_BATCH_SIZE = int(os.getenv('VECTORIZE_EMBED_BATCH_SIZE', '64'))  # chunks per embedding batch
+VECTORIZE_MAX_PENDING_BATCHES = int(os.getenv('VECTORIZE_MAX_PENDING_BATCHES', '4'))  # embedded batches waiting to be indexed
+OPENSEARCH_BULK_SIZE = int(os.getenv('OPENSEARCH_BULK_SIZE', '200'))  # documents per bulk request
+OPENSEARCH_BULK_MAX_BYTES = int(os.getenv('OPENSEARCH_BULK_MAX_BYTES', str(5 * 1024 * 1024)))
+OPENSEARCH_BULK_THREADS = int(os.getenv('OPENSEARCH_BULK_THREADS', '1'))  # bulk requests in flight at once
+OPENSEARCH_BULK_MAX_RETRIES = int(os.getenv('OPENSEARCH_BULK_MAX_RETRIES', '3'))  # for 429 responses
+OPENSEARCH_BULK_INITIAL_BACKOFF = float(os.getenv('OPENSEARCH_BULK_INITIAL_BACKOFF', '2'))  # seconds, doubled per retry
+OPENSEARCH_BULK_MAX_BACKOFF = 600
+MAX_REPORTED_ERRORS = 5
+
+_DONE = object()
+
+
+class BulkIngestReport:
+    """Outcome of a streaming ingestion, with failures grouped by embedding batch.
+
+    document_ids maps the id of every indexed document to the _id OpenSearch stored it
+    under. They differ on AOSS vector collections, which assign their own _id.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.indexed = 0
+        self.failed = 0
+        self.failed_batches = {}
+        self.document_ids = {}
+
+    def record(self, batch_number: int, ok: bool, item: dict, doc_id: Optional[str] = None):
+        self.total += 1
+        if ok:
+            self.indexed += 1
+            if doc_id is not None:
+                self.document_ids[doc_id] = next(iter(item.values()), {}).get("_id", doc_id)
+            return
+        self.failed += 1
+        batch = self.failed_batches.setdefault(batch_number, {"batch": batch_number, "failed": 0, "errors": []})
+        batch["failed"] += 1
+        if len(batch["errors"]) < MAX_REPORTED_ERRORS:
+            result = next(iter(item.values()), {})
+            batch["errors"].append(str(result.get("error", result)))
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "failed_batches": list(self.failed_batches.values())
+        }
+
+
+class BulkIngestError(Exception):
+    """Raised when ingestion stops partway; report holds the documents indexed before it did."""
+
+    def __init__(self, error, report: BulkIngestReport):
+        super().__init__(str(error))
+        self.report = report
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def batched(items: Iterable, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_actions(client, actions: Iterable[tuple], bulk_size=OPENSEARCH_BULK_SIZE, max_chunk_bytes=OPENSEARCH_BULK_MAX_BYTES):
+    """Groups (key, action) pairs into bulk requests of at most bulk_size actions and max_chunk_bytes bytes.
+
+    Each request is a list of (key, action, lines), with the action serialized to its bulk lines.
+    """
+    serializer = client.transport.serializer
+    chunk, chunk_bytes = [], 0
+    for key, action in actions:
+        operation, source = expand_action(action)
+        lines = serializer.dumps(operation) + "\n" + (serializer.dumps(source) + "\n" if source is not None else "")
+        size = len(lines.encode("utf-8"))
+        if chunk and (len(chunk) == bulk_size or chunk_bytes + size > max_chunk_bytes):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append((key, action, lines))
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def send_chunk(client, chunk: list, max_retries=OPENSEARCH_BULK_MAX_RETRIES,
+               initial_backoff=OPENSEARCH_BULK_INITIAL_BACKOFF) -> list:
+    """Sends one chunk_actions request and returns (ok, item) for each of its actions, in the order of the chunk.
+
+    The items of a bulk response are in the order of the request's actions, so each is matched
+    to its action by position within the request. Actions rejected with 429 are sent again as
+    a new request, in order, up to max_retries times with exponential backoff. A request that
+    fails as a whole fails each of its actions.
+    """
+    results = [None] * len(chunk)
+    pending = list(range(len(chunk)))
+    attempt = 0
+    while pending:
+        try:
+            items = client.bulk(body="".join(chunk[i][2] for i in pending))["items"]
+        except TransportError as e:
+            items = [{chunk[i][1].get("_op_type", "index"): {"status": e.status_code, "error": str(e)}} for i in pending]
+        retry = []
+        for i, item in zip(pending, items):
+            status = next(iter(item.values()), {}).get("status")
+            if status == 429 and attempt < max_retries:
+                retry.append(i)
+            else:
+                results[i] = (isinstance(status, int) and 200 <= status < 300, item)
+        pending = retry
+        if pending:
+            attempt += 1
+            time.sleep(min(OPENSEARCH_BULK_MAX_BACKOFF, initial_backoff * 2 ** (attempt - 1)))
+    return results
+
+
+def send_chunks(client, chunks: Iterable[list], threads=OPENSEARCH_BULK_THREADS, max_retries=OPENSEARCH_BULK_MAX_RETRIES,
+         initial_backoff=OPENSEARCH_BULK_INITIAL_BACKOFF):
+    """Sends chunk_actions requests and yields (key, ok, item) for every action, in the order the actions were given.
+
+    With threads > 1, up to that many requests are in flight at once. Results are matched to
+    their actions within each request, never by their position in the overall stream, which
+    retries and concurrent requests reorder.
+    """
+    def results(chunk, outcomes):
+        return ((key, ok, item) for (key, _, _), (ok, item) in zip(chunk, outcomes))
+
+    if threads <= 1:
+        for chunk in chunks:
+            yield from results(chunk, send_chunk(client, chunk, max_retries, initial_backoff))
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix="vectorize-bulk") as pool:
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append((chunk, pool.submit(send_chunk, client, chunk, max_retries, initial_backoff)))
+            if len(in_flight) == threads:
+                chunk, future = in_flight.popleft()
+                yield from results(chunk, future.result())
+        while in_flight:
+            chunk, future = in_flight.popleft()
+            yield from results(chunk, future.result())
+
+
+def stream_embed_and_index(client, index_name: str, texts: Iterable[str], embeddings, metadatas: Optional[Iterable[dict]] = None,
+                           ids: Optional[Iterable[str]] = None, text_field="text", vector_field="vector_field", is_aoss=True,
+                           embed_batch_size=VECTORIZE_EMBED_BATCH_SIZE, max_pending_batches=VECTORIZE_MAX_PENDING_BATCHES,
+                           bulk_size=OPENSEARCH_BULK_SIZE, max_chunk_bytes=OPENSEARCH_BULK_MAX_BYTES,
+                           bulk_threads=OPENSEARCH_BULK_THREADS, max_retries=OPENSEARCH_BULK_MAX_RETRIES,
+                           initial_backoff=OPENSEARCH_BULK_INITIAL_BACKOFF) -> BulkIngestReport:
+    """Embeds texts and indexes them into OpenSearch as a two-stage pipeline.
+
+    An embedding thread turns batches of texts into bulk actions and hands them to the
+    indexing stage through a bounded queue, so embedding and indexing overlap while at
+    most max_pending_batches embedded batches are held in memory. Documents have the
+    same shape as OpenSearchVectorSearch.add_embeddings writes, with random ids unless
+    ids are given. Each result is attributed to the action it belongs to, even when 429
+    retries or concurrent bulk requests return them out of order. Per-document indexing
+    failures are collected in the returned report rather than raised. When embedding
+    fails, the documents already sent are indexed and BulkIngestError is raised with
+    their report.
+    """
+    pending = queue.Queue(maxsize=max_pending_batches)
+    stop = threading.Event()
+    metadatas = iter(metadatas) if metadatas is not None else None
+    ids = iter(ids) if ids is not None else None
+    stage_errors = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def embed_stage():
+        try:
+            for batch_number, batch in enumerate(batched(texts, embed_batch_size)):
+                vectors = embeddings.embed_documents(batch)
+                actions = []
+                for text, vector in zip(batch, vectors):
+                    _id = next(ids) if ids is not None else str(uuid.uuid4())
+                    action = {
+                        "_op_type": "index",
+                        "_index": index_name,
+                        vector_field: vector,
+                        text_field: text,
+                        "metadata": next(metadatas) if metadatas is not None else {},
+                    }
+                    if is_aoss:
+                        action["id"] = _id
+                    else:
+                        action["_id"] = _id
+                    actions.append(action)
+                if not put((batch_number, actions)):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(_StageError(e))
+
+    def actions():
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                # Stops the stream, so the documents already sent are reported before the error is raised
+                stage_errors.append(item.error)
+                return
+            batch_number, batch_actions = item
+            for action in batch_actions:
+                yield (batch_number, action.get("id", action.get("_id"))), action
+
+    embedder = threading.Thread(target=embed_stage, name="vectorize-embed", daemon=True)
+    embedder.start()
+
+    report = BulkIngestReport()
+    try:
+        chunks = chunk_actions(client, actions(), bulk_size, max_chunk_bytes)
+        for (batch_number, doc_id), ok, item in send_chunks(client, chunks, bulk_threads, max_retries, initial_backoff):
+            report.record(batch_number, ok, item, doc_id)
+    except Exception as e:
+        raise BulkIngestError(e, report) from e
+    finally:
+        stop.set()
+        embedder.join()
+    if stage_errors:
+        logger.error(f"Embedding failed after indexing {report.indexed} documents into {index_name}: {stage_errors[0]}")
+        raise BulkIngestError(stage_errors[0], report) from stage_errors[0]
+
+    if report.failed:
+        logger.error(f"Failed to index {report.failed} of {report.total} documents into {index_name}: {report.to_dict()['failed_batches']}")
+    else:
+        logger.info(f"Indexed {report.indexed} documents into {index_name}")
+    return report
+
+
+def bulk_delete(client, index_name: str, ids: Iterable[str], bulk_size=OPENSEARCH_BULK_SIZE,
+                initial_backoff=OPENSEARCH_BULK_INITIAL_BACKOFF) -> List[str]:
+    """Deletes documents by _id and returns the _ids that could not be deleted. Missing documents count as deleted."""
+    actions = ((_id, {"_op_type": "delete", "_index": index_name, "_id": _id}) for _id in ids)
+    failed = []
+    for _id, ok, item in send_chunks(client, chunk_actions(client, actions, bulk_size), threads=1,
+                                     initial_backoff=initial_backoff):
+        if not ok and next(iter(item.values()), {}).get("status") != 404:
+            failed.append(_id)
+    if failed:
+        logger.error(f"Failed to delete {len(failed)} documents from {index_name}")
+    return failed
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+import concurrent.futures
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("document_processor")
+
+EMBEDDING_MODEL_ID = os.getenv('EMBEDDING_MODEL_ID', 'amazon.titan-embed-text-v1')
+# Sustained Bedrock quota for the model, shared by all files processed in this task
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv('EMBEDDING_REQUESTS_PER_MINUTE', '1800'))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv('EMBEDDING_TOKENS_PER_MINUTE', '300000'))
+EMBEDDING_MAX_WORKERS = int(os.getenv('EMBEDDING_MAX_WORKERS', '16'))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '8'))
+
+RETRYABLE_ERRORS = ("ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException",
+                    "ModelNotReadyException", "ModelTimeoutException", "InternalServerException")
+THROTTLING_ERRORS = ("ThrottlingException", "TooManyRequestsException")
+
+# Rough token estimate used to charge the token bucket before the call is made
+CHARS_PER_TOKEN = 4
+
+# Texts per request the model accepts, and how to build and parse the request body
+MODEL_BATCH_FORMATS = {
+    "amazon.titan-embed-text-v1": "titan",
+    "amazon.titan-embed-text-v2:0": "titan",
+    "cohere.embed-english-v3": "cohere",
+    "cohere.embed-multilingual-v3": "cohere",
+}
+BATCH_SIZES = {"titan": 1, "cohere": 96}
+# Models that take the output dimension as a request parameter; the others have a fixed one
+VARIABLE_DIMENSION_MODELS = {"amazon.titan-embed-text-v2:0"}
+COHERE_MAX_TEXT_CHARS = 2048
+
+
+class TokenBucket:
+    """A thread-safe token bucket. acquire() blocks until the requested amount is available."""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter:
+    """Request and token buckets for one model whose rate backs off on throttling.
+
+    The request rate is halved on every throttle and recovers additively on success
+    (AIMD), never exceeding the configured quota.
+    """
+
+    MIN_RATE_FRACTION = 0.05
+    RECOVERY_FRACTION = 0.01
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.max_rate = requests_per_minute / 60.0
+        self.requests = TokenBucket(self.max_rate, max(self.max_rate, 1.0))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute / 60.0)
+        self._lock = threading.Lock()
+
+    def acquire(self, token_count: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(token_count)
+
+    def on_throttle(self):
+        with self._lock:
+            self.requests.rate = max(self.requests.rate / 2, self.max_rate * self.MIN_RATE_FRACTION)
+            logger.warning(f"Embedding throttled, reducing rate to {self.requests.rate * 60:.0f} requests/minute")
+
+    def on_success(self):
+        with self._lock:
+            self.requests.rate = min(self.requests.rate + self.max_rate * self.RECOVERY_FRACTION, self.max_rate)
+
+
+class BedrockEmbeddingEngine(Embeddings):
+    """Embeds texts with a Bedrock model at the model's sustained throughput.
+
+    Texts are packed into as few requests as the model allows and sent from a bounded
+    worker pool. Every request goes through the model's shared rate limiter, and
+    throttled or transiently failing requests are retried with exponential backoff
+    and full jitter. One engine is shared by all files processed concurrently.
+    """
+
+    def __init__(self, bedrock_client, model_id=EMBEDDING_MODEL_ID, dimensions: Optional[int] = None,
+                 requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE, tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+                 max_workers=EMBEDDING_MAX_WORKERS, max_retries=EMBEDDING_MAX_RETRIES):
+        if model_id not in MODEL_BATCH_FORMATS:
+            raise ValueError(f"Unsupported embedding model: {model_id}")
+        self.bedrock_client = bedrock_client
+        self.model_id = model_id
+        self.dimensions = dimensions if model_id in VARIABLE_DIMENSION_MODELS else None
+        self.format = MODEL_BATCH_FORMATS[model_id]
+        self.batch_size = BATCH_SIZES[self.format]
+        self.max_retries = max_retries
+        self.rate_limiter = AdaptiveRateLimiter(requests_per_minute, tokens_per_minute)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        futures = [self._executor.submit(self._embed_batch, batch, "search_document") for batch in batches]
+        vectors = []
+        for future in futures:
+            vectors.extend(future.result())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text], "search_query")[0]
+
+    def _request_body(self, texts: List[str], input_type: str) -> dict:
+        if self.format == "cohere":
+            return {"texts": [text[:COHERE_MAX_TEXT_CHARS] for text in texts], "input_type": input_type}
+        if self.dimensions is not None:
+            return {"inputText": texts[0], "dimensions": self.dimensions}
+        return {"inputText": texts[0]}
+
+    def _parse_response(self, body: dict) -> List[List[float]]:
+        if self.format == "cohere":
+            return body["embeddings"]
+        return [body["embedding"]]
+
+    def _embed_batch(self, texts: List[str], input_type: str) -> List[List[float]]:
+        body = json.dumps(self._request_body(texts, input_type))
+        token_estimate = max(1, sum(len(text) for text in texts) // CHARS_PER_TOKEN)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(token_estimate)
+            try:
+                response = self.bedrock_client.invoke_model(body=body, modelId=self.model_id,
+                                                            accept="application/json", contentType="application/json")
+                vectors = self._parse_response(json.loads(response["body"].read()))
+                self.rate_limiter.on_success()
+                return vectors
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in RETRYABLE_ERRORS or attempt == self.max_retries:
+                    raise
+                if code in THROTTLING_ERRORS:
+                    self.rate_limiter.on_throttle()
+                delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                logger.info(f"Retrying embedding request after {code} in {delay:.2f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+
+
+_engines: Dict[Tuple[str, Optional[int], Optional[str]], BedrockEmbeddingEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_embedding_engine(model_id: str = EMBEDDING_MODEL_ID, region_name: Optional[str] = None,
+                         dimensions: Optional[int] = None) -> BedrockEmbeddingEngine:
+    """Returns the process-wide engine for a model, so its rate limit is shared by all files."""
+    if model_id not in VARIABLE_DIMENSION_MODELS:
+        dimensions = None
+    key = (model_id, dimensions, region_name)
+    with _engines_lock:
+        if key not in _engines:
+            # Throttles are retried by the engine so the rate limiter sees them
+            bedrock_client = boto3.Session(region_name=region_name).client(
+                "bedrock-runtime",
+                config=Config(retries={"max_attempts": 1, "mode": "standard"}, max_pool_connections=EMBEDDING_MAX_WORKERS)
+            )
+            _engines[key] = BedrockEmbeddingEngine(bedrock_client, model_id=model_id, dimensions=dimensions)
+        return _engines[key]
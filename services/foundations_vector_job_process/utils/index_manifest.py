@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger("document_processor")
+
+VECTOR_MANIFEST_PREFIX = os.getenv('VECTOR_MANIFEST_PREFIX', 'vector_manifests')
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_id(index_id: str, source_path: str, chunk_hash: str, model_id: str) -> str:
+    """Deterministic id of a chunk in an index, so the same content embedded by the same model maps to one document."""
+    return hashlib.sha256(f"{index_id}\n{source_path}\n{chunk_hash}\n{model_id}".encode("utf-8")).hexdigest()
+
+
+def source_path(chunk_file_path: str) -> str:
+    """The results prefix of the document a chunk file was cut from, {app_id}/{extraction_job_id}/{file_name}.
+
+    Chunk files of every chunking run of a document sit under it, so it names the document
+    across re-chunking while keeping apart documents that share a file name.
+    """
+    return chunk_file_path.rsplit("/", 1)[0]
+
+
+class IndexManifest:
+    """The documents of one source document that are already embedded in an index.
+
+    documents maps each deterministic document id to the OpenSearch _id it was stored
+    under and its content hash. pending_deletes lists the _ids of stale documents that
+    could not be deleted, for the next run to retry. The manifest of an index is kept in S3 as one object per
+    source path under VECTOR_MANIFEST_PREFIX/<index_id>/, so files vectorized concurrently
+    never write the same object, and documents with the same file name never share one.
+    """
+
+    def __init__(self, index_id: str, source_path: str, documents: Optional[Dict[str, dict]] = None,
+                 embedding_model: Optional[str] = None, pending_deletes: Optional[List[str]] = None):
+        self.index_id = index_id
+        self.source_path = source_path
+        self.file_name = source_path.split("/")[-1]
+        self.documents = documents or {}
+        self.embedding_model = embedding_model
+        self.pending_deletes = pending_deletes or []
+
+    @staticmethod
+    def key(index_id: str, source_path: str) -> str:
+        return f"{VECTOR_MANIFEST_PREFIX}/{index_id}/{content_hash(source_path)}.json"
+
+    @classmethod
+    def load(cls, s3_client, bucket: str, index_id: str, source_path: str) -> "IndexManifest":
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=cls.key(index_id, source_path))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return cls(index_id, source_path)
+            raise
+        body = json.loads(response["Body"].read())
+        documents = body.get("documents", {})
+        pending_deletes = body.get("pending_deletes", [])
+        # Manifests saved before pending_deletes kept undeleted documents under stale:<_id> keys
+        for key in [key for key in documents if key.startswith("stale:")]:
+            pending_deletes.append(documents.pop(key)["_id"])
+        return cls(index_id, source_path, documents, body.get("embedding_model"), pending_deletes)
+
+    def save(self, s3_client, bucket: str):
+        body = {
+            "index_id": self.index_id,
+            "source_path": self.source_path,
+            "file_name": self.file_name,
+            "embedding_model": self.embedding_model,
+            "updated_at": datetime.now().isoformat(),
+            "documents": self.documents,
+            "pending_deletes": self.pending_deletes
+        }
+        s3_client.put_object(Bucket=bucket, Key=self.key(self.index_id, self.source_path), Body=json.dumps(body))
+        logger.info(f"Saved manifest for {self.source_path} in index {self.index_id} with {len(self.documents)} documents")
@@ -0,0 +1,54 @@
+import uuid
+
+import boto3
+
+from utils.embedding import get_embedding_engine, EMBEDDING_MODEL_ID
+from utils.bulk_ingest import BulkIngestError, BulkIngestReport, VECTORIZE_EMBED_BATCH_SIZE, batched
+from utils.local_vector_index import LOCAL_HOST_SCHEME, LOCAL_VECTOR_STORE_BUCKET, get_local_index
+from utils.vectorize import ChunkVectorDB
+
+
+class LocalVectorDB(ChunkVectorDB):
+    """Vectorizes chunk files into a local vector store index (host local://<store_name>).
+
+    Documents are embedded in batches and added to the in-process index, and commit()
+    saves a new snapshot that the vectorization service picks up for searches.
+    """
+
+    def __init__(self, host=None, index_name=None, region_name=None, embedding_model_id=EMBEDDING_MODEL_ID, dimension=None,
+                 s3_client=None):
+        self.host = host
+        self.index_name = index_name
+        self.region_name = region_name
+        self.embeddings = get_embedding_engine(embedding_model_id, self.region_name, dimension)
+        s3_client = s3_client or (boto3.Session(region_name=region_name).client('s3') if LOCAL_VECTOR_STORE_BUCKET else None)
+        self.index = get_local_index(host[len(LOCAL_HOST_SCHEME):], index_name, s3_client)
+        if not self.index.loaded:
+            self.index.load()
+
+    def health_check(self):
+        return True
+
+    def close(self):
+        pass
+
+    def index_documents(self, texts, metadatas, ids=None) -> BulkIngestReport:
+        report = BulkIngestReport()
+        ids = iter(ids) if ids is not None else None
+        try:
+            for batch_number, batch in enumerate(batched(zip(texts, metadatas), VECTORIZE_EMBED_BATCH_SIZE)):
+                batch_texts = [text for text, _ in batch]
+                batch_ids = [next(ids) if ids is not None else str(uuid.uuid4()) for _ in batch]
+                self.index.upsert(batch_ids, batch_texts, self.embeddings.embed_documents(batch_texts), [metadata for _, metadata in batch])
+                for doc_id in batch_ids:
+                    report.record(batch_number, True, {"index": {"_id": doc_id}}, doc_id)
+        except Exception as e:
+            raise BulkIngestError(e, report) from e
+        return report
+
+    def delete_documents(self, ids) -> list:
+        self.index.delete(ids)
+        return []
+
+    def commit(self):
+        self.index.save()
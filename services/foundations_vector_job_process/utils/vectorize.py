@@ -1,8 +1,8 @@
 import boto3
 import json
+from abc import ABC, abstractmethod
 import uuid
 from langchain_community.vectorstores import OpenSearchVectorSearch
-from langchain_community.embeddings.bedrock import BedrockEmbeddings
 from langchain_community.docstore.document import Document
 from requests_aws4auth import AWS4Auth
 from opensearchpy import RequestsHttpConnection, AWSV4SignerAuth
@@ -10,33 +10,152 @@ from opensearchpy import OpenSearch, helpers
 from urllib.parse import urlparse
 import re
 import uuid
-import concurrent.futures
 
 import logging
 
+from utils.embedding import get_embedding_engine, EMBEDDING_MODEL_ID
+from utils.bulk_ingest import BulkIngestError, BulkIngestReport, stream_embed_and_index, bulk_delete
+from utils.index_manifest import IndexManifest, content_hash, document_id
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("document_processor")
 logger.setLevel(logging.INFO)
 
+class ChunkVectorDB(ABC):
+    """Vectorizes chunk files into an index. Subclasses store the documents."""
+
+    @abstractmethod
+    def index_documents(self, texts, metadatas, ids=None) -> BulkIngestReport:
+        """Embeds and indexes documents, with random ids unless ids are given.
+
+        Raises BulkIngestError, with the report of the documents indexed so far, when it stops partway.
+        """
 
-def embed_document(embeddings, doc, index):
-    return index, embeddings.embed_documents([doc.page_content])[0]
+    @abstractmethod
+    def delete_documents(self, ids) -> list:
+        """Deletes documents by the ids index_documents reported and returns the ids that could not be deleted."""
+
+    def commit(self):
+        """Makes the documents written so far visible to searches, for stores that need it."""
+
+    def read_s3_txt(self, s3_txt_path, bucket_name, s3_client):
+        """Reads the text from an S3 file."""
+        response = s3_client.get_object(Bucket=bucket_name, Key=s3_txt_path)
+        txt = response['Body'].read().decode('utf-8')
+        # print(txt)
+        return txt
 
-class OpenSearchVectorDB:
+    @staticmethod
+    def chunk_metadata(chunk: dict) -> dict:
+        """Returns the chunk's metadata fields, skipping unset ones. Older chunk files have none."""
+        return {key: value for key, value in chunk.items() if key != 'chunk' and value is not None}
+
+    def vectorize_and_store(self, data=None, manifest: IndexManifest = None, incremental=False):
+        """Converts JSON data into chunks and vectors and stores them in the index.
+
+        With a manifest, documents get deterministic ids and the file's previous documents
+        are replaced: all chunks are re-embedded, or with incremental only the chunks whose
+        id is not in the manifest yet. Documents of the previous run that are no longer
+        part of the file are deleted; those that cannot be are kept in the manifest's
+        pending_deletes and retried by the next run. The manifest is updated in place for
+        the caller to save.
+        """
+
+        try:
+            if data is not None:
+                chunks = json.loads(data)
+
+            if manifest is not None:
+                return self._sync_chunks(chunks, manifest, incremental)
+
+            report = self.index_documents((chunk['chunk'] for chunk in chunks), (self.chunk_metadata(chunk) for chunk in chunks))
+            self.commit()
+
+        except Exception as e:
+            raise Exception(f"Error occurred during vectorization: {e}")
+
+        if report.failed:
+            raise Exception(f"Failed to index {report.failed} of {report.total} chunks: {report.to_dict()['failed_batches']}")
+        return report.to_dict()
+
+    def _sync_chunks(self, chunks, manifest: IndexManifest, incremental: bool):
+        model_id = self.embeddings.model_id
+        if self.embeddings.dimensions is not None:
+            model_id = f"{model_id}:{self.embeddings.dimensions}"
+        # Chunks with the same content in a file share an id and are indexed once
+        current = {}
+        for chunk in chunks:
+            chunk_hash = chunk.get('content_hash') or content_hash(chunk['chunk'])
+            doc_id = document_id(manifest.index_id, manifest.source_path, chunk_hash, model_id)
+            current.setdefault(doc_id, (chunk, chunk_hash))
+
+        previous = manifest.documents
+        if manifest.pending_deletes:
+            # Stale documents an earlier run could not delete
+            previous_ids = {entry["_id"] for entry in previous.values()}
+            manifest.pending_deletes = self.delete_documents(
+                [_id for _id in manifest.pending_deletes if _id not in previous_ids])
+        to_embed = {doc_id: item for doc_id, item in current.items() if not incremental or doc_id not in previous}
+
+        documents = {doc_id: previous[doc_id] for doc_id in current if doc_id not in to_embed}
+        try:
+            report = self.index_documents((chunk['chunk'] for chunk, _ in to_embed.values()),
+                                          (self.chunk_metadata(chunk) for chunk, _ in to_embed.values()), ids=iter(to_embed))
+        except BulkIngestError as e:
+            report = e.report
+            error = e
+        else:
+            error = None
+        for doc_id, _id in report.document_ids.items():
+            documents[doc_id] = {"_id": _id, "content_hash": to_embed[doc_id][1]}
+
+        if error is not None or report.failed:
+            # Keep the previous documents so nothing is lost, and record what was indexed so a retry
+            # replaces it rather than leaving documents no manifest knows about
+            manifest.documents = {**previous, **documents}
+            # Documents the retry replaced are no longer in the manifest, so they are deleted by the next run
+            manifest.pending_deletes += [entry["_id"] for doc_id, entry in previous.items()
+                                         if doc_id in documents and documents[doc_id]["_id"] != entry["_id"]]
+            self.commit()
+            if error is not None:
+                raise error
+            raise Exception(f"Failed to index {report.failed} of {report.total} chunks: {report.to_dict()['failed_batches']}")
+
+        live_ids = {entry["_id"] for entry in documents.values()}
+        stale_ids = [entry["_id"] for entry in previous.values() if entry["_id"] not in live_ids]
+        undeleted = self.delete_documents(stale_ids) if stale_ids else []
+
+        self.commit()
+        manifest.documents = documents
+        manifest.pending_deletes += undeleted
+        manifest.embedding_model = model_id
+        logger.info(f"Synced {manifest.source_path}: {len(to_embed)} embedded, {len(current) - len(to_embed)} unchanged, "
+                    f"{len(stale_ids) - len(undeleted)} deleted")
+        return {
+            **report.to_dict(),
+            "unchanged": len(current) - len(to_embed),
+            "deleted": len(stale_ids) - len(undeleted),
+            "delete_failed": len(undeleted)
+        }
+
+
+class OpenSearchVectorDB(ChunkVectorDB):
     """A class to represent and interface with an OpenSearch Vector database."""
 
     AOSS_SVC_NAME = "aoss"
     DEFAULT_TIMEOUT = 100
 
-    def __init__(self, host=None, index_name=None, use_ssl=True, verify_certs=True, timeout=DEFAULT_TIMEOUT, region_name=None):
+    def __init__(self, host=None, index_name=None, use_ssl=True, verify_certs=True, timeout=DEFAULT_TIMEOUT, region_name=None,
+                 embedding_model_id=EMBEDDING_MODEL_ID, dimension=None):
         """Initializes the OpenSearch Vector DB."""
         self.host = host
         self.index_name = index_name
         self.use_ssl = use_ssl
         self.verify_certs = verify_certs
         self.timeout = timeout
-        self.embeddings = BedrockEmbeddings()
         self.region_name = region_name
+        # The index's embedding model, so documents are embedded like its queries
+        self.embeddings = get_embedding_engine(embedding_model_id, self.region_name, dimension)
         self.opensearch_auth = AWSV4SignerAuth(
             boto3.Session().get_credentials(), self.region_name, self.AOSS_SVC_NAME)
 
@@ -51,45 +170,24 @@ class OpenSearchVectorDB:
             verify_certs=self.verify_certs,
             connection_class=RequestsHttpConnection,
         )
+        self.client = self.docsearch.client
 
-    def read_s3_txt(self, s3_txt_path, bucket_name, s3_client):
-        """Reads the text from an S3 file."""
-        response = s3_client.get_object(Bucket=bucket_name, Key=s3_txt_path)
-        txt = response['Body'].read().decode('utf-8')
-        # print(txt)
-        return txt
-
-    def vectorize_and_store(self, data=None):
-        """Converts JSON data into chunks and vectors and stores them in OpenSearch."""
+    def health_check(self):
+        """Returns True if the collection answers an authenticated request."""
+        self.client.indices.exists(index=self.index_name)
+        return True
 
-        try:
-            if data is not None:
-                chunks = json.loads(data)
-
-            # Create langchain documents
-            docs = [Document(page_content=chunk['chunk']) for chunk in chunks]
-
-            # Use ThreadPoolExecutor to parallelize the embedding process
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                futures = [executor.submit(embed_document, self.embeddings, doc, i) for i, doc in enumerate(docs)]
-                results = [future.result() for future in concurrent.futures.as_completed(futures)]
+    def close(self):
+        self.client.close()
 
-            # Sort results by the original order
-            results.sort(key=lambda x: x[0])
-            vectors = [result[1] for result in results]
+    def index_documents(self, texts, metadatas, ids=None) -> BulkIngestReport:
+        # Embedding and bulk indexing overlap, with a bounded number of embedded batches in memory
+        return stream_embed_and_index(
+            self.client, self.index_name, texts, self.embeddings, metadatas=metadatas, ids=ids,
+            text_field="text", vector_field="vector_field", is_aoss=True)
 
-            mapping_tuples = [(doc.page_content, vectors[i])
-                              for i, doc in enumerate(docs)]
-
-            # Add embeddings to OpenSearch
-            self.docsearch.add_embeddings(
-                text_embeddings=mapping_tuples, text_field="text", vector_field="vector_field")
-
-            return ""
-
-        except Exception as e:
-            raise Exception(f"Error occurred during vectorization: {e}")
-            
+    def delete_documents(self, ids) -> int:
+        return bulk_delete(self.client, self.index_name, ids)
 
     def similarity_search(self, query, text_field="text", vector_field="vector_field"):
         """Searches the OpenSearch index for documents similar to the provided query."""
@@ -1,13 +1,23 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 import jwt
 from typing import List, Optional, Dict, Any
 import json
+import asyncio
 import boto3
 from botocore.config import Config
 import logging
 import uuid
 from datetime import datetime
 from utils.opensearchutil import OpenSearchServerlessManager, OpenSearchVectorDB
+from utils.vector_db_pool import VectorDBPool
+from utils.query_cache import CachedQueryEmbeddings
+from utils.embedding_models import resolve_embedding_model, embedding_model_kwargs
+from utils.local_vector_db import LocalVectorDB
+from utils.local_vector_index import is_local_host, local_host
+from utils.store_provisioner import VectorStoreProvisioner, PENDING_POLICIES, ACTIVE
+import redis
+from langchain_community.embeddings.bedrock import BedrockEmbeddings
+from auth import AppClientResolver, check_platform_client
 import os
 import requests
 from models import *
@@ -40,15 +50,23 @@ CHUNK_JOBS_TABLE = os.getenv('CHUNK_JOBS_TABLE')
 CHUNK_JOB_FILES_TABLE = os.getenv('CHUNK_JOB_FILES_TABLE')
 CLIENTS_TABLE = os.getenv('CLIENTS_TABLE')
 AOSS_VPCE_ID = os.getenv('AOSS_VPCE_ID')
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_PORT = os.getenv("REDIS_PORT")
 
 
 session = None
 dynamodb = None
 retry_config = Config(retries={"max_attempts": MAX_RETRIES, "mode": "standard"})
 sqs_client = None
-open_search_client = None
+s3_client = None
 
 manager = None
+store_provisioner = None
+app_client_resolver = None
+bedrock_runtime = None
+redis_client = None
+query_embeddings = {}
+vector_db_pool = None
 
 @app.exception_handler(RequestValidationError)
 async def format_validation_error_as_rfc_7807_json(request: Request, exc: error_wrappers.ValidationError):
@@ -81,14 +99,7 @@ def decode_token_without_verification(token: str):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def get_app_id_from_dynamodb(client_id: str):
-    response = dynamodb.scan(TableName=CLIENTS_TABLE)
-    items = response['Items']
-    if not items:
-        raise HTTPException(status_code=401, detail="No items found in DynamoDB")
-    for item in items:
-        if 'client_id' in item and client_id == item['client_id']['S']:
-            return item['app_id']['S']
-    raise HTTPException(status_code=401, detail="Client ID not found in DynamoDB")
+    return app_client_resolver.get_app_id(client_id)
 
 async def get_app_id_from_token(request: Request):
 
@@ -104,14 +115,36 @@ async def get_app_id_from_token(request: Request):
     except KeyError:
         raise HTTPException(status_code=401, detail="Client ID not found in token")
 
+async def verify_platform_client(request: Request):
+    authorization: str = request.headers.get("Authorization")
+    if authorization is None:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+    decoded_token = decode_token_without_verification(authorization.replace("Bearer ", ""))
+    check_platform_client(decoded_token.get('client_id'))
+
 # Helper functions
-def create_vector_store_entry(collection_name: str, host: str, store_type: str, app_id: str) -> str:
-    vector_store = VectorStore(store_name=collection_name, app_id=app_id, host=host, store_type=store_type)
+def create_vector_store_entry(collection_name: str, host: str, store_type: str, app_id: str, status: str = ACTIVE,
+                              description: Optional[str] = None, tags: Optional[List[Dict[str, str]]] = None) -> VectorStore:
+    vector_store = VectorStore(store_name=collection_name, app_id=app_id, host=host, store_type=store_type, status=status,
+                               description=description, tags=tags, updated_at=datetime.now())
     vector_store.save()
-    return vector_store.vector_store_id
+    return vector_store
+
+def get_collection_host(vector_store: VectorStore) -> Optional[str]:
+    """Returns the host of an OpenSearch Serverless store from the cached collection id to host map.
 
-def create_vector_store_index_entry(vector_store_id: str, index_name: str) -> str:
-    vector_index = VectorIndex(vector_store_id=vector_store_id, index_name=index_name)
+    Stores created before the collection id was recorded are looked up by name once and backfilled.
+    """
+    if vector_store.collection_id is None:
+        collection = manager.find_collection(vector_store.store_name)
+        if collection is None:
+            return None
+        vector_store.collection_id = collection['id']
+        vector_store.save()
+    return manager.collection_host(vector_store.collection_id)
+
+def create_vector_store_index_entry(vector_store_id: str, index_name: str, embedding_model: str, dimension: int, ef_search: Optional[int] = None) -> str:
+    vector_index = VectorIndex(vector_store_id=vector_store_id, index_name=index_name, embedding_model=embedding_model, dimension=dimension, ef_search=ef_search)
     vector_index.save()
     return vector_index.index_id
 
@@ -127,8 +160,24 @@ def create_vectorize_job_file_entry(vectorize_job_id: str, file_path: str) -> st
     vectorize_job_file.save()
     return vectorize_job_file.vectorize_job_file_id
 
-def get_vector_db(host: str, index_name: str, region: str) -> OpenSearchVectorDB:
-    return OpenSearchVectorDB(host=host, index_name=index_name, region=region)
+def get_query_embeddings(model_id: str, dimension: int) -> CachedQueryEmbeddings:
+    """Returns the cached query embeddings for a model and dimension, shared by all indexes built with them."""
+    key = f"{model_id}:{dimension}"
+    if key not in query_embeddings:
+        embeddings = BedrockEmbeddings(client=bedrock_runtime, model_id=model_id, model_kwargs=embedding_model_kwargs(model_id, dimension))
+        # Repeated search queries are served from the query embedding cache, shared across tasks through Redis if configured
+        query_embeddings[key] = CachedQueryEmbeddings(embeddings, model_id=key, redis_client=redis_client)
+    return query_embeddings[key]
+
+def create_vector_db(host: str, index_name: str, region: str, embedding_model: Optional[str] = None, dimension: Optional[int] = None) -> OpenSearchVectorDB:
+    model_id, dimension = resolve_embedding_model(embedding_model, dimension)
+    if is_local_host(host):
+        return LocalVectorDB(host=host, index_name=index_name, region=region, embeddings=get_query_embeddings(model_id, dimension), s3_client=s3_client)
+    return OpenSearchVectorDB(host=host, index_name=index_name, region=region, embeddings=get_query_embeddings(model_id, dimension))
+
+def get_vector_db(host: str, index_name: str, region: str, embedding_model: Optional[str] = None, dimension: Optional[int] = None) -> OpenSearchVectorDB:
+    """Returns a pooled client whose query embeddings match the model the index was built with."""
+    return vector_db_pool.get(host, index_name, region, embedding_model=embedding_model, dimension=dimension)
 
 
 # API endpoints
@@ -144,7 +193,7 @@ async def create_opensearch_collection(request: CreateVectorStoreRequest, app_id
 
     | Field               | Type   | Description                      |
     |---------------------|--------|----------------------------------|
-    | store_type          | str    | The type of the vector store.    |
+    | store_type          | str    | The type of the vector store: "opensearchserverless", or "local" for an in-process store persisted to S3 snapshots. |
     | description         | str    | The description of the vector store. |
     | tags                | Optional[Dict[str, str]] | Tags to associate with the vector store. |
 
@@ -173,8 +222,11 @@ async def create_opensearch_collection(request: CreateVectorStoreRequest, app_id
     | store_name          | str    | The name of the created store.   |
     | store_type          | str    | The type of the created store.   |
     | store_id            | str    | The ID of the created store.     |
+    | status              | str    | The provisioning status of the store. OpenSearch Serverless stores start in "PENDING_POLICIES"; local stores are "ACTIVE" at once. |
     | message             | str    | A message indicating the status of the operation. |
 
+    OpenSearch Serverless stores are provisioned in the background. Poll `/vector/store/status` until the store is "ACTIVE" before creating an index.
+
     ***
     #### Errors
 
@@ -188,45 +240,19 @@ async def create_opensearch_collection(request: CreateVectorStoreRequest, app_id
         store_uuid = 'lp'+generate_short_uuid()
 
         if request.store_type == "opensearchserverless":
-            encryption_policy_detail = manager.create_encryption_policy(
-                name=store_uuid + "-ep",
-                description="An encryption policy for logs collection",
-                collection_pattern=store_uuid + "*"
-            )
-            
-
-            network_policy_detail = manager.create_network_policy(
-                name=store_uuid + "-np",
-                description="Public access for logs collection",
-                collection_pattern=store_uuid + "*",
-                allow_public=False,
-                vpce_id=AOSS_VPCE_ID
-            )
-            
-
-            data_access_policy_detail = manager.create_data_access_policy(
-                name=store_uuid + "-dp",
-                description="Data access policy for logs collection",
-                collection_pattern=store_uuid,
-                index_name="",
-                role_arn=ACCESS_ROLE_ARN
-            )
-            
-
-            collection_detail = manager.create_collection(
-                collection_name=store_uuid,
-                description=request.description,
-                standby_replicas="DISABLED",
-                tags=request.tags
-            )
-            
-
-            domain_part = collection_detail['arn'].split(':')[-1].split('/')[1]
-            host = f"https://{domain_part}.{REGION}.aoss.amazonaws.com"
-
-            vector_store_id = create_vector_store_entry(store_uuid, host, 'opensearchserverless', app_id)
-
-            return CreateVectorStoreResponse(store_name=store_uuid, store_type=request.store_type, store_id=vector_store_id, message="Vector store created successfully")
+            # The policies and collection are created in the background; the host is recorded once the collection exists
+            vector_store = create_vector_store_entry(store_uuid, "", 'opensearchserverless', app_id, status=PENDING_POLICIES,
+                                                     description=request.description, tags=request.tags)
+            store_provisioner.submit(vector_store)
+
+            return CreateVectorStoreResponse(store_name=store_uuid, store_type=request.store_type, store_id=vector_store.vector_store_id,
+                                             status=vector_store.status, message="Vector store provisioning started")
+        elif request.store_type == "local":
+            # Nothing to provision; indexes are created as files on first use
+            vector_store = create_vector_store_entry(store_uuid, local_host(store_uuid), 'local', app_id)
+
+            return CreateVectorStoreResponse(store_name=store_uuid, store_type=request.store_type, store_id=vector_store.vector_store_id,
+                                             status=vector_store.status, message="Vector store created successfully")
         else:
             raise HTTPException(status_code=400, detail="Invalid store type")
     except Exception as e:
@@ -238,7 +264,7 @@ async def get_opensearch_collection_status(request: VectorStoreStatusRequest, ap
     
         """
         ## Endpoint to Get Vector Store Status
-        This endpoint returns the status of the specified vector store.
+        This endpoint returns the status of the specified vector store. It is read from the store record, so it is cheap to poll.
     
         ***
         ## Request Body
@@ -265,7 +291,8 @@ async def get_opensearch_collection_status(request: VectorStoreStatusRequest, ap
         | Field               | Type   | Description                      |
         |---------------------|--------|----------------------------------|
         | store_id            | str    | The ID of the vector store.      |
-        | status              | str    | The status of the vector store. Returns "ACTIVE", "CREATING", "DELETING", "FAILED" or "NOT_FOUND". |
+        | status              | str    | The status of the vector store. Returns "PENDING_POLICIES", "CREATING", "ACTIVE", "FAILED" or "NOT_FOUND". |
+        | reason              | str    | Why provisioning failed, if it did. |
     
         ***
         #### Errors
@@ -286,22 +313,16 @@ async def get_opensearch_collection_status(request: VectorStoreStatusRequest, ap
                 raise HTTPException(status_code=403, detail="Vector Store does not belong to the app")
         
             store_id = vector_store.vector_store_id
-            collection_filter = {
-                'name': vector_store.store_name
-            }
-            collections = open_search_client.list_collections(collectionFilters=collection_filter)
+            if vector_store.store_type == "local":
+                return {"store_id": store_id, "status": ACTIVE}
 
-            
+            if vector_store.status is None:
+                # Stores created before provisioning state was recorded are checked against the collection
+                collection = manager.find_collection(vector_store.store_name)
+                return {"store_id": store_id, "status": collection['status'] if collection else "NOT_FOUND"}
 
-            if not collections['collectionSummaries']:
-                return {"store_id": store_id, "status": "NOT_FOUND"}
-
-            for collection in collections['collectionSummaries']:
-                logger.info(f"Collection: {collection}")
-                if collection['name'] == vector_store.store_name:
-                    return {"store_id": store_id, "status": collection['status']}
-            
-            return {"store_id": store_id, "status": "NOT_FOUND"}
+            store_provisioner.resume_if_stale(vector_store)
+            return {"store_id": store_id, "status": vector_store.status, "reason": vector_store.status_reason}
         
         except HTTPException as e:
             raise e
@@ -313,7 +334,8 @@ async def create_opensearch_index(request: CreateIndexRequest, app_id: str = Dep
 
     """
     ## Endpoint to Create an Index
-    This endpoint creates an index in the specified vector store.
+    This endpoint creates an index in the specified vector store. The vector dimension is derived from the embedding model,
+    which is recorded on the index so that vectorization and search always embed with the same model.
 
     ***
     ## Request Body
@@ -322,6 +344,14 @@ async def create_opensearch_index(request: CreateIndexRequest, app_id: str = Dep
     |---------------------|--------|----------------------------------|
     | store_id            | str    | The ID of the vector store.      |
     | index_name          | str    | The name of the index to create. |
+    | embedding_model     | str    | Optional. TITAN_EMBED_TEXT_V1 (default, 1536 dimensions), TITAN_TEXT_EMBED_V2 (1024, 512 or 256), COHERE_EMBED_ENGLISH_V3 or COHERE_EMBED_MULTILINGUAL_V3 (1024). |
+    | dimension           | int    | Optional. Vector dimension, for models that support several. Defaults to the model's largest. |
+    | space_type          | str    | Optional. l2 (default), cosinesimil, innerproduct, l1 or linf. faiss supports l2 and innerproduct; lucene l2, cosinesimil and innerproduct. |
+    | engine              | str    | Optional. k-NN engine: nmslib (default), faiss or lucene. Local stores use flat or ivf (inverted file lists), chosen by index size by default. |
+    | m                   | int    | Optional. HNSW graph links per node (default 16). |
+    | ef_construction     | int    | Optional. HNSW candidate list size while indexing (default 512). |
+    | ef_search           | int    | Optional. Default HNSW candidate list size while searching. |
+    | quantization        | str    | Optional. fp16 (faiss engine or local stores) or byte (lucene engine) to cut vector memory at some cost in recall. |
 
     ***
     ## Example Request Body
@@ -330,7 +360,12 @@ async def create_opensearch_index(request: CreateIndexRequest, app_id: str = Dep
     
         {
             "store_id": "b1c2b4c5-6d7e-8f9g-0h1i-2j3k4l5m6n7",
-            "index_name": "my_index"
+            "index_name": "my_index",
+            "embedding_model": "TITAN_TEXT_EMBED_V2",
+            "dimension": 512,
+            "space_type": "innerproduct",
+            "engine": "faiss",
+            "quantization": "fp16"
         }
     
         ```
@@ -344,12 +379,16 @@ async def create_opensearch_index(request: CreateIndexRequest, app_id: str = Dep
     | index_id            | str    | The ID of the created index.     |
     | store_id            | str    | The ID of the vector store.      |
     | store_type          | str    | The type of the vector store.    |
+    | embedding_model     | str    | The embedding model of the index. |
+    | dimension           | int    | The vector dimension of the index. |
     | message             | str    | A message indicating the status of the operation. |
 
     ***
     #### Errors
 
+    - **400**: If the embedding model, dimension, space type, engine and quantization do not fit together.
     - **404**: If the vector store is not found.
+    - **409**: If the vector store is not active yet.
     - **500 Internal Server Error**: If there is an unexpected error during the creation of the vector store.
     
     """
@@ -363,28 +402,40 @@ async def create_opensearch_index(request: CreateIndexRequest, app_id: str = Dep
 
         store_name = vector_store.store_name
         store_type = vector_store.store_type
+        _, dimension = resolve_embedding_model(request.embedding_model, request.dimension)
 
         if store_type == "opensearchserverless":
-            collections = open_search_client.list_collections()
-            collection_id = next(
-                (collection['id'] for collection in collections['collectionSummaries'] if collection['name'] == store_name),
-                None
-            )
+            if vector_store.status not in (None, ACTIVE):
+                raise HTTPException(status_code=409, detail=f"Vector store is {vector_store.status}, not ACTIVE")
 
-            if collection_id is None:
+            host = get_collection_host(vector_store)
+            if host is None:
                 return {"message": "Collection not found"}
-
-            host = f"https://{collection_id}.{REGION}.aoss.amazonaws.com"
-            vector_db = get_vector_db(host, store_name, REGION)
-            vector_db.create_index(request.index_name)
-
-            index_id = create_vector_store_index_entry(store_id, request.index_name)
-
-            return CreateIndexResponse(index_name=request.index_name, index_id=index_id, store_id=store_id, store_type=store_type, message="Index created successfully")
+        elif store_type == "local":
+            host = vector_store.host
         else:
             raise HTTPException(status_code=400, detail="Invalid store type")
+
+        vector_db = get_vector_db(host, store_name, REGION)
+        vector_db.create_index(
+            request.index_name,
+            dimension=dimension,
+            space_type=request.space_type,
+            engine=request.engine,
+            m=request.m,
+            ef_construction=request.ef_construction,
+            ef_search=request.ef_search,
+            quantization=request.quantization
+        )
+
+        index_id = create_vector_store_index_entry(store_id, request.index_name, request.embedding_model, dimension, request.ef_search)
+
+        return CreateIndexResponse(index_name=request.index_name, index_id=index_id, store_id=store_id, store_type=store_type,
+                                   embedding_model=request.embedding_model, dimension=dimension, message="Index created successfully")
     except HTTPException as e:
         raise e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating index: {str(e)}. Store may not be ready. Please try again.")
 
@@ -444,7 +495,7 @@ async def get_opensearch_index_status(request: VectorIndexStatusRequest, app_id:
 
         index_name = vector_index.index_name
 
-        vector_db = get_vector_db(vector_store.host, index_name, REGION)
+        vector_db = get_vector_db(vector_store.host, index_name, REGION, vector_index.embedding_model, vector_index.dimension)
         index_status = vector_db.get_index_status(index_name)
 
         logger.info(f"Index Status: {index_status}")
@@ -553,6 +604,11 @@ async def vectorize_and_store_chunk(request: VectorizeRequestChunkJobInput, app_
     |---------------------|--------|----------------------------------|
     | chunking_job_id     | str    | The ID of the chunking job.      |
     | index_id            | str    | The ID of the index to store the vectors. |
+    | mode                | str    | Optional. "full" (default) re-embeds every chunk. "incremental" only embeds chunks that are not in the index yet. |
+
+    Documents get deterministic IDs derived from the index, file, chunk content hash and embedding model, and a manifest of
+    the documents each file has in the index is kept. In both modes, documents from an earlier run whose chunks are no longer
+    part of the file are deleted, so re-running a job does not duplicate documents.
 
     ***
 
@@ -562,7 +618,8 @@ async def vectorize_and_store_chunk(request: VectorizeRequestChunkJobInput, app_
         
             {
                 "chunking_job_id": "b1c2b4c5-6d7e-8f9g-0h1i-2j3k4l5m6n7",
-                "index_id": "b1c2b4c5-6d7e-8f9g-0h1i-2j3k4l5m6n7"
+                "index_id": "b1c2b4c5-6d7e-8f9g-0h1i-2j3k4l5m6n7",
+                "mode": "incremental"
             }
         
             ```
@@ -618,6 +675,8 @@ async def vectorize_and_store_chunk(request: VectorizeRequestChunkJobInput, app_
 
         store_id = vector_store.vector_store_id
         host = vector_store.host
+        # Chunks are embedded with the model the index was created for
+        embedding_model_id, dimension = resolve_embedding_model(vector_index.embedding_model, vector_index.dimension)
 
         chunk_job = ChunkingJobs.safe_get(request.chunking_job_id)
         
@@ -655,7 +714,13 @@ async def vectorize_and_store_chunk(request: VectorizeRequestChunkJobInput, app_
                         "app_id": app_id,
                         "file_id": vectorize_file_id,
                         "vectorize_job_id": vectorize_job_id,
-                        "index_name": index_name
+                        "index_name": index_name,
+                        "file_name": item.file_name,
+                        # {app_id}/{extraction_job_id}/{file_name}, which keys the file's manifest and document ids
+                        "source_path": item.file_path.rsplit("/", 1)[0],
+                        "mode": request.mode,
+                        "embedding_model_id": embedding_model_id,
+                        "dimension": dimension
                     }
                 sqs_client.send_message(
                     QueueUrl=JOBS_QUEUE_URL,
@@ -767,19 +832,30 @@ async def get_vectorize_job_status(vectorize_job_id: str, app_id: str = Depends(
 
 
 @app.post("/vector/search", tags=["Vectorization"])
-async def semantic_search(request: SemanticSearchRequest, app_id: str = Depends(get_app_id_from_token)) -> List[Dict[str, Any]]:
+async def semantic_search(request: SemanticSearchRequest, response: Response, app_id: str = Depends(get_app_id_from_token)) -> List[Dict[str, Any]]:
 
     """
     ## Endpoint to Perform Semantic Search
-    This endpoint performs a semantic search using the specified query.
+    This endpoint performs a semantic, keyword (BM25) or hybrid search using the specified query. Metadata filters are applied inside the OpenSearch query.
+    In hybrid mode the BM25 and k-NN queries run in parallel against the index and their results are fused server-side.
 
     ***
     ## Request Body
 
-    | Field               | Type   | Description                      |
-    |---------------------|--------|----------------------------------|
-    | query               | str    | The semantic search query.       |
-    | index_id            | str    | The ID of the index to search.   |
+    | Field               | Type            | Description                      |
+    |---------------------|-----------------|----------------------------------|
+    | query               | str             | The semantic search query.       |
+    | index_id            | str             | The ID of the index to search.   |
+    | k                   | int             | Number of results to return (1-100, default 4). |
+    | num_candidates      | Optional[int]   | Number of hits each search stage retrieves before filters, fusion and min_score apply. Defaults to k. |
+    | ef_search           | Optional[int]   | HNSW search-time candidate list size for this query. |
+    | filters             | Optional[dict]  | Metadata filters. A value matches exactly, a list matches any of its values and a dict with gt/gte/lt/lte is a range. Fields: file_name, file_path, extraction_job_id, chunking_job_id, page_number, chunk_index, char_start, char_end, content_hash. |
+    | min_score           | Optional[float] | Drop results scoring below this value. In hybrid mode this applies to the fused score. |
+    | fields              | Optional[List[str]] | Metadata fields to return. Defaults to all. |
+    | search_mode         | str             | "vector" (default) for k-NN, "bm25" for keyword search on the chunk text or "hybrid" for both. |
+    | fusion              | str             | Hybrid only. "rrf" (default) for reciprocal rank fusion, "linear" for a weighted sum of min-max normalized scores. |
+    | vector_weight       | float           | Hybrid "linear" fusion only. Weight of the k-NN score (0-1, default 0.5); BM25 gets the rest. |
+    | rank_constant       | int             | Hybrid "rrf" fusion only. Rank constant added to each rank (default 60). |
 
     ***
 
@@ -789,7 +865,12 @@ async def semantic_search(request: SemanticSearchRequest, app_id: str = Depends(
             
             {
                 "query": "what is AWS?",
-                "index_id": "b1c2b4c5-6d7e-8f9g-0h1i-2j3k4l5m6n7"
+                "index_id": "b1c2b4c5-6d7e-8f9g-0h1i-2j3k4l5m6n7",
+                "k": 5,
+                "num_candidates": 50,
+                "filters": {"file_name": "aws-overview.pdf", "page_number": {"gte": 1, "lte": 10}},
+                "search_mode": "hybrid",
+                "fusion": "rrf"
             }
     
             ```
@@ -799,13 +880,19 @@ async def semantic_search(request: SemanticSearchRequest, app_id: str = Depends(
     [
         {
             "text": "<text>",
+            "score": 0.87,
+            "metadata": {"file_name": "aws-overview.pdf", "page_number": 3}
         }
     ]
 
+    Per-stage durations in milliseconds (embedding, vector, bm25, fusion, total) are returned in the Server-Timing header, e.g.
+    `Server-Timing: embedding;dur=41.2, vector;dur=18.5, bm25;dur=12.9, fusion;dur=0.05, total;dur=60.3`.
+
     ***
 
     Errors
 
+    - **400**: If a filter field or range operator is not supported.
     - **404**: If the vector index or vector store is not found.
     - **403**: If the vector index does not belong to the app.
     - **500 Internal Server Error**: If there is an unexpected error during the vectorization process.
@@ -829,14 +916,36 @@ async def semantic_search(request: SemanticSearchRequest, app_id: str = Depends(
     host = vector_store.host
     store_name = vector_store.store_name
 
-    vector_db = get_vector_db(host, index_name, REGION)
-    results = vector_db.similarity_search(request.query, text_field="text", vector_field="vector_field")
-
+    vector_db = get_vector_db(host, index_name, REGION, vector_index.embedding_model, vector_index.dimension)
+    timings = {}
+    try:
+        # Embedding the query and the searches block, so they run off the event loop
+        results = await asyncio.to_thread(
+            vector_db.search,
+            request.query,
+            k=request.k,
+            num_candidates=request.num_candidates,
+            ef_search=request.ef_search or vector_index.ef_search,
+            filters=request.filters,
+            min_score=request.min_score,
+            fields=request.fields,
+            search_mode=request.search_mode,
+            fusion=request.fusion,
+            vector_weight=request.vector_weight,
+            rank_constant=request.rank_constant,
+            timings=timings,
+            text_field="text",
+            vector_field="vector_field"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response.headers["Server-Timing"] = ", ".join(f"{stage};dur={duration}" for stage, duration in timings.items())
     return results
 
 @app.on_event("startup")
 async def startup_event():
-    global session, dynamodb, manager, sqs_client, REGION, open_search_client
+    global session, dynamodb, manager, store_provisioner, sqs_client, s3_client, REGION, app_client_resolver, bedrock_runtime, redis_client, vector_db_pool
     
     if not ECS_METADATA_URL:
         raise HTTPException(status_code=500, detail="ECS_CONTAINER_METADATA_URI_V4 environment variable not set.")
@@ -849,15 +958,38 @@ async def startup_event():
 
         session = boto3.Session(region_name=REGION)
         dynamodb = session.client('dynamodb', config=retry_config)
+        app_client_resolver = AppClientResolver(dynamodb, CLIENTS_TABLE)
         manager = OpenSearchServerlessManager(region_name=REGION)
+        store_provisioner = VectorStoreProvisioner(manager, ACCESS_ROLE_ARN, AOSS_VPCE_ID)
         sqs_client = session.client('sqs')
-        open_search_client = session.client('opensearchserverless')
+        s3_client = session.client('s3', config=retry_config)
+        # One Bedrock client and one pool of OpenSearch clients shared by all requests
+        bedrock_runtime = session.client('bedrock-runtime', config=retry_config)
+        redis_client = redis.Redis(host=REDIS_URL, port=REDIS_PORT, decode_responses=True, ssl=True) if REDIS_URL else None
+        vector_db_pool = VectorDBPool(create_vector_db)
 
         logger.info("Vector Processing Service started successfully.")
         
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving ECS metadata: {str(e)}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    store_provisioner.shutdown()
+    vector_db_pool.close()
+
+@app.get("/vector/service/metrics", include_in_schema=False)
+async def get_service_metrics():
+    return {
+        "query_embedding_cache": {key: embeddings.stats() for key, embeddings in query_embeddings.items()},
+        "vector_db_pool": vector_db_pool.stats()
+    }
+
+@app.post("/vector/service/auth/invalidate", include_in_schema=False)
+async def invalidate_auth_cache(request: InvalidateAuthCacheRequest, _: None = Depends(verify_platform_client)):
+    app_client_resolver.invalidate(client_id=request.client_id, app_id=request.app_id)
+    return {"status": "INVALIDATED"}
+
 @app.get("/vector/service/meta", include_in_schema=False)
 async def get_metadata():
     return app.openapi()
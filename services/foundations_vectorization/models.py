@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 from dyntastic import Dyntastic
 from pydantic import Field, model_validator
@@ -57,6 +57,14 @@ class VectorStore(Dyntastic):
     created_at: datetime = Field(default_factory=datetime.now)
     host: str
     store_type: str
+    # Provisioning state: PENDING_POLICIES -> CREATING -> ACTIVE, or FAILED with status_reason.
+    # Unset on stores created before provisioning ran in the background.
+    status: Optional[str] = None
+    status_reason: Optional[str] = None
+    collection_id: Optional[str] = None
+    description: Optional[str] = None
+    tags: Optional[List[Dict[str, str]]] = None
+    updated_at: Optional[datetime] = None
 
 class VectorIndex(Dyntastic):
     __table_name__ = lambda: os.environ.get("VECTOR_STORES_INDEX_TABLE")
@@ -65,6 +73,10 @@ class VectorIndex(Dyntastic):
     index_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     vector_store_id: str
     index_name: str
+    # Unset on indexes created before the model was recorded, which use the default model
+    embedding_model: Optional[str] = None
+    dimension: Optional[int] = None
+    ef_search: Optional[int] = None
     created_at: datetime = Field(default_factory=datetime.now)
 
 class VectorizationJobs(Dyntastic):
@@ -115,6 +127,7 @@ class CreateVectorStoreResponse(BaseModel):
     store_name: str
     store_type: str
     store_id: str
+    status: Optional[str] = None
     message: str
 
 class VectorStoreStatusRequest(BaseModel):
@@ -123,6 +136,7 @@ class VectorStoreStatusRequest(BaseModel):
 class VectorStoreStatusResponse(BaseModel):
     store_id: str
     status: str
+    reason: Optional[str] = None
 
 class VectorIndexStatusRequest(BaseModel):
     index_id: str
@@ -130,12 +144,23 @@ class VectorIndexStatusRequest(BaseModel):
 class CreateIndexRequest(BaseModel):
     store_id: str
     index_name: str
+    embedding_model: str = "TITAN_EMBED_TEXT_V1"
+    dimension: Optional[int] = None
+    space_type: Literal["l2", "cosinesimil", "innerproduct", "l1", "linf"] = "l2"
+    # nmslib (default), faiss or lucene on OpenSearch; flat or ivf on local stores, which pick one by size by default
+    engine: Optional[Literal["nmslib", "faiss", "lucene", "flat", "ivf"]] = None
+    m: int = Field(16, ge=2, le=100)
+    ef_construction: int = Field(512, ge=2, le=10000)
+    ef_search: Optional[int] = Field(None, ge=1, le=10000)
+    quantization: Optional[Literal["fp16", "byte"]] = None
 
 class CreateIndexResponse(BaseModel):
     index_name: str
     index_id: str
     store_id: str
     store_type: str
+    embedding_model: Optional[str] = None
+    dimension: Optional[int] = None
     message: str
 
 class VectorizeRequest(BaseModel):
@@ -157,11 +182,33 @@ class VectorizationJobStatusResponse(BaseModel):
 class SemanticSearchRequest(BaseModel):
     query: str
     index_id: str
+    k: int = Field(4, ge=1, le=100)
+    num_candidates: Optional[int] = Field(None, ge=1, le=10000)
+    ef_search: Optional[int] = Field(None, ge=1, le=10000)
+    filters: Optional[Dict[str, Any]] = None
+    min_score: Optional[float] = None
+    fields: Optional[List[str]] = None
+    search_mode: Literal["vector", "bm25", "hybrid"] = "vector"
+    fusion: Literal["rrf", "linear"] = "rrf"
+    vector_weight: float = Field(0.5, ge=0, le=1)
+    rank_constant: int = Field(60, ge=1)
 
 class VectorizeRequestChunkJobInput(BaseModel):
     chunking_job_id: str
     index_id: str
+    # full re-embeds every chunk, incremental only new or changed ones; both delete stale documents
+    mode: Literal["full", "incremental"] = "full"
 
 class VectorizeResponse(BaseModel):
     vectorize_job_id: str
-    status: str
\ No newline at end of file
+    status: str
+
+class InvalidateAuthCacheRequest(BaseModel):
+    client_id: Optional[str] = None
+    app_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if not self.client_id and not self.app_id:
+            raise ValueError("client_id or app_id is required")
+        return self
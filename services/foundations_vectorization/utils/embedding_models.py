@@ -0,0 +1,36 @@
+from typing import Optional, Tuple
+
+DEFAULT_EMBEDDING_MODEL = "TITAN_EMBED_TEXT_V1"
+
+# Embedding models an index can be built for, with the Bedrock model id and supported
+# output dimensions. The first dimension is the model's default.
+EMBEDDING_MODELS = {
+    "TITAN_EMBED_TEXT_V1": {"model_id": "amazon.titan-embed-text-v1", "dimensions": [1536]},
+    "TITAN_TEXT_EMBED_V2": {"model_id": "amazon.titan-embed-text-v2:0", "dimensions": [1024, 512, 256]},
+    "COHERE_EMBED_ENGLISH_V3": {"model_id": "cohere.embed-english-v3", "dimensions": [1024]},
+    "COHERE_EMBED_MULTILINGUAL_V3": {"model_id": "cohere.embed-multilingual-v3", "dimensions": [1024]},
+}
+
+
+def resolve_embedding_model(embedding_model: Optional[str] = None, dimension: Optional[int] = None) -> Tuple[str, int]:
+    """Returns the Bedrock model id and vector dimension for an embedding model name.
+
+    Indexes created before the model was recorded use the default model.
+    """
+    model = EMBEDDING_MODELS.get(embedding_model or DEFAULT_EMBEDDING_MODEL)
+    if model is None:
+        raise ValueError(f"Unsupported embedding model: {embedding_model}. Supported models: {', '.join(EMBEDDING_MODELS)}")
+    if dimension is None:
+        dimension = model["dimensions"][0]
+    elif dimension not in model["dimensions"]:
+        raise ValueError(f"{embedding_model} supports dimensions {', '.join(map(str, model['dimensions']))}, not {dimension}")
+    return model["model_id"], dimension
+
+
+def embedding_model_kwargs(model_id: str, dimension: int, input_type: str = "search_query") -> dict:
+    """Request parameters for BedrockEmbeddings so query vectors match the index."""
+    if model_id.startswith("cohere."):
+        return {"input_type": input_type}
+    if model_id == "amazon.titan-embed-text-v2:0":
+        return {"dimensions": dimension}
+    return {}
@@ -0,0 +1,97 @@
+import time
+
+import boto3
+from langchain_community.embeddings.bedrock import BedrockEmbeddings
+
+from utils.local_vector_index import LOCAL_HOST_SCHEME, LOCAL_VECTOR_STORE_BUCKET, get_local_index
+from utils.opensearchutil import RRF_RANK_CONSTANT, build_metadata_filter, reciprocal_rank_fusion, linear_fusion, elapsed_ms
+
+
+class LocalVectorDB:
+    """A local vector store index with the same create_index and search surface as OpenSearchVectorDB.
+
+    The host is local://<store_name>. Searches run in process against the index files,
+    which are refreshed from the snapshot the vector job service writes.
+    """
+
+    def __init__(self, host=None, index_name=None, region=None, embeddings=None, s3_client=None):
+        self.host = host
+        self.index_name = index_name
+        self.region = region
+        self.store_name = host[len(LOCAL_HOST_SCHEME):]
+        self.embeddings = embeddings or BedrockEmbeddings()
+        self.s3_client = s3_client or (boto3.Session(region_name=region).client('s3') if LOCAL_VECTOR_STORE_BUCKET else None)
+
+    def health_check(self):
+        return True
+
+    def close(self):
+        pass
+
+    def create_index(self, index_name=None, dimension=1536, space_type="l2", engine=None, m=None, ef_construction=None,
+                     ef_search=None, quantization=None, **kwargs):
+        """Creates the index if it doesn't exist. HNSW graph parameters do not apply to the flat and IVF engines."""
+        if quantization == "byte":
+            raise ValueError("Local vector stores support fp16 quantization only")
+        index = get_local_index(self.store_name, index_name, self.s3_client)
+        if not index.exists():
+            index.create(dimension, space_type=space_type, engine=engine or "auto",
+                         dtype="float16" if quantization == "fp16" else "float32")
+
+    def get_index_status(self, index_name=None):
+        return self._index(index_name).stats()
+
+    def search(self, query, k=4, num_candidates=None, ef_search=None, filters=None, min_score=None, fields=None,
+               search_mode="vector", fusion="rrf", vector_weight=0.5, rank_constant=RRF_RANK_CONSTANT,
+               timings=None, text_field="text", vector_field="vector_field"):
+        """Runs a vector, BM25 or hybrid search like OpenSearchVectorDB.search. ef_search sets the IVF lists probed."""
+        timings = timings if timings is not None else {}
+        started = time.perf_counter()
+        # Validates filters the same way as OpenSearch searches
+        build_metadata_filter(filters)
+        index = self._index()
+        window = max(k, num_candidates or k)
+
+        vector_hits, bm25_hits = [], []
+        if search_mode in ("vector", "hybrid"):
+            embed_started = time.perf_counter()
+            vector = self.embeddings.embed_query(query)
+            timings["embedding"] = elapsed_ms(embed_started)
+            search_started = time.perf_counter()
+            vector_hits = index.search_vectors([vector], window, filters, nprobe=ef_search)[0]
+            timings["vector"] = elapsed_ms(search_started)
+        if search_mode in ("bm25", "hybrid"):
+            search_started = time.perf_counter()
+            bm25_hits = index.search_text(query, window, filters)
+            timings["bm25"] = elapsed_ms(search_started)
+
+        if search_mode == "hybrid":
+            fusion_started = time.perf_counter()
+            if fusion == "linear":
+                fused = linear_fusion([vector_hits, bm25_hits], [vector_weight, 1 - vector_weight])
+            else:
+                fused = reciprocal_rank_fusion([vector_hits, bm25_hits], rank_constant)
+            hits = [{**entry["hit"], "_score": entry["score"]} for entry in fused]
+            timings["fusion"] = elapsed_ms(fusion_started)
+        else:
+            hits = vector_hits or bm25_hits
+
+        hits = [hit for hit in hits if min_score is None or hit["_score"] >= min_score][:k]
+        timings["total"] = elapsed_ms(started)
+        return [
+            {
+                "text": hit["_source"]["text"],
+                "score": hit["_score"],
+                "metadata": hit["_source"]["metadata"] if fields is None
+                else {field: value for field, value in hit["_source"]["metadata"].items() if field in fields}
+            }
+            for hit in hits
+        ]
+
+    def _index(self, index_name=None):
+        index = get_local_index(self.store_name, index_name or self.index_name, self.s3_client)
+        if index.loaded:
+            index.refresh()
+        else:
+            index.load()
+        return index
@@ -0,0 +1,445 @@
+import os
+import re
+import json
+import math
+import time
+import shutil
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+LOCAL_VECTOR_STORE_DIR = os.getenv('LOCAL_VECTOR_STORE_DIR', '/tmp/vector_stores')
+# Snapshots are shared between the vectorization and vector job services through S3; without a bucket
+# the store lives on local disk only, which is enough for development and offline tests
+LOCAL_VECTOR_STORE_BUCKET = os.getenv('LOCAL_VECTOR_STORE_BUCKET')
+LOCAL_VECTOR_STORE_PREFIX = os.getenv('LOCAL_VECTOR_STORE_PREFIX', 'vector_stores')
+LOCAL_VECTOR_STORE_REFRESH_INTERVAL = int(os.getenv('LOCAL_VECTOR_STORE_REFRESH_INTERVAL', '30'))  # in seconds
+# Indexes with the "auto" engine switch from flat to IVF search at this many vectors
+LOCAL_IVF_MIN_VECTORS = int(os.getenv('LOCAL_IVF_MIN_VECTORS', '50000'))
+LOCAL_IVF_TRAINING_ITERATIONS = 10
+
+LOCAL_HOST_SCHEME = "local://"
+LOCAL_ENGINES = {"auto", "flat", "ivf"}
+LOCAL_SPACE_TYPES = {"l2", "cosinesimil", "innerproduct"}
+RANGE_OPERATORS = {"gt": np.greater, "gte": np.greater_equal, "lt": np.less, "lte": np.less_equal}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def is_local_host(host: Optional[str]) -> bool:
+    return bool(host) and host.startswith(LOCAL_HOST_SCHEME)
+
+
+def local_host(store_name: str) -> str:
+    return f"{LOCAL_HOST_SCHEME}{store_name}"
+
+
+def _tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def _matches(metadata: dict, filters: dict) -> bool:
+    for field, condition in filters.items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if value is None or not all(RANGE_OPERATORS[op](value, bound) for op, bound in condition.items()):
+                return False
+        elif isinstance(condition, list):
+            if value not in condition:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+_indexes: Dict[tuple, "LocalVectorIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_local_index(store_name: str, index_name: str, s3_client=None) -> "LocalVectorIndex":
+    """Returns the process-wide instance of an index, so all clients of it see the same writes."""
+    key = (store_name, index_name)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = LocalVectorIndex(store_name, index_name, s3_client=s3_client)
+        return _indexes[key]
+
+
+class LocalVectorIndex:
+    """An in-process vector index persisted as memory-mapped NumPy files.
+
+    Every row holds a document id, text, metadata and vector. Vectors are scored in
+    batches with one matrix product, either over all rows (flat) or over the rows of the
+    nprobe closest inverted-file lists (IVF), and scores are scaled like OpenSearch k-NN
+    scores so min_score behaves the same on both backends. Writes are held in memory and
+    persisted by save(), which writes a new generation of files and then switches the
+    index.json pointer to it, locally and, when a bucket is configured, in S3. Readers
+    pick up new generations through refresh(). An index has a single writer.
+    """
+
+    def __init__(self, store_name: str, index_name: str, base_dir: str = LOCAL_VECTOR_STORE_DIR,
+                 bucket: Optional[str] = LOCAL_VECTOR_STORE_BUCKET, s3_client=None,
+                 refresh_interval: int = LOCAL_VECTOR_STORE_REFRESH_INTERVAL):
+        self.store_name = store_name
+        self.index_name = index_name
+        self.directory = os.path.join(base_dir, store_name, index_name)
+        self.bucket = bucket
+        self.s3_client = s3_client
+        self.refresh_interval = refresh_interval
+        self.config = None
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+        self._reset()
+
+    # Lifecycle
+
+    @property
+    def loaded(self) -> bool:
+        return self.config is not None
+
+    def exists(self) -> bool:
+        return self._remote_pointer() is not None if self.bucket else os.path.exists(self._pointer_path())
+
+    def create(self, dimension: int, space_type: str = "l2", engine: str = "auto", dtype: str = "float32", nprobe: Optional[int] = None):
+        if space_type not in LOCAL_SPACE_TYPES:
+            raise ValueError(f"Local vector stores support space types {', '.join(sorted(LOCAL_SPACE_TYPES))}, not {space_type}")
+        if engine not in LOCAL_ENGINES:
+            raise ValueError(f"Local vector stores support engines {', '.join(sorted(LOCAL_ENGINES))}, not {engine}")
+        with self._lock:
+            self.config = {"dimension": dimension, "space_type": space_type, "engine": engine, "dtype": dtype, "nprobe": nprobe}
+            self._reset()
+            self.generation = 0
+            self.save()
+
+    def load(self):
+        """Loads the latest generation, downloading it from S3 when the local copy is older."""
+        with self._lock:
+            pointer = self._remote_pointer() if self.bucket else self._local_pointer()
+            if pointer is None:
+                raise ValueError(f"Index {self.index_name} not found in local vector store {self.store_name}")
+            if self.bucket and not os.path.exists(os.path.join(self._generation_dir(pointer["generation"]), "index.json")):
+                self._download(pointer["generation"])
+            self._load_generation(pointer["generation"])
+            self._last_refresh = time.monotonic()
+
+    def refresh(self):
+        """Reloads the index if a newer generation was saved, at most once per refresh_interval."""
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        pointer = self._remote_pointer() if self.bucket else self._local_pointer()
+        self._last_refresh = time.monotonic()
+        if pointer is not None and pointer["generation"] > self.generation:
+            logger.info(f"Reloading local index {self.index_name} at generation {pointer['generation']}")
+            self.load()
+
+    def save(self):
+        """Compacts deleted rows, retrains IVF lists if needed and persists a new generation."""
+        with self._lock:
+            self._materialize()
+            live = ~self._deleted
+            vectors = np.ascontiguousarray(self._vectors[live])
+            documents = [doc for doc, deleted in zip(self._documents, self._deleted) if not deleted]
+            centroids, assignments = self._train_ivf(vectors)
+
+            generation = self.generation + 1
+            directory = self._generation_dir(generation)
+            os.makedirs(directory, exist_ok=True)
+            np.save(os.path.join(directory, "vectors.npy"), vectors)
+            with open(os.path.join(directory, "documents.jsonl"), "w") as f:
+                for doc in documents:
+                    f.write(json.dumps(doc) + "\n")
+            if centroids is not None:
+                np.save(os.path.join(directory, "centroids.npy"), centroids)
+                np.save(os.path.join(directory, "assignments.npy"), assignments)
+            pointer = {"generation": generation, "count": len(documents), "config": self.config}
+            with open(os.path.join(directory, "index.json"), "w") as f:
+                json.dump(pointer, f)
+
+            if self.bucket:
+                self._upload(generation)
+            self._write_local_pointer(pointer)
+            self._load_generation(generation)
+            self._remove_old_generations()
+
+    # Writes
+
+    def upsert(self, ids: List[str], texts: List[str], vectors, metadatas: Optional[List[dict]] = None):
+        """Adds documents, replacing any with the same id. Persisted by the next save()."""
+        vectors = self._prepare(np.asarray(vectors, dtype=np.float32))
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(ids), dtype=bool)])
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                previous = self._rows.get(doc_id)
+                if previous is not None:
+                    self._deleted[previous] = True
+                self._rows[doc_id] = len(self._documents)
+                self._documents.append({"id": doc_id, "text": text, "metadata": metadata})
+            self._pending.append(vectors)
+            self._postings = None
+
+    def delete(self, ids: Iterable[str]) -> int:
+        with self._lock:
+            deleted = 0
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is not None:
+                    self._deleted[row] = True
+                    deleted += 1
+            if deleted:
+                self._postings = None
+            return deleted
+
+    # Search
+
+    def search_vectors(self, queries, k: int = 4, filters: Optional[dict] = None, nprobe: Optional[int] = None) -> List[List[dict]]:
+        """Scores a batch of query vectors against the index and returns the top k hits of each."""
+        queries = self._prepare(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        with self._lock:
+            self._materialize()
+            candidates = self._candidate_mask(filters)
+            if self._centroids is None:
+                # Flat: one matrix product scores the whole batch against every vector
+                rows = np.flatnonzero(candidates)
+                scores = self._score(queries, self._vectors, self._norms)[:, rows]
+                return [self._top_hits(rows, query_scores, k) for query_scores in scores]
+
+            probes = np.argsort(-self._score(queries, self._centroids), axis=1)[:, :self._nprobe(nprobe)]
+            results = []
+            for query, query_probes in zip(queries, probes):
+                rows = np.flatnonzero(candidates & np.isin(self._assignments, query_probes))
+                scores = self._score(query[None, :], self._vectors[rows], self._norms[rows])[0] if len(rows) else np.empty(0)
+                results.append(self._top_hits(rows, scores, k))
+            return results
+
+    def search_text(self, query: str, k: int = 4, filters: Optional[dict] = None) -> List[dict]:
+        """Ranks documents by BM25 on their text."""
+        with self._lock:
+            self._materialize()
+            postings, lengths = self._text_index()
+            live = int((~self._deleted).sum())
+            if not live:
+                return []
+            average_length = max(lengths[~self._deleted].mean(), 1.0)
+            scores = np.zeros(len(self._documents), dtype=np.float32)
+            for term in set(_tokenize(query)):
+                entries = [(row, tf) for row, tf in postings.get(term, ()) if not self._deleted[row]]
+                if not entries:
+                    continue
+                idf = math.log(1 + (live - len(entries) + 0.5) / (len(entries) + 0.5))
+                rows = np.array([row for row, _ in entries])
+                tf = np.array([tf for _, tf in entries], dtype=np.float32)
+                scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / average_length))
+            rows = np.flatnonzero(self._candidate_mask(filters) & (scores > 0))
+            return self._top_hits(rows, scores[rows], k)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "count": len(self._rows),
+                "ivf_lists": 0 if self._centroids is None else len(self._centroids),
+                "config": self.config
+            }
+
+    # Internals
+
+    def _reset(self):
+        dimension = self.config["dimension"] if self.config else 0
+        self._vectors = np.zeros((0, dimension), dtype=self._dtype())
+        self._pending = []
+        self._documents = []
+        self._rows = {}
+        self._deleted = np.zeros(0, dtype=bool)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._centroids = None
+        self._assignments = None
+        self._postings = None
+        self._lengths = None
+
+    def _dtype(self):
+        return np.float16 if self.config and self.config.get("dtype") == "float16" else np.float32
+
+    def _prepare(self, vectors):
+        if vectors.shape[-1] != self.config["dimension"]:
+            raise ValueError(f"Expected vectors of dimension {self.config['dimension']}, got {vectors.shape[-1]}")
+        if self.config["space_type"] == "cosinesimil":
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors
+
+    def _materialize(self):
+        if not self._pending:
+            return
+        added = np.vstack(self._pending).astype(self._dtype())
+        self._pending = []
+        if self._centroids is not None:
+            added_assignments = np.argmax(self._score(added, self._centroids), axis=1).astype(np.int32)
+            self._assignments = np.concatenate([self._assignments, added_assignments])
+        self._vectors = np.vstack([self._vectors, added])
+        self._norms = np.concatenate([self._norms, np.einsum("ij,ij->i", added, added, dtype=np.float32)])
+
+    def _score(self, queries, vectors, vector_norms=None):
+        """Scores every query against every vector, scaled like OpenSearch k-NN scores."""
+        products = queries @ vectors.T.astype(np.float32)
+        space_type = self.config["space_type"]
+        if space_type == "cosinesimil":
+            return (1 + products) / 2
+        if space_type == "innerproduct":
+            return np.where(products >= 0, products + 1, 1 / (1 - products))
+        if vector_norms is None:
+            vector_norms = np.einsum("ij,ij->i", vectors, vectors, dtype=np.float32)
+        distances = np.maximum(np.einsum("ij,ij->i", queries, queries)[:, None] - 2 * products + vector_norms[None, :], 0)
+        return 1 / (1 + distances)
+
+    def _candidate_mask(self, filters):
+        mask = ~self._deleted
+        if filters:
+            mask &= np.fromiter((_matches(doc["metadata"], filters) for doc in self._documents), dtype=bool, count=len(self._documents))
+        return mask
+
+    def _top_hits(self, rows, scores, k):
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return [
+            {
+                "_id": self._documents[rows[i]]["id"],
+                "_score": float(scores[i]),
+                "_source": {"text": self._documents[rows[i]]["text"], "metadata": self._documents[rows[i]]["metadata"]}
+            }
+            for i in order
+        ]
+
+    def _nprobe(self, nprobe):
+        return max(1, min(nprobe or self.config.get("nprobe") or max(8, len(self._centroids) // 20), len(self._centroids)))
+
+    def _train_ivf(self, vectors):
+        engine = self.config["engine"]
+        if len(vectors) == 0 or engine == "flat" or (engine == "auto" and len(vectors) < LOCAL_IVF_MIN_VECTORS):
+            return None, None
+        nlist = max(1, int(math.sqrt(len(vectors))))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), 64 * nlist), replace=False)].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(LOCAL_IVF_TRAINING_ITERATIONS):
+            labels = np.argmax(self._score(sample, centroids), axis=1)
+            for cluster in range(nlist):
+                members = sample[labels == cluster]
+                # Empty lists are reseeded with a random sample vector
+                centroids[cluster] = members.mean(axis=0) if len(members) else sample[rng.integers(len(sample))]
+            centroids = self._prepare(centroids)
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 65536):
+            block = vectors[start:start + 65536].astype(np.float32)
+            assignments[start:start + 65536] = np.argmax(self._score(block, centroids), axis=1)
+        return centroids, assignments
+
+    def _text_index(self):
+        if self._postings is None:
+            postings = defaultdict(list)
+            lengths = np.zeros(len(self._documents), dtype=np.float32)
+            for row, doc in enumerate(self._documents):
+                if self._deleted[row]:
+                    continue
+                tokens = _tokenize(doc["text"])
+                lengths[row] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    postings[term].append((row, tf))
+            self._postings, self._lengths = postings, lengths
+        return self._postings, self._lengths
+
+    # Persistence
+
+    def _generation_dir(self, generation: int) -> str:
+        return os.path.join(self.directory, str(generation))
+
+    def _pointer_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def _s3_key(self, *parts) -> str:
+        return "/".join([LOCAL_VECTOR_STORE_PREFIX, self.store_name, self.index_name, *map(str, parts)])
+
+    def _local_pointer(self) -> Optional[dict]:
+        try:
+            with open(self._pointer_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_local_pointer(self, pointer: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self._pointer_path() + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(pointer, f)
+        os.replace(temp_path, self._pointer_path())
+
+    def _remote_pointer(self) -> Optional[dict]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self._s3_key("index.json"))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def _upload(self, generation: int):
+        directory = self._generation_dir(generation)
+        # Data files first, so the pointer never names a generation that is not fully uploaded
+        for file_name in sorted(os.listdir(directory)):
+            self.s3_client.upload_file(os.path.join(directory, file_name), self.bucket, self._s3_key(generation, file_name))
+        self.s3_client.upload_file(os.path.join(directory, "index.json"), self.bucket, self._s3_key("index.json"))
+        # The previous generation is kept for readers that are still downloading it
+        self._delete_remote_generation(generation - 2)
+
+    def _delete_remote_generation(self, generation: int):
+        if generation < 1:
+            return
+        prefix = self._s3_key(generation) + "/"
+        listed = self.s3_client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
+        objects = [{"Key": item["Key"]} for item in listed.get("Contents", [])]
+        if objects:
+            self.s3_client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects})
+
+    def _download(self, generation: int):
+        directory = self._generation_dir(generation)
+        os.makedirs(directory, exist_ok=True)
+        listed = self.s3_client.list_objects_v2(Bucket=self.bucket, Prefix=self._s3_key(generation) + "/")
+        files = sorted(listed.get("Contents", []), key=lambda item: item["Key"].endswith("index.json"))
+        # index.json last, as its presence marks a complete local copy
+        for item in files:
+            self.s3_client.download_file(self.bucket, item["Key"], os.path.join(directory, item["Key"].rsplit("/", 1)[-1]))
+        with open(os.path.join(directory, "index.json")) as f:
+            self._write_local_pointer(json.load(f))
+
+    def _load_generation(self, generation: int):
+        directory = self._generation_dir(generation)
+        with open(os.path.join(directory, "index.json")) as f:
+            self.config = json.load(f)["config"]
+        self._reset()
+        self.generation = generation
+        self._vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "documents.jsonl")) as f:
+            self._documents = [json.loads(line) for line in f]
+        self._rows = {doc["id"]: row for row, doc in enumerate(self._documents)}
+        self._deleted = np.zeros(len(self._documents), dtype=bool)
+        self._norms = np.einsum("ij,ij->i", self._vectors, self._vectors, dtype=np.float32)
+        if os.path.exists(os.path.join(directory, "centroids.npy")):
+            self._centroids = np.load(os.path.join(directory, "centroids.npy"))
+            self._assignments = np.load(os.path.join(directory, "assignments.npy"), mmap_mode="r")
+
+    def _remove_old_generations(self):
+        # Memory maps of removed files stay readable until they are released
+        for name in os.listdir(self.directory):
+            if name.isdigit() and int(name) < self.generation - 1:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
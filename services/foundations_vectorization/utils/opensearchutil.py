@@ -1,6 +1,10 @@
+import os
+import time
 import boto3
 import json
 import uuid
+import threading
+import concurrent.futures
 from langchain_community.vectorstores import OpenSearchVectorSearch
 from langchain_community.embeddings.bedrock import BedrockEmbeddings
 from langchain_community.docstore.document import Document
@@ -19,6 +23,10 @@ class OpenSearchServerlessManager:
         """Initialize the OpenSearch Serverless client."""
         self.client = boto3.client(
             "opensearchserverless", region_name=region_name)
+        self.region_name = region_name
+        # Collection ids never change host, so hosts are cached for the life of the task
+        self._collection_hosts = {}
+        self._lock = threading.Lock()
 
     def create_security_policy(self, name, policy_type, description, policy_json):
         """Creates a security policy in OpenSearch Serverless."""
@@ -128,6 +136,168 @@ class OpenSearchServerlessManager:
 
         return response['createCollectionDetail']
 
+    def find_collection(self, collection_name):
+        """Returns the summary of the collection with this name, or None. Lists only that collection."""
+        response = self.client.list_collections(collectionFilters={'name': collection_name})
+        for collection in response['collectionSummaries']:
+            if collection['name'] == collection_name:
+                return collection
+        return None
+
+    def get_collection(self, collection_id):
+        """Returns the details of a collection by id, or None if it doesn't exist."""
+        response = self.client.batch_get_collection(ids=[collection_id])
+        details = response.get('collectionDetails', [])
+        if not details:
+            return None
+        self.cache_collection_host(collection_id, details[0].get('collectionEndpoint'))
+        return details[0]
+
+    def cache_collection_host(self, collection_id, host=None):
+        with self._lock:
+            self._collection_hosts[collection_id] = host or f"https://{collection_id}.{self.region_name}.aoss.amazonaws.com"
+
+    def collection_host(self, collection_id):
+        """Returns the endpoint of a collection, or None if it doesn't exist. Looks it up once per task."""
+        with self._lock:
+            host = self._collection_hosts.get(collection_id)
+        if host is None and self.get_collection(collection_id) is not None:
+            with self._lock:
+                host = self._collection_hosts[collection_id]
+        return host
+
+
+
+# Chunk metadata fields that searches can filter on, with their index mapping types
+METADATA_FIELDS = {
+    "file_name": "keyword",
+    "file_path": "keyword",
+    "extraction_job_id": "keyword",
+    "chunking_job_id": "keyword",
+    "page_number": "integer",
+    "chunk_index": "integer",
+    "char_start": "integer",
+    "char_end": "integer",
+    "content_hash": "keyword",
+}
+RANGE_OPERATORS = {"gt", "gte", "lt", "lte"}
+# k-NN engines that apply filters during the graph search rather than after it
+EFFICIENT_FILTER_ENGINES = {"faiss", "lucene"}
+
+# Space types each k-NN engine supports, and the engine each vector quantization needs
+ENGINE_SPACE_TYPES = {
+    "nmslib": {"l2", "cosinesimil", "innerproduct", "l1", "linf"},
+    "faiss": {"l2", "innerproduct"},
+    "lucene": {"l2", "cosinesimil", "innerproduct"},
+}
+QUANTIZATION_ENGINES = {"fp16": "faiss", "byte": "lucene"}
+
+RRF_RANK_CONSTANT = int(os.getenv('RRF_RANK_CONSTANT', '60'))
+HYBRID_SEARCH_WORKERS = int(os.getenv('HYBRID_SEARCH_WORKERS', '16'))
+# Runs the BM25 stage of hybrid searches while the calling thread runs the k-NN stage
+_search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=HYBRID_SEARCH_WORKERS, thread_name_prefix="hybrid-search")
+
+
+def build_metadata_filter(filters):
+    """Turns {"field": value | [values] | {"gte": ..}} into OpenSearch filter clauses on chunk metadata."""
+    clauses = []
+    for field, condition in (filters or {}).items():
+        if field not in METADATA_FIELDS:
+            raise ValueError(f"Unsupported filter field: {field}. Supported fields: {', '.join(sorted(METADATA_FIELDS))}")
+        path = f"metadata.{field}"
+        if isinstance(condition, dict):
+            if not condition or not set(condition) <= RANGE_OPERATORS:
+                raise ValueError(f"Range filter on {field} must use {', '.join(sorted(RANGE_OPERATORS))}")
+            clauses.append({"range": {path: condition}})
+        elif isinstance(condition, list):
+            clauses.append({"terms": {path: condition}})
+        else:
+            clauses.append({"term": {path: condition}})
+    return clauses
+
+
+def build_index_body(dimension=1536, space_type="l2", engine=None, m=16, ef_construction=512, ef_search=None,
+                     quantization=None, text_field="text", vector_field="vector_field"):
+    """Builds the settings and mappings of a vector index with an HNSW k-NN field.
+
+    fp16 quantization stores faiss vectors as 16-bit floats and byte quantization has the
+    lucene engine store them as one byte per dimension, roughly halving and quartering
+    vector memory. Both quantize on ingestion, so documents and queries stay float vectors.
+    """
+    engine = engine or "nmslib"
+    if engine not in ENGINE_SPACE_TYPES:
+        raise ValueError(f"OpenSearch indexes support engines {', '.join(sorted(ENGINE_SPACE_TYPES))}, not {engine}")
+    if space_type not in ENGINE_SPACE_TYPES[engine]:
+        raise ValueError(f"The {engine} engine supports space types {', '.join(sorted(ENGINE_SPACE_TYPES[engine]))}, not {space_type}")
+
+    parameters = {"m": m, "ef_construction": ef_construction}
+    if quantization is not None:
+        if QUANTIZATION_ENGINES[quantization] != engine:
+            raise ValueError(f"{quantization} quantization requires the {QUANTIZATION_ENGINES[quantization]} engine")
+        if quantization == "fp16":
+            parameters["encoder"] = {"name": "sq", "parameters": {"type": "fp16"}}
+        else:
+            parameters["encoder"] = {"name": "sq"}
+
+    settings = {"index.knn": True}
+    if ef_search and engine != "lucene":
+        # lucene has no index level ef_search; searches on it use the per-query value instead
+        settings["index.knn.algo_param.ef_search"] = ef_search
+
+    return {
+        "settings": settings,
+        "mappings": {
+            "properties": {
+                vector_field: {
+                    "type": "knn_vector",
+                    "dimension": dimension,
+                    "method": {
+                        "name": "hnsw",
+                        "space_type": space_type,
+                        "engine": engine,
+                        "parameters": parameters
+                    }
+                },
+                text_field: {
+                    "type": "text"
+                },
+                "metadata": {
+                    "properties": {
+                        field: {"type": field_type} for field, field_type in METADATA_FIELDS.items()
+                    }
+                }
+            }
+        }
+    }
+
+
+def reciprocal_rank_fusion(result_lists, rank_constant=RRF_RANK_CONSTANT):
+    """Scores every hit by the sum of 1 / (rank_constant + rank) over the lists it appears in."""
+    fused = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["_id"], {"hit": hit, "score": 0.0})
+            entry["score"] += 1.0 / (rank_constant + rank)
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+
+
+def linear_fusion(result_lists, weights):
+    """Min-max normalizes each list's scores to [0, 1] and sums them with the given weights."""
+    fused = {}
+    for hits, weight in zip(result_lists, weights):
+        if not hits:
+            continue
+        scores = [hit["_score"] for hit in hits]
+        low, high = min(scores), max(scores)
+        for hit in hits:
+            normalized = (hit["_score"] - low) / (high - low) if high > low else 1.0
+            entry = fused.setdefault(hit["_id"], {"hit": hit, "score": 0.0})
+            entry["score"] += weight * normalized
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
 
 
 class OpenSearchVectorDB:
@@ -139,27 +309,18 @@ class OpenSearchVectorDB:
     
 
     def get_auth(self):
-        credentials = self.session.get_credentials()
-
-        access_key = credentials.access_key
-        secret_key = credentials.secret_key
-        token = credentials.token
-
-        auth = AWS4Auth(access_key, secret_key,
-                 self.region , 'aoss', session_token=token)
-
-        return auth
-        
-        
+        # Signs each request with the session's refreshable credentials, so pooled clients
+        # keep working after the task role credentials rotate
+        return AWS4Auth(region=self.region, service=self.AOSS_SVC_NAME, refreshable_credentials=self.credentials)
 
-    def __init__(self, host=None, index_name=None, region=None, use_ssl=True, verify_certs=True, timeout=DEFAULT_TIMEOUT):
+    def __init__(self, host=None, index_name=None, region=None, use_ssl=True, verify_certs=True, timeout=DEFAULT_TIMEOUT, embeddings=None):
         """Initializes the OpenSearch Vector DB."""
         self.host = host
         self.index_name = index_name
         self.use_ssl = use_ssl
         self.verify_certs = verify_certs
         self.timeout = timeout
-        self.embeddings = BedrockEmbeddings()
+        self.embeddings = embeddings or BedrockEmbeddings()
         self.region = region
         self.session = boto3.Session(region_name=region)
         self.credentials = self.session.get_credentials()
@@ -175,48 +336,27 @@ class OpenSearchVectorDB:
             verify_certs=self.verify_certs,
             connection_class=RequestsHttpConnection,
         )
+        self.client = self.docsearch.client
+        self._engine = None
 
-    def create_index(self, index_name=None):
-        """Creates the OpenSearch index if it doesn't exist."""
-        index_body = {
-            "settings": {
-                "index.knn": True
-            },
-            "mappings": {
-                "properties": {
-                    "vector_field": {
-                        "type": "knn_vector",
-                        "dimension": 1536
-                    },
-                    "text": {
-                        "type": "text"
-                    }
-                }
-            }
-        }
+    def health_check(self):
+        """Returns True if the collection answers an authenticated request."""
+        self.client.indices.exists(index=self.index_name)
+        return True
 
-        client = OpenSearch(
-            hosts=[self.host],
-            http_auth=self.opensearch_auth,
-            use_ssl=self.use_ssl,
-            verify_certs=self.verify_certs,
-            connection_class=RequestsHttpConnection,
-        )
+    def close(self):
+        self.client.close()
+
+    def create_index(self, index_name=None, **index_options):
+        """Creates the OpenSearch index if it doesn't exist. index_options are passed to build_index_body."""
+        index_body = build_index_body(**index_options)
 
-        if not client.indices.exists(index_name):
-            client.indices.create(index=index_name, body=index_body)
+        if not self.client.indices.exists(index_name):
+            self.client.indices.create(index=index_name, body=index_body)
 
     def get_index_status(self, index_name=None):
         """Returns the status of the OpenSearch index."""
-        client = OpenSearch(
-            hosts=[self.host],
-            http_auth=self.opensearch_auth,
-            use_ssl=self.use_ssl,
-            verify_certs=self.verify_certs,
-            connection_class=RequestsHttpConnection,
-        )
-
-        return client.indices.get(index=index_name)
+        return self.client.indices.get(index=index_name)
 
     def similarity_search(self, query, text_field="text", vector_field="vector_field"):
         """Searches the OpenSearch index for documents similar to the provided query."""
@@ -226,4 +366,98 @@ class OpenSearchVectorDB:
 
         sim_docs = [{"text": doc.page_content} for doc in sim_docs]
 
-        return sim_docs
\ No newline at end of file
+        return sim_docs
+
+    def vector_engine(self, vector_field="vector_field"):
+        """Returns the k-NN engine of the index's vector field, read once from the mapping."""
+        if self._engine is None:
+            mapping = self.client.indices.get_mapping(index=self.index_name)
+            properties = next(iter(mapping.values()), {}).get("mappings", {}).get("properties", {})
+            self._engine = properties.get(vector_field, {}).get("method", {}).get("engine", "nmslib")
+        return self._engine
+
+    def search(self, query, k=4, num_candidates=None, ef_search=None, filters=None, min_score=None, fields=None,
+               search_mode="vector", fusion="rrf", vector_weight=0.5, rank_constant=RRF_RANK_CONSTANT,
+               timings=None, text_field="text", vector_field="vector_field"):
+        """Runs a k-NN, BM25 or hybrid query with metadata filters pushed down into OpenSearch.
+
+        Returns up to k hits with their text, score and metadata. num_candidates sets how
+        many hits each stage retrieves before filters, fusion and min_score apply. In hybrid
+        mode the BM25 and k-NN queries run in parallel and their hits are fused, either by
+        reciprocal rank (fusion="rrf") or by a vector_weight-weighted sum of min-max
+        normalized scores (fusion="linear"); min_score then applies to the fused score.
+        Per-stage durations in milliseconds are added to timings when a dict is given.
+        """
+        timings = timings if timings is not None else {}
+        started = time.perf_counter()
+        clauses = build_metadata_filter(filters)
+        source = self._source_filter(fields, text_field, vector_field)
+
+        if search_mode == "hybrid":
+            window = max(k, num_candidates or k)
+            bm25_future = _search_executor.submit(self._timed_search, "bm25", timings,
+                                                  self._bm25_query(query, clauses, text_field), window, source)
+            try:
+                vector_hits = self._vector_search(query, window, window, ef_search, clauses, source, None, vector_field, timings)
+            finally:
+                bm25_hits = bm25_future.result()
+
+            fusion_started = time.perf_counter()
+            if fusion == "linear":
+                fused = linear_fusion([vector_hits, bm25_hits], [vector_weight, 1 - vector_weight])
+            else:
+                fused = reciprocal_rank_fusion([vector_hits, bm25_hits], rank_constant)
+            hits = [{**entry["hit"], "_score": entry["score"]} for entry in fused
+                    if min_score is None or entry["score"] >= min_score][:k]
+            timings["fusion"] = elapsed_ms(fusion_started)
+        elif search_mode == "bm25":
+            hits = self._timed_search("bm25", timings, self._bm25_query(query, clauses, text_field), k, source, min_score)
+        else:
+            hits = self._vector_search(query, k, num_candidates, ef_search, clauses, source, min_score, vector_field, timings)
+
+        timings["total"] = elapsed_ms(started)
+        return [
+            {
+                "text": hit["_source"].get(text_field),
+                "score": hit["_score"],
+                "metadata": hit["_source"].get("metadata", {})
+            }
+            for hit in hits
+        ]
+
+    @staticmethod
+    def _source_filter(fields, text_field, vector_field):
+        if fields is not None:
+            return {"includes": [text_field] + [f"metadata.{field}" for field in fields]}
+        return {"excludes": [vector_field]}
+
+    @staticmethod
+    def _bm25_query(query, clauses, text_field):
+        return {"bool": {"must": [{"match": {text_field: query}}], "filter": clauses}}
+
+    def _vector_search(self, query, size, num_candidates, ef_search, clauses, source, min_score, vector_field, timings):
+        embed_started = time.perf_counter()
+        knn = {"vector": self.embeddings.embed_query(query), "k": max(size, num_candidates or size)}
+        timings["embedding"] = elapsed_ms(embed_started)
+        if ef_search:
+            knn["method_parameters"] = {"ef_search": ef_search}
+
+        if clauses and self.vector_engine(vector_field) in EFFICIENT_FILTER_ENGINES:
+            knn["filter"] = {"bool": {"filter": clauses}}
+            search_query = {"knn": {vector_field: knn}}
+        elif clauses:
+            # nmslib cannot filter inside the graph search, so filter the k-NN candidates in the same query
+            search_query = {"bool": {"filter": clauses, "must": [{"knn": {vector_field: knn}}]}}
+        else:
+            search_query = {"knn": {vector_field: knn}}
+
+        return self._timed_search("vector", timings, search_query, size, source, min_score)
+
+    def _timed_search(self, stage, timings, search_query, size, source, min_score=None):
+        started = time.perf_counter()
+        body = {"size": size, "query": search_query, "_source": source}
+        if min_score is not None:
+            body["min_score"] = min_score
+        response = self.client.search(index=self.index_name, body=body)
+        timings[stage] = elapsed_ms(started)
+        return response["hits"]["hits"]
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '10000'))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '86400'))  # in seconds
+
+KEY_PREFIX = "query_embedding"
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Wraps an embeddings model so repeated search queries skip the Bedrock call.
+
+    Query vectors are kept in an in-process LRU cache and, when a Redis client is given,
+    in Redis so that all tasks share them. Entries are keyed by the embedding model and
+    the normalized query text and expire after ttl seconds. Document embeddings are
+    passed through uncached.
+    """
+
+    def __init__(self, embeddings, model_id: Optional[str] = None, redis_client=None,
+                 max_size=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL):
+        self.embeddings = embeddings
+        self.model_id = model_id or getattr(embeddings, "model_id", "default")
+        self.redis = redis_client
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+
+        vector = self._get_local(key)
+        if vector is not None:
+            self._stats["local_hits"] += 1
+            return vector
+
+        vector = self._get_redis(key)
+        if vector is not None:
+            self._stats["redis_hits"] += 1
+            self._put_local(key, vector)
+            return vector
+
+        self._stats["misses"] += 1
+        vector = self.embeddings.embed_query(text)
+        self._put_local(key, vector)
+        self._put_redis(key, vector)
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._cache)
+        return {"size": size, **self._stats}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}:{self.model_id}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                return None
+            vector, expires_at = cached
+            if expires_at <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return vector
+
+    def _put_local(self, key: str, vector: List[float]):
+        with self._lock:
+            self._cache[key] = (vector, time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _get_redis(self, key: str) -> Optional[List[float]]:
+        if self.redis is None:
+            return None
+        try:
+            cached = self.redis.get(key)
+        except Exception as e:
+            self._stats["redis_errors"] += 1
+            logger.warning(f"Query embedding cache read failed: {e}")
+            return None
+        return json.loads(cached) if cached else None
+
+    def _put_redis(self, key: str, vector: List[float]):
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(key, json.dumps(vector), ex=self.ttl)
+        except Exception as e:
+            self._stats["redis_errors"] += 1
+            logger.warning(f"Query embedding cache write failed: {e}")
@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import threading
+import concurrent.futures
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+PENDING_POLICIES = "PENDING_POLICIES"
+CREATING = "CREATING"
+ACTIVE = "ACTIVE"
+FAILED = "FAILED"
+IN_PROGRESS_STATES = {PENDING_POLICIES, CREATING}
+
+VECTOR_STORE_PROVISION_WORKERS = int(os.getenv('VECTOR_STORE_PROVISION_WORKERS', '4'))
+VECTOR_STORE_POLL_INTERVAL = int(os.getenv('VECTOR_STORE_POLL_INTERVAL', '10'))  # in seconds
+VECTOR_STORE_PROVISION_TIMEOUT = int(os.getenv('VECTOR_STORE_PROVISION_TIMEOUT', '1800'))  # in seconds
+# A store whose state has not been saved for this long lost its provisioning task and is resumed
+VECTOR_STORE_PROVISION_STALE_AFTER = int(os.getenv('VECTOR_STORE_PROVISION_STALE_AFTER', '120'))  # in seconds
+
+
+def _is_conflict(e: Exception) -> bool:
+    return isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") == "ConflictException"
+
+
+def _age(timestamp) -> float:
+    return (datetime.now() - timestamp).total_seconds() if timestamp else float("inf")
+
+
+class VectorStoreProvisioner:
+    """Provisions OpenSearch Serverless vector stores in the background.
+
+    A store moves from PENDING_POLICIES (creating the encryption, network and data access
+    policies) to CREATING (waiting for the collection) to ACTIVE, or to FAILED with a
+    reason. Its state is saved on the VectorStore record after each step, so status polls
+    are answered from DynamoDB by any task. Steps treat ConflictException as already done,
+    which lets a store whose task stopped mid-way be resumed by resume_if_stale.
+    """
+
+    def __init__(self, manager, role_arn: str, vpce_id: str, workers=VECTOR_STORE_PROVISION_WORKERS,
+                 poll_interval=VECTOR_STORE_POLL_INTERVAL, timeout=VECTOR_STORE_PROVISION_TIMEOUT,
+                 stale_after=VECTOR_STORE_PROVISION_STALE_AFTER):
+        self.manager = manager
+        self.role_arn = role_arn
+        self.vpce_id = vpce_id
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="store-provisioner")
+        self._in_progress = set()
+        self._lock = threading.Lock()
+
+    def submit(self, vector_store) -> bool:
+        """Starts provisioning a store unless this task is already provisioning it."""
+        with self._lock:
+            if vector_store.vector_store_id in self._in_progress:
+                return False
+            self._in_progress.add(vector_store.vector_store_id)
+        self._executor.submit(self._run, vector_store)
+        return True
+
+    def resume_if_stale(self, vector_store) -> bool:
+        if vector_store.status not in IN_PROGRESS_STATES or _age(vector_store.updated_at) < self.stale_after:
+            return False
+        logger.info(f"Resuming provisioning of vector store {vector_store.vector_store_id} in state {vector_store.status}")
+        # Saving first refreshes updated_at, so tasks serving other polls leave the store to this one
+        self._save(vector_store, vector_store.status)
+        return self.submit(vector_store)
+
+    def shutdown(self):
+        # Stores still provisioning go stale and are resumed by another task
+        self._executor.shutdown(wait=False)
+
+    def _run(self, vector_store):
+        try:
+            if vector_store.status == PENDING_POLICIES:
+                self._create_policies(vector_store)
+                self._create_collection(vector_store)
+            if vector_store.status == CREATING:
+                self._wait_until_active(vector_store)
+        except Exception as e:
+            logger.exception(f"Provisioning vector store {vector_store.vector_store_id} failed")
+            self._save(vector_store, FAILED, str(e))
+        finally:
+            with self._lock:
+                self._in_progress.discard(vector_store.vector_store_id)
+
+    def _create_policies(self, vector_store):
+        name = vector_store.store_name
+        steps = [
+            lambda: self.manager.create_encryption_policy(
+                name=name + "-ep",
+                description="An encryption policy for logs collection",
+                collection_pattern=name + "*"
+            ),
+            lambda: self.manager.create_network_policy(
+                name=name + "-np",
+                description="Public access for logs collection",
+                collection_pattern=name + "*",
+                allow_public=False,
+                vpce_id=self.vpce_id
+            ),
+            lambda: self.manager.create_data_access_policy(
+                name=name + "-dp",
+                description="Data access policy for logs collection",
+                collection_pattern=name,
+                index_name="",
+                role_arn=self.role_arn
+            ),
+        ]
+        for step in steps:
+            try:
+                step()
+            except ClientError as e:
+                # Created by an earlier attempt at this store
+                if not _is_conflict(e):
+                    raise
+
+    def _create_collection(self, vector_store):
+        try:
+            collection = self.manager.create_collection(
+                collection_name=vector_store.store_name,
+                description=vector_store.description or "",
+                standby_replicas="DISABLED",
+                tags=vector_store.tags
+            )
+        except ClientError as e:
+            if not _is_conflict(e):
+                raise
+            collection = self.manager.find_collection(vector_store.store_name)
+            if collection is None:
+                raise
+        vector_store.collection_id = collection['id']
+        self.manager.cache_collection_host(collection['id'])
+        vector_store.host = self.manager.collection_host(collection['id'])
+        self._save(vector_store, CREATING)
+
+    def _wait_until_active(self, vector_store):
+        while True:
+            collection = self.manager.get_collection(vector_store.collection_id)
+            status = collection['status'] if collection else "NOT_FOUND"
+            if status == ACTIVE:
+                vector_store.host = self.manager.collection_host(vector_store.collection_id)
+                self._save(vector_store, ACTIVE)
+                logger.info(f"Vector store {vector_store.vector_store_id} is active at {vector_store.host}")
+                return
+            if status not in IN_PROGRESS_STATES:
+                self._save(vector_store, FAILED, f"Collection is {status}")
+                return
+            if _age(vector_store.created_at) > self.timeout:
+                self._save(vector_store, FAILED, f"Collection was not active after {self.timeout} seconds")
+                return
+            # Heartbeat so the store is not taken for stale while the collection is created
+            if _age(vector_store.updated_at) > self.stale_after / 2:
+                self._save(vector_store, CREATING)
+            time.sleep(self.poll_interval)
+
+    def _save(self, vector_store, status, reason=None):
+        vector_store.status = status
+        vector_store.status_reason = reason
+        vector_store.updated_at = datetime.now()
+        vector_store.save()
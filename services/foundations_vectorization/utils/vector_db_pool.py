@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DB_POOL_MAX_SIZE = int(os.getenv('VECTOR_DB_POOL_MAX_SIZE', '64'))
+VECTOR_DB_POOL_IDLE_TTL = int(os.getenv('VECTOR_DB_POOL_IDLE_TTL', '900'))  # in seconds
+# Clients are rebuilt after this age so SigV4 auth never outlives the credentials it was built from
+VECTOR_DB_POOL_MAX_AGE = int(os.getenv('VECTOR_DB_POOL_MAX_AGE', '1800'))  # in seconds
+VECTOR_DB_POOL_HEALTH_CHECK_INTERVAL = int(os.getenv('VECTOR_DB_POOL_HEALTH_CHECK_INTERVAL', '60'))  # in seconds
+
+
+class _PoolEntry:
+    def __init__(self, client):
+        now = time.monotonic()
+        self.client = client
+        self.created_at = now
+        self.last_used = now
+        self.last_checked = now
+
+
+class VectorDBPool:
+    """Keeps vector DB clients keyed by (host, index_name, region) for reuse across requests.
+
+    Extra keyword options given to get(), such as the index's embedding model, are passed
+    to the factory and are part of the key.
+
+    Clients are built by the factory on first use and handed out again on later lookups,
+    so connection setup, SigV4 auth and embedding clients are paid for once. Entries that
+    have been idle for idle_ttl are evicted, entries older than max_age are rebuilt, and
+    an entry that has not been used for health_check_interval is health checked before
+    it is handed out and rebuilt if the check fails. Dropped clients are not closed, since
+    a request that checked them out earlier may still be using them; their connections
+    are released when they are garbage collected.
+    """
+
+    def __init__(self, factory: Callable, max_size=VECTOR_DB_POOL_MAX_SIZE, idle_ttl=VECTOR_DB_POOL_IDLE_TTL,
+                 max_age=VECTOR_DB_POOL_MAX_AGE, health_check_interval=VECTOR_DB_POOL_HEALTH_CHECK_INTERVAL):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "health_check_failures": 0}
+
+    def get(self, host: str, index_name: str, region: Optional[str] = None, **options):
+        key = (host, index_name, region, tuple(sorted(options.items())))
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created_at > self.max_age:
+                self._remove(key)
+                entry = None
+
+        if entry is not None and now - entry.last_checked > self.health_check_interval:
+            if self._healthy(entry):
+                entry.last_checked = now
+            else:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        self._remove(key)
+                entry = None
+
+        if entry is None:
+            self._stats["misses"] += 1
+            entry = _PoolEntry(self.factory(host, index_name, region, **options))
+            with self._lock:
+                existing = self._entries.get(key)
+                if existing is not None:
+                    # Another request built the same client concurrently; keep the first one
+                    entry = existing
+                else:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_size:
+                        self._remove(next(iter(self._entries)))
+        else:
+            self._stats["hits"] += 1
+
+        with self._lock:
+            entry.last_used = now
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return entry.client
+
+    def invalidate(self, host: Optional[str] = None, index_name: Optional[str] = None, region: Optional[str] = None):
+        """Drops pooled clients matching every given key part, or all of them if none is given."""
+        with self._lock:
+            for key in list(self._entries):
+                if all(part is None or part == key_part for part, key_part in zip((host, index_name, region), key)):
+                    self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), **self._stats}
+
+    def close(self):
+        """Closes every pooled client. Called on shutdown."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def _evict_idle(self, now: float):
+        for key in [key for key, entry in self._entries.items() if now - entry.last_used > self.idle_ttl]:
+            self._remove(key)
+
+    def _remove(self, key: Tuple):
+        if self._entries.pop(key, None) is not None:
+            self._stats["evictions"] += 1
+
+    def _healthy(self, entry: _PoolEntry) -> bool:
+        try:
+            healthy = entry.client.health_check()
+        except Exception as e:
+            logger.warning(f"Vector DB health check failed: {e}")
+            healthy = False
+        if not healthy:
+            self._stats["health_check_failures"] += 1
+        return healthy
+
+    def _close(self, entry: _PoolEntry):
+        try:
+            entry.client.close()
+        except Exception as e:
+            logger.warning(f"Error closing vector DB client: {e}")
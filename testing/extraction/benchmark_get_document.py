@@ -0,0 +1,218 @@
+###############################################
+# Benchmark for Extraction.get_document in the Extraction Service.
+# It replays a Textract GetDocumentAnalysis response and compares the previous serial path
+# (LazyDocument parsing the whole document, then page.get_text and all_text += per page)
+# with the pipelined get_document, inline and with a linearization process pool.
+#
+# BENCHMARK_FIXTURE is a JSON list of the GetDocumentAnalysis responses of one job, in
+# NextToken order. To record one from a finished job in your account:
+#   BENCHMARK_RECORD_JOB_ID=<textract job id> BENCHMARK_FIXTURE=job.json python testing/extraction/benchmark_get_document.py
+# Without a fixture, a synthetic response of BENCHMARK_PAGES pages (titles, paragraphs and a
+# table per page, in Textract's block layout) is generated so the benchmark runs offline.
+#
+# Each GetDocumentAnalysis call is delayed by BENCHMARK_LATENCY_MS to stand in for the API.
+# No network calls are made unless a job is recorded.
+#
+# Run with: python testing/extraction/benchmark_get_document.py
+###############################################
+
+import os
+import sys
+import json
+import time
+import uuid
+import statistics
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "services", "foundations_extraction")
+sys.path.insert(0, os.path.abspath(SERVICE_DIR))
+
+BENCHMARK_FIXTURE = os.getenv("BENCHMARK_FIXTURE")
+BENCHMARK_RECORD_JOB_ID = os.getenv("BENCHMARK_RECORD_JOB_ID")
+BENCHMARK_REGION = os.getenv("BENCHMARK_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+BENCHMARK_PAGES = int(os.getenv("BENCHMARK_PAGES", "200"))
+BENCHMARK_LATENCY_MS = float(os.getenv("BENCHMARK_LATENCY_MS", "150"))
+BENCHMARK_WORKERS = int(os.getenv("BENCHMARK_WORKERS", str(os.cpu_count() or 1)))
+
+if not BENCHMARK_RECORD_JOB_ID:
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", BENCHMARK_REGION)
+
+from textractor.data.constants import TextractAPI
+from textractor.entities.lazy_document import LazyDocument
+
+from utils.extractor import Extraction, LINEARIZATION_CONFIG, TEXTRACT_RESULTS_PAGE_SIZE, linearize_page
+
+
+class ReplayTextractClient:
+    """Answers GetDocumentAnalysis from recorded responses, after BENCHMARK_LATENCY_MS."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = 0
+
+    def get_document_analysis(self, JobId, MaxResults=None, NextToken=None):
+        self.calls += 1
+        time.sleep(BENCHMARK_LATENCY_MS / 1000)
+        response = self.responses[int(NextToken or 0)]
+        # textractcaller extends the first response in place, so each call gets its own copy
+        return {**response, "Blocks": list(response["Blocks"])}
+
+
+def record(job_id):
+    import boto3
+    textract_client = boto3.client("textract", region_name=BENCHMARK_REGION)
+    responses, params = [], {"JobId": job_id, "MaxResults": TEXTRACT_RESULTS_PAGE_SIZE}
+    while True:
+        response = textract_client.get_document_analysis(**params)
+        response.pop("ResponseMetadata", None)
+        responses.append(response)
+        if not response.get("NextToken"):
+            return responses
+        params["NextToken"] = response["NextToken"]
+
+
+def _geometry(left, top, width, height):
+    return {
+        "BoundingBox": {"Width": width, "Height": height, "Left": left, "Top": top},
+        "Polygon": [{"X": left, "Y": top}, {"X": left + width, "Y": top},
+                    {"X": left + width, "Y": top + height}, {"X": left, "Y": top + height}],
+    }
+
+
+def _block(block_type, page, geometry, children=None, **fields):
+    block = {"BlockType": block_type, "Id": str(uuid.uuid4()), "Page": page, "Confidence": 99.0, "Geometry": geometry, **fields}
+    if children:
+        block["Relationships"] = [{"Type": "CHILD", "Ids": [child["Id"] for child in children]}]
+    return block
+
+
+def synthetic_page(page):
+    """Blocks of one page: a title, paragraphs of lines and a 4x3 table, each under a layout block."""
+    blocks, layouts, top = [], [], 0.05
+
+    def line(text, left, top, width):
+        words = [_block("WORD", page, _geometry(left + i * width / 8, top, width / 8, 0.015), Text=word, TextType="PRINTED")
+                 for i, word in enumerate(text.split())]
+        blocks.extend(words)
+        blocks.append(_block("LINE", page, _geometry(left, top, width, 0.015), words, Text=text))
+        return blocks[-1]
+
+    title = line(f"Section {page} quarterly operating review", 0.1, top, 0.6)
+    layouts.append(_block("LAYOUT_TITLE", page, _geometry(0.1, top, 0.6, 0.015), [title]))
+    for paragraph in range(6):
+        top += 0.04
+        lines = [line(f"Paragraph {paragraph} line {n} revenue grew in every region this period", 0.1, top + n * 0.02, 0.8)
+                 for n in range(5)]
+        layouts.append(_block("LAYOUT_TEXT", page, _geometry(0.1, top, 0.8, 0.1), lines))
+        top += 0.1
+
+    cells, cell_lines = [], []
+    for row in range(1, 5):
+        for column in range(1, 4):
+            left, cell_top = 0.1 + (column - 1) * 0.25, 0.85 + (row - 1) * 0.02
+            cell_line = line(f"r{row} c{column} {row * column * 100}", left, cell_top, 0.2)
+            words = [block for block in blocks if block["Id"] in cell_line["Relationships"][0]["Ids"]]
+            cells.append(_block("CELL", page, _geometry(left, cell_top, 0.25, 0.02), words,
+                                RowIndex=row, ColumnIndex=column, RowSpan=1, ColumnSpan=1))
+            cell_lines.append(cell_line)
+    table = _block("TABLE", page, _geometry(0.1, 0.85, 0.75, 0.08), cells, EntityTypes=["STRUCTURED_TABLE"])
+    blocks.extend(cells + [table])
+    layout_table = _block("LAYOUT_TABLE", page, _geometry(0.1, 0.85, 0.75, 0.08), cell_lines)
+    layouts.append(layout_table)
+    blocks.extend(layouts)
+    lines = [block for block in blocks if block["BlockType"] == "LINE"]
+    blocks.insert(0, _block("PAGE", page, _geometry(0, 0, 1, 1), lines + layouts + [table]))
+    return blocks
+
+
+def synthetic_responses(pages):
+    blocks = [block for page in range(1, pages + 1) for block in synthetic_page(page)]
+    chunks = [blocks[start:start + TEXTRACT_RESULTS_PAGE_SIZE] for start in range(0, len(blocks), TEXTRACT_RESULTS_PAGE_SIZE)]
+    responses = []
+    for index, chunk in enumerate(chunks):
+        response = {"DocumentMetadata": {"Pages": pages}, "JobStatus": "SUCCEEDED", "Blocks": chunk}
+        if index + 1 < len(chunks):
+            response["NextToken"] = str(index + 1)
+        responses.append(response)
+    return responses
+
+
+def load_responses():
+    if BENCHMARK_RECORD_JOB_ID:
+        responses = record(BENCHMARK_RECORD_JOB_ID)
+        with open(BENCHMARK_FIXTURE or f"{BENCHMARK_RECORD_JOB_ID}.json", "w") as f:
+            json.dump(responses, f)
+        return responses, f"recorded job {BENCHMARK_RECORD_JOB_ID}"
+    if BENCHMARK_FIXTURE:
+        with open(BENCHMARK_FIXTURE) as f:
+            return json.load(f), f"fixture {BENCHMARK_FIXTURE}"
+    return synthetic_responses(BENCHMARK_PAGES), f"synthetic {BENCHMARK_PAGES}-page response"
+
+
+def serial_get_document(textract_client, job_id):
+    """The previous get_document: the whole document is fetched and parsed, then each page linearized."""
+    lazy_doc = LazyDocument(job_id=job_id, textract_client=textract_client, api=TextractAPI.ANALYZE)
+    pages, all_text = [], ""
+    for page in lazy_doc.pages:
+        page_text = page.get_text(config=LINEARIZATION_CONFIG)
+        all_text += "<page>" + page_text + "</page>"
+        pages.append(page_text)
+    return pages
+
+
+def pipelined_get_document(textract_client, job_id, workers):
+    extraction = Extraction(region_name=BENCHMARK_REGION, linearize_workers=workers)
+    extraction.textract_client = textract_client
+    try:
+        # The pool is started outside the timing, as it is once per task in the service
+        first_page = [block for block in textract_client.responses[0]["Blocks"] if block.get("Page", 1) == 1]
+        extraction._linearize(first_page).result()
+        start = time.perf_counter()
+        document = extraction.get_document(job_id, "benchmark.pdf")
+        pages = [page_text for page_text, _ in document.pages]
+        return pages, time.perf_counter() - start
+    finally:
+        extraction.close()
+
+
+def page_latencies(responses):
+    """Linearization time of each page on its own, in ms."""
+    by_page = {}
+    for response in responses:
+        for block in response["Blocks"]:
+            by_page.setdefault(block.get("Page", 1), []).append(block)
+    timings = []
+    for blocks in by_page.values():
+        start = time.perf_counter()
+        linearize_page(blocks)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, seconds, pages, calls):
+    print(f"{name:<22} total={seconds * 1000:10.1f} ms  per page={seconds * 1000 / pages:8.2f} ms  API calls={calls}")
+
+
+if __name__ == "__main__":
+    responses, source = load_responses()
+    pages = len({block.get("Page", 1) for response in responses for block in response["Blocks"]})
+    print(f"{source}: {pages} pages, {sum(len(r['Blocks']) for r in responses)} blocks, "
+          f"{len(responses)} result pages, {BENCHMARK_LATENCY_MS:.0f} ms per API call")
+
+    client = ReplayTextractClient(responses)
+    start = time.perf_counter()
+    serial_pages = serial_get_document(client, "benchmark")
+    report("serial (previous)", time.perf_counter() - start, pages, client.calls)
+
+    for workers in sorted({1, BENCHMARK_WORKERS}):
+        client = ReplayTextractClient(responses)
+        pipelined_pages, seconds = pipelined_get_document(client, "benchmark", workers)
+        report(f"pipelined, {workers} worker{'s' if workers > 1 else ''}", seconds, pages, client.calls)
+        if pipelined_pages != serial_pages:
+            print(f"  output differs from the serial path on {sum(a != b for a, b in zip(serial_pages, pipelined_pages))} pages")
+
+    timings = page_latencies(responses)
+    ordered = sorted(timings)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    print(f"per-page linearization mean={statistics.mean(timings):8.2f} ms  median={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
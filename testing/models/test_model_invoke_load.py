@@ -0,0 +1,86 @@
+###############################################
+# Load test for the Model Invocation Service's invocation path.
+# It runs the FastAPI app in process with a stub Bedrock client that sleeps for a fixed
+# latency per call, then fires batches of concurrent /model/invoke requests and reports
+# throughput. With non-blocking handlers, throughput should grow with concurrency up to
+# the per-model limit instead of staying at one request per BEDROCK_LATENCY.
+# Run with: pytest -s testing/models/test_model_invoke_load.py
+###############################################
+
+import asyncio
+import os
+import sys
+import time
+import pytest
+import httpx
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "services", "foundations_model_invocation")
+sys.path.insert(0, os.path.abspath(SERVICE_DIR))
+
+import app as model_app
+from invocation_executor import ModelInvocationExecutor
+
+BEDROCK_LATENCY = 0.2  # seconds per stub Bedrock call
+MODEL_LIMIT = 16
+CONCURRENCY_LEVELS = [1, 4, 16]
+
+converse_request_data = {
+    "model_name": "ANTHROPIC_CLAUDE_3_HAIKU_V1",
+    "prompt": [{"role": "user", "content": [{"text": "Hello, how are you?"}]}],
+    "max_tokens": 100
+}
+
+
+class StubBedrockClient:
+    def converse(self, **kwargs):
+        time.sleep(BEDROCK_LATENCY)
+        return {
+            "output": {"message": {"content": [{"text": "I am fine."}]}},
+            "usage": {"inputTokens": 10, "outputTokens": 4}
+        }
+
+
+@pytest.fixture
+def stub_app(monkeypatch):
+    monkeypatch.setattr(model_app, "bedrock_client", StubBedrockClient())
+    monkeypatch.setattr(model_app, "save_invocation_log", lambda **kwargs: "stub-invocation-id")
+    monkeypatch.setattr(model_app, "invocation_executor", ModelInvocationExecutor(max_workers=64, default_limit=MODEL_LIMIT))
+    model_app.app.dependency_overrides[model_app.get_app_id_from_token] = lambda: "load-test-app"
+    yield model_app.app
+    model_app.app.dependency_overrides.clear()
+
+
+async def run_batch(application, concurrency):
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/model/invoke", json=converse_request_data) for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+    assert all(response.status_code == 200 for response in responses)
+    return elapsed
+
+
+def test_invoke_throughput_scales_with_concurrency(stub_app):
+    results = {}
+    for concurrency in CONCURRENCY_LEVELS:
+        elapsed = asyncio.run(run_batch(stub_app, concurrency))
+        results[concurrency] = concurrency / elapsed
+        print(f"concurrency={concurrency:3d} elapsed={elapsed:.2f}s throughput={results[concurrency]:.1f} req/s")
+
+    # Serialized handlers would take concurrency * BEDROCK_LATENCY for each batch.
+    highest = CONCURRENCY_LEVELS[-1]
+    assert results[highest] > results[1] * (highest / 2)
+
+
+def test_invoke_respects_per_model_limit(stub_app, monkeypatch):
+    limited_executor = ModelInvocationExecutor(max_workers=64, default_limit=2)
+    monkeypatch.setattr(model_app, "invocation_executor", limited_executor)
+
+    elapsed = asyncio.run(run_batch(stub_app, 8))
+    print(f"limit=2 concurrency=8 elapsed={elapsed:.2f}s")
+
+    # 8 requests through 2 slots need at least 4 rounds of BEDROCK_LATENCY.
+    assert elapsed >= 4 * BEDROCK_LATENCY * 0.9
+    assert limited_executor.metrics()["models"]["ANTHROPIC_CLAUDE_3_HAIKU_V1"]["completed"] == 8
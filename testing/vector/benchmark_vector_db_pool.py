@@ -0,0 +1,77 @@
+###############################################
+# Benchmark for the vector DB client pool used by the Vectorization Service.
+# It compares building a new OpenSearchVectorDB for every search (the old get_vector_db)
+# with checking one out of the VectorDBPool.
+#
+# Without BENCHMARK_HOST the benchmark only measures client construction: boto3 session,
+# credential lookup, SigV4 auth, Bedrock embeddings client and OpenSearch clients. Dummy
+# credentials are used and no network calls are made.
+#
+# With BENCHMARK_HOST (an AOSS collection endpoint) and BENCHMARK_INDEX set, each iteration
+# also runs a real search, so the numbers include TLS setup on fresh clients.
+#
+# Run with: python testing/vector/benchmark_vector_db_pool.py
+###############################################
+
+import os
+import sys
+import time
+import statistics
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "services", "foundations_vectorization")
+sys.path.insert(0, os.path.abspath(SERVICE_DIR))
+
+BENCHMARK_HOST = os.getenv("BENCHMARK_HOST")
+BENCHMARK_INDEX = os.getenv("BENCHMARK_INDEX", "benchmark-index")
+BENCHMARK_REGION = os.getenv("BENCHMARK_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+BENCHMARK_QUERY = os.getenv("BENCHMARK_QUERY", "what is AWS?")
+ITERATIONS = int(os.getenv("BENCHMARK_ITERATIONS", "50"))
+
+if not BENCHMARK_HOST:
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", BENCHMARK_REGION)
+
+from utils.opensearchutil import OpenSearchVectorDB
+from utils.vector_db_pool import VectorDBPool
+
+host = BENCHMARK_HOST or f"https://benchmark.{BENCHMARK_REGION}.aoss.amazonaws.com"
+
+
+def create_vector_db(host, index_name, region):
+    return OpenSearchVectorDB(host=host, index_name=index_name, region=region)
+
+
+def search(get_vector_db):
+    vector_db = get_vector_db(host, BENCHMARK_INDEX, BENCHMARK_REGION)
+    if BENCHMARK_HOST:
+        vector_db.similarity_search(BENCHMARK_QUERY)
+
+
+def measure(get_vector_db):
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        search(get_vector_db)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    ordered = sorted(timings)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{name:<10} mean={statistics.mean(timings):8.2f} ms  median={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+
+
+if __name__ == "__main__":
+    mode = "search" if BENCHMARK_HOST else "client setup only"
+    print(f"{ITERATIONS} iterations against {host} ({mode})")
+
+    unpooled = measure(create_vector_db)
+    pool = VectorDBPool(create_vector_db)
+    pooled = measure(pool.get)
+
+    report("unpooled", unpooled)
+    report("pooled", pooled)
+    print(f"per-search overhead saved: {statistics.mean(unpooled) - statistics.mean(pooled):.2f} ms")
+    print(f"pool stats: {pool.stats()}")
@@ -0,0 +1,171 @@
+###############################################
+# Tests for the streaming bulk ingestion of the Vector Job Process Service.
+# A fake OpenSearch client assigns its own _id to every document, as AOSS vector
+# collections do, and rejects chosen documents with 429 so they are retried. The
+# tests check that every result is attributed to the document it belongs to, and
+# that a file whose vectorization fails partway leaves no untracked documents.
+# No AWS or OpenSearch access is needed.
+#
+# Run with: python -m pytest testing/vector/test_bulk_ingest.py
+###############################################
+
+import os
+import sys
+import json
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "services", "foundations_vector_job_process")
+sys.path.insert(0, os.path.abspath(SERVICE_DIR))
+
+import pytest
+from opensearchpy.serializer import JSONSerializer
+
+from utils.bulk_ingest import BulkIngestError, stream_embed_and_index, bulk_delete
+from utils.index_manifest import IndexManifest
+from utils.vectorize import ChunkVectorDB
+
+
+class FakeTransport:
+    serializer = JSONSerializer()
+
+
+class FakeOpenSearch:
+    """Stores documents under _ids it assigns and answers 429 for the ids in throttle, rejections times each."""
+
+    transport = FakeTransport()
+
+    def __init__(self, throttle=None, reject=None, rejections=1):
+        self.throttle = {doc_id: rejections for doc_id in (throttle or ())}
+        self.reject = set(reject or ())
+        self.deletes_fail = False
+        self.documents = {}
+        self.requests = 0
+        self.next_id = 0
+
+    def bulk(self, body):
+        self.requests += 1
+        lines = iter(json.loads(line) for line in body.splitlines())
+        items = []
+        for operation in lines:
+            if "delete" in operation and self.deletes_fail:
+                items.append({"delete": {"_id": operation["delete"]["_id"], "status": 503, "error": "unavailable"}})
+                continue
+            if "delete" in operation:
+                found = self.documents.pop(operation["delete"]["_id"], None) is not None
+                items.append({"delete": {"_id": operation["delete"]["_id"], "status": 200 if found else 404}})
+                continue
+            doc_id = next(lines)["id"]
+            if self.throttle.get(doc_id):
+                self.throttle[doc_id] -= 1
+                items.append({"index": {"status": 429, "error": {"type": "es_rejected_execution_exception"}}})
+            elif doc_id in self.reject:
+                items.append({"index": {"status": 400, "error": {"type": "mapper_parsing_exception", "reason": doc_id}}})
+            else:
+                self.next_id += 1
+                self.documents[f"os-{self.next_id}"] = doc_id
+                items.append({"index": {"_id": f"os-{self.next_id}", "status": 201}})
+        return {"errors": any(next(iter(item.values()))["status"] >= 300 for item in items), "items": items}
+
+
+class FakeEmbeddings:
+    model_id = "fake-model"
+    dimensions = None
+
+    def __init__(self, fail_on_call=None):
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("embedding batch failed")
+        return [[float(len(text))] for text in texts]
+
+
+class FakeVectorDB(ChunkVectorDB):
+    def __init__(self, client, embeddings):
+        self.client = client
+        self.embeddings = embeddings
+
+    def index_documents(self, texts, metadatas, ids=None):
+        return stream_embed_and_index(self.client, "index", texts, self.embeddings, metadatas=metadatas, ids=ids,
+                                      embed_batch_size=2, initial_backoff=0)
+
+    def delete_documents(self, ids):
+        return bulk_delete(self.client, "index", ids)
+
+
+def ingest(client, ids, **kwargs):
+    return stream_embed_and_index(client, "index", (f"text {doc_id}" for doc_id in ids), FakeEmbeddings(),
+                                  metadatas=({} for _ in ids), ids=iter(ids), initial_backoff=0, **kwargs)
+
+
+@pytest.mark.parametrize("bulk_threads", [1, 3])
+def test_throttled_documents_keep_their_ids(bulk_threads):
+    ids = [f"doc{n}" for n in range(10)]
+    client = FakeOpenSearch(throttle=["doc0", "doc4", "doc5"])
+    report = ingest(client, ids, embed_batch_size=3, bulk_size=4, bulk_threads=bulk_threads)
+
+    assert report.failed == 0 and report.indexed == 10
+    assert {client.documents[_id]: doc_id for doc_id, _id in report.document_ids.items()} == {doc_id: doc_id for doc_id in ids}
+
+
+def test_failures_are_reported_with_their_batch():
+    ids = ["A", "B", "C", "D", "E", "F"]
+    client = FakeOpenSearch(throttle=["A"], reject=["E"])
+    report = ingest(client, ids, embed_batch_size=2, bulk_size=6)
+
+    assert sorted(client.documents[_id] for _id in report.document_ids.values()) == ["A", "B", "C", "D", "F"]
+    assert [(batch["batch"], batch["failed"]) for batch in report.to_dict()["failed_batches"]] == [(2, 1)]
+    assert "E" in report.failed_batches[2]["errors"][0]
+
+
+def test_throttling_past_the_retries_fails_the_document():
+    client = FakeOpenSearch(throttle=["B"], rejections=3)
+    report = ingest(client, ["A", "B", "C"], max_retries=2)
+
+    assert sorted(report.document_ids) == ["A", "C"]
+    assert report.failed_batches[0]["failed"] == 1
+    assert client.requests == 3
+
+
+def test_embedding_failure_reports_the_documents_already_indexed():
+    client = FakeOpenSearch()
+    with pytest.raises(BulkIngestError) as raised:
+        stream_embed_and_index(client, "index", (f"text {n}" for n in range(6)), FakeEmbeddings(fail_on_call=2),
+                               ids=iter(["A", "B", "C", "D", "E", "F"]), embed_batch_size=2, initial_backoff=0)
+
+    assert sorted(raised.value.report.document_ids) == ["A", "B"]
+    assert len(client.documents) == 2
+
+
+def test_rerun_after_a_failed_run_leaves_one_document_per_chunk():
+    chunks = json.dumps([{"chunk": f"chunk {n}"} for n in range(6)])
+    client = FakeOpenSearch()
+    manifest = IndexManifest("index-id", "app/job/file.pdf")
+
+    with pytest.raises(Exception):
+        FakeVectorDB(client, FakeEmbeddings(fail_on_call=3)).vectorize_and_store(chunks, manifest=manifest)
+    assert len(manifest.documents) == len(client.documents) == 4
+
+    FakeVectorDB(client, FakeEmbeddings()).vectorize_and_store(chunks, manifest=manifest)
+    assert len(manifest.documents) == len(client.documents) == 6
+    assert {entry["_id"] for entry in manifest.documents.values()} == set(client.documents)
+
+
+def test_stale_documents_that_cannot_be_deleted_are_retried_by_the_next_run():
+    client = FakeOpenSearch()
+    manifest = IndexManifest("index-id", "app/job/file.pdf")
+    FakeVectorDB(client, FakeEmbeddings()).vectorize_and_store(json.dumps([{"chunk": "a"}, {"chunk": "b"}]), manifest=manifest)
+    indexed_ids = {entry["_id"] for entry in manifest.documents.values()}
+
+    client.deletes_fail = True
+    result = FakeVectorDB(client, FakeEmbeddings()).vectorize_and_store(json.dumps([{"chunk": "a"}]), manifest=manifest,
+                                                                        incremental=True)
+    assert result["delete_failed"] == 1 and len(manifest.documents) == 1
+    assert manifest.pending_deletes == list(indexed_ids - {entry["_id"] for entry in manifest.documents.values()})
+
+    client.deletes_fail = False
+    FakeVectorDB(client, FakeEmbeddings()).vectorize_and_store(json.dumps([{"chunk": "a"}]), manifest=manifest,
+                                                               incremental=True)
+    assert manifest.pending_deletes == []
+    assert set(client.documents) == {entry["_id"] for entry in manifest.documents.values()}